@@ -0,0 +1,120 @@
+import os
+import sqlite3
+from time import time
+from datetime import datetime, timezone
+from sqlalchemy import Engine
+from sqlalchemy.pool import NullPool
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import scoped_session, sessionmaker
+from api.database import session, create_db_engine
+
+
+# statistics and exports read through their own engine, so long scans never
+# hold connections from the writers' pool and can never write
+analytics = scoped_session(sessionmaker(
+    autocommit=False,
+    autoflush=False))
+# copy of the database analytics reads, None when it reads the live file
+snapshot_path: str | None = None
+# the writer's journal_mode and synchronous pragmas need write access
+READER_PRAGMAS = ("cache_size", "mmap_size", "temp_store")
+
+
+def database_path(url) -> str | None:
+    # file behind a SQLite url, None for in-memory databases
+    if url.database in (None, "", ":memory:"):
+        return None
+    return os.path.abspath(url.database)
+
+
+def create_analytics_engine(config) -> Engine | None:
+    # None when analytics has to share the primary engine
+    url = make_url(config.get("ANALYTICS_DATABASE_URL") or config["DATABASE_URL"])
+    if url.get_backend_name() != "sqlite":
+        # ANALYTICS_DATABASE_URL may point at a read replica
+        engine = create_db_engine({**config, "DATABASE_URL": url})
+        if url.get_backend_name() == "postgresql":
+            engine = engine.execution_options(postgresql_readonly=True)
+        return engine
+
+    reader = {
+        **config,
+        "SQLITE_PRAGMAS": {
+            name: value for name, value in config["SQLITE_PRAGMAS"].items() if name in READER_PRAGMAS},
+    }
+    if config.get("ANALYTICS_SNAPSHOT"):
+        # nothing writes a snapshot in place, refreshes replace the file, so
+        # it is opened without locking and reopened on every checkout
+        return create_db_engine({
+            **reader,
+            "DATABASE_URL": url.set(
+                database=f"file:{os.path.abspath(config['ANALYTICS_SNAPSHOT'])}",
+                query={"mode": "ro", "immutable": "1", "uri": "true"}),
+            "DATABASE_ENGINE_OPTIONS": {"poolclass": NullPool},
+        })
+    if (path := database_path(url)) is None:
+        return None
+    # read-only connections to the live file, under WAL readers and the
+    # writer never wait on each other
+    return create_db_engine({
+        **reader,
+        "DATABASE_URL": url.set(database=f"file:{path}", query={"mode": "ro", "uri": "true"}),
+    })
+
+
+def refresh_snapshot(path: str):
+    # copy the live database with the SQLite backup API into a new file and
+    # swap it in, connections to the previous copy finish on the old file
+    temporary = f"{path}.{os.getpid()}.tmp"
+    source = session.get_bind().raw_connection()
+    try:
+        target = sqlite3.connect(temporary)
+        try:
+            source.driver_connection.backup(target)
+            # readers open the copy read-only, it must not need a -wal file
+            target.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            target.close()
+    finally:
+        source.close()
+    os.replace(temporary, path)
+
+
+def snapshot_age() -> float | None:
+    if snapshot_path is None or not os.path.exists(snapshot_path):
+        return None
+    return time() - os.path.getmtime(snapshot_path)
+
+
+def refresh_stale_snapshot(max_age: float) -> bool:
+    if snapshot_path is None:
+        return False
+    if (age := snapshot_age()) is not None and age < max_age:
+        return False
+    refresh_snapshot(snapshot_path)
+    return True
+
+
+def analytics_as_of() -> datetime | None:
+    # when the data analytics reads was copied, None when it reads live data
+    if snapshot_path is None or not os.path.exists(snapshot_path):
+        return None
+    return datetime.fromtimestamp(os.path.getmtime(snapshot_path), timezone.utc)
+
+
+def with_staleness(response):
+    # seconds the analytics data lags behind the live database
+    response.headers["X-Data-Staleness"] = str(int(snapshot_age() or 0))
+    return response
+
+
+def init_analytics(app):
+    global snapshot_path
+
+    url = make_url(app.config.get("ANALYTICS_DATABASE_URL") or app.config["DATABASE_URL"])
+    if app.config.get("ANALYTICS_SNAPSHOT") and url.get_backend_name() == "sqlite":
+        snapshot_path = os.path.abspath(app.config["ANALYTICS_SNAPSHOT"])
+        refresh_stale_snapshot(app.config["ANALYTICS_SNAPSHOT_INTERVAL"])
+    engine = create_analytics_engine(app.config)
+    analytics.configure(bind=engine or session.get_bind())
+    app.teardown_appcontext(lambda _: analytics.close())
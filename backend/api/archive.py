@@ -0,0 +1,46 @@
+from datetime import date
+from sqlalchemy import select, insert, delete
+from api.database import session
+from api.catalog import SCORES, bump_catalog_version, bump_data_version
+from api.statistics import subject_month_keys, recompute_subject_stats
+from api.search import unindex_quizzes
+from api.models import (
+    Quiz, Question, Option, Score, quiz_archive, question_archive, option_archive, score_archive)
+
+
+def delete_quizzes(*quiz_ids: int):
+    # one statement, the foreign key cascades remove questions, options,
+    # scores and attempts; only the aggregates those scores were folded
+    # into are rebuilt; the caller commits
+    unindex_quizzes(*quiz_ids)
+    keys = subject_month_keys(*quiz_ids)
+    session.execute(delete(Quiz).where(Quiz.id.in_(quiz_ids)))
+    recompute_subject_stats(keys)
+    bump_catalog_version()
+    bump_data_version(SCORES)
+
+
+def archive_rows(archive, model, where):
+    columns = [column.name for column in model.__table__.columns]
+    session.execute(insert(archive).from_select(
+        columns, select(*model.__table__.columns).where(where)))
+
+
+def archive_quizzes(before: date, limit: int) -> int:
+    # copy up to `limit` quizzes held before `before`, with everything under
+    # them, into the archive tables and delete them in the same transaction;
+    # returns the number of quizzes moved
+    quiz_ids = session.execute(
+        select(Quiz.id).where(Quiz.date_of_quiz < before).order_by(Quiz.id).limit(limit)
+    ).scalars().all()
+    if not quiz_ids:
+        session.rollback()
+        return 0
+    archive_rows(quiz_archive, Quiz, Quiz.id.in_(quiz_ids))
+    archive_rows(question_archive, Question, Question.quiz_id.in_(quiz_ids))
+    archive_rows(option_archive, Option, Option.question_id.in_(
+        select(Question.id).where(Question.quiz_id.in_(quiz_ids))))
+    archive_rows(score_archive, Score, Score.quiz_id.in_(quiz_ids))
+    delete_quizzes(*quiz_ids)
+    session.commit()
+    return len(quiz_ids)
@@ -0,0 +1,50 @@
+import os
+import re
+import mimetypes
+from werkzeug.security import safe_join
+from flask import Blueprint, request, send_from_directory, current_app
+
+
+assets = Blueprint('assets', __name__)
+
+# written next to the originals by frontend/build_frontend.sh, best first
+PRECOMPRESSED = (("br", ".br"), ("gzip", ".gz"))
+# vite bundles carry a content hash and charts are named by their spec
+# digest, so a given url always maps to the same bytes
+IMMUTABLE = re.compile(r"^(assets/.+-[\w-]{8,}|images/\w+-[0-9a-f]{32})\.\w+$")
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def send_static(filename: str):
+    directory = os.path.join(current_app.root_path, current_app.config["STATIC_DIRECTORY"])
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    encoding = None
+    for name, suffix in PRECOMPRESSED:
+        path = safe_join(directory, filename + suffix)
+        if request.accept_encodings.quality(name) > 0 and path and os.path.isfile(path):
+            encoding, filename = name, filename + suffix
+            break
+
+    # send_file answers If-None-Match / If-Modified-Since and ranges itself
+    response = send_from_directory(directory, filename, mimetype=mimetype)
+    response.vary.add("Accept-Encoding")
+    if encoding is not None:
+        response.content_encoding = encoding
+    if IMMUTABLE.match(filename.removesuffix(".br").removesuffix(".gz")):
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+
+@assets.route('/', methods=('GET',))
+def index():
+    return send_static('index.html')
+
+
+@assets.route('/static/<path:filename>', methods=('GET',))
+def static(filename):
+    return send_static(filename)
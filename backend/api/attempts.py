@@ -0,0 +1,208 @@
+import json
+from time import monotonic
+from threading import Lock
+from datetime import datetime, timedelta, timezone
+from flask import current_app
+from sqlalchemy import select, update, bindparam
+from sqlalchemy.exc import IntegrityError
+from api import cache
+from api.database import session
+from api.models import Attempt, Quiz, Score
+from api.grading import get_answer_key, grade, score_columns
+
+
+class AttemptClosed(Exception):
+    pass
+
+
+def utcnow() -> datetime:
+    # naive UTC, as stored by SQLite
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class AutosaveBuffer:
+    # latest answers of every attempt not yet written to the database, a
+    # later save of the same attempt replaces the earlier one so each flush
+    # writes at most one row per attempt; kept in a redis hash so any worker
+    # can read and flush it, see init_attempts for the case without redis
+    key = "attempt_autosaves"
+
+    def __init__(self, batch_size: int, interval: float):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.lock = Lock()
+        self.pending: dict[int, str] = {}
+        self.last_flush = monotonic()
+
+    def put(self, attempt_id: int, answers: dict, saved_at: datetime):
+        entry = json.dumps({"answers": answers, "saved_at": saved_at.isoformat()})
+        if cache.client is not None:
+            cache.client.hset(self.key, attempt_id, entry)
+            return
+        with self.lock:
+            self.pending[attempt_id] = entry
+
+    def get(self, attempt_id: int) -> dict | None:
+        if cache.client is not None:
+            entry = cache.client.hget(self.key, attempt_id)
+        else:
+            entry = self.pending.get(attempt_id)
+        return json.loads(entry) if entry is not None else None
+
+    def take(self, attempt_id: int | None = None) -> dict[int, dict]:
+        # remove and return one or all pending entries
+        if cache.client is not None:
+            pipe = cache.client.pipeline()
+            if attempt_id is None:
+                pipe.hgetall(self.key).delete(self.key)
+                entries = pipe.execute()[0]
+            else:
+                pipe.hget(self.key, attempt_id).hdel(self.key, attempt_id)
+                entry = pipe.execute()[0]
+                entries = {attempt_id: entry} if entry is not None else {}
+        else:
+            with self.lock:
+                if attempt_id is None:
+                    entries, self.pending = self.pending, {}
+                    self.last_flush = monotonic()
+                else:
+                    entry = self.pending.pop(attempt_id, None)
+                    entries = {attempt_id: entry} if entry is not None else {}
+        return {int(key): json.loads(value) for key, value in entries.items()}
+
+    def due(self) -> bool:
+        if cache.client is not None:
+            # redis entries are flushed by the periodic flush_autosaves task
+            return cache.client.hlen(self.key) >= self.batch_size
+        return bool(self.pending) and (
+            len(self.pending) >= self.batch_size
+            or monotonic() - self.last_flush >= self.interval)
+
+
+def init_attempts(app):
+    if cache.client is None:
+        # a buffer in this process is invisible to the worker that grades
+        # the attempt, write every save through instead
+        app.extensions["autosaves"] = AutosaveBuffer(1, 0)
+    else:
+        app.extensions["autosaves"] = AutosaveBuffer(
+            app.config["AUTOSAVE_BATCH_SIZE"], app.config["AUTOSAVE_FLUSH_INTERVAL"])
+
+
+def autosaves() -> AutosaveBuffer:
+    return current_app.extensions["autosaves"]
+
+
+def flush_autosaves() -> int:
+    # write every buffered autosave in one transaction, returns the row count
+    entries = autosaves().take()
+    if not entries:
+        return 0
+    session.execute(
+        update(Attempt.__table__)
+        .where(Attempt.id == bindparam("attempt_id"), Attempt.finished_at.is_(None))
+        .values(answers=bindparam("answers"), saved_at=bindparam("saved_at")),
+        [
+            {
+                "attempt_id": attempt_id,
+                "answers": json.dumps(entry["answers"]),
+                "saved_at": datetime.fromisoformat(entry["saved_at"]),
+            }
+            for attempt_id, entry in entries.items()
+        ])
+    session.commit()
+    return len(entries)
+
+
+
+def get_attempt(attempt_id: int, user_id: int) -> Attempt | None:
+    return session.execute(select(Attempt).where(
+        Attempt.id == attempt_id, Attempt.user_id == user_id)).scalar()
+
+
+def time_limit(quiz_id: int) -> timedelta | None:
+    # zero for quizzes without a time limit, None if there is no such quiz
+    duration = session.execute(
+        select(Quiz.hours, Quiz.minutes).where(Quiz.id == quiz_id)).first()
+    if duration is None:
+        return None
+    return timedelta(hours=duration.hours, minutes=duration.minutes)
+
+
+def start_attempt(user_id: int, quiz_id: int) -> Attempt | None:
+    # returns the user's attempt at the quiz, starting the clock on first call
+    attempt = session.execute(select(Attempt).where(
+        Attempt.user_id == user_id, Attempt.quiz_id == quiz_id)).scalar()
+    if attempt is not None:
+        return attempt
+    if (limit := time_limit(quiz_id)) is None:
+        return None
+
+    now = utcnow()
+    attempt = Attempt(user_id=user_id, quiz_id=quiz_id, started_at=now,
+                      deadline=now + limit if limit else None)
+    session.add(attempt)
+    try:
+        session.commit()
+    except IntegrityError:
+        # a concurrent request started it first
+        session.rollback()
+        attempt = session.execute(select(Attempt).where(
+            Attempt.user_id == user_id, Attempt.quiz_id == quiz_id)).scalar()
+    return attempt
+
+
+def is_open(attempt: Attempt, now: datetime) -> bool:
+    grace = timedelta(seconds=current_app.config["ATTEMPT_GRACE_SECONDS"])
+    return attempt.finished_at is None and (
+        attempt.deadline is None or now <= attempt.deadline + grace)
+
+
+def current_answers(attempt: Attempt) -> dict:
+    if (entry := autosaves().get(attempt.id)) is not None:
+        return entry["answers"]
+    return json.loads(attempt.answers)
+
+
+def remaining_seconds(attempt: Attempt) -> float | None:
+    if attempt.deadline is None:
+        return None
+    return max(0.0, (attempt.deadline - utcnow()).total_seconds())
+
+
+def save_answers(attempt: Attempt, answers: dict):
+    now = utcnow()
+    if not is_open(attempt, now):
+        raise AttemptClosed()
+    autosaves().put(attempt.id, answers, now)
+    if autosaves().due():
+        flush_autosaves()
+
+
+def final_answers(attempt: Attempt, answers: dict | None = None) -> dict:
+    # answers sent after the deadline are ignored in favour of the last
+    # autosave made in time
+    if attempt.finished_at is not None:
+        raise AttemptClosed()
+    entry = autosaves().take(attempt.id).get(attempt.id)
+    if answers is None or not is_open(attempt, utcnow()):
+        answers = entry["answers"] if entry is not None else json.loads(attempt.answers)
+    return answers
+
+
+def finish_attempt(attempt: Attempt, answers: dict | None = None,
+                   submission_key: str | None = None) -> Score:
+    answers = final_answers(attempt, answers)
+    now = utcnow()
+    answer_key = get_answer_key(attempt.quiz_id)
+    columns = score_columns(attempt.quiz_id).get(attempt.quiz_id)
+    if answer_key is None or columns is None:
+        raise AttemptClosed()
+    score = Score(user_id=attempt.user_id, quiz_id=attempt.quiz_id,
+                  user_score=grade(answer_key, answers),
+                  total_score=len(answer_key), submission_key=submission_key, **columns)
+    session.add(score)
+    attempt.answers = json.dumps(answers)
+    attempt.saved_at = attempt.finished_at = now
+    session.commit()
+    return score
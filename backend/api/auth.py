@@ -0,0 +1,106 @@
+import atexit
+import logging
+import multiprocessing
+from time import perf_counter
+from threading import Lock
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+from api.metrics import metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+class Overloaded(Exception):
+    # too many password hashes are already queued, the caller should retry
+    pass
+
+
+class PasswordHasher:
+    # password hashing is CPU bound by design, it runs in a pool of worker
+    # processes so a burst of logins cannot hold every request thread and
+    # the GIL, or in the calling thread when there are no workers; at most
+    # `max_pending` hashes are queued or running at once, the rest are
+    # turned away instead of waiting behind them
+    def __init__(self, workers: int = 0, max_pending: int = 0, timeout: float | None = None):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.pending = 0
+        self.lock = Lock()
+        self.pool = None
+
+    def executor(self) -> ProcessPoolExecutor | None:
+        # started by the first hash, so processes that never check a password,
+        # like the celery workers, never start one; the workers are forked
+        # by a forkserver, forking this process once it runs request threads
+        # could copy a lock another thread holds
+        if not self.workers:
+            return None
+        with self.lock:
+            if self.pool is None:
+                self.pool = ProcessPoolExecutor(
+                    self.workers, mp_context=multiprocessing.get_context("forkserver"))
+                atexit.register(self.pool.shutdown, cancel_futures=True)
+            return self.pool
+
+    def run(self, function, *args):
+        with self.lock:
+            if self.max_pending and self.pending >= self.max_pending:
+                metrics.inc("password_hash_rejected_total")
+                raise Overloaded()
+            self.pending += 1
+        start = perf_counter()
+        pool = self.executor()
+        try:
+            if pool is None:
+                return function(*args)
+            future = pool.submit(function, *args)
+            return future.result(self.timeout)
+        except TimeoutError:
+            future.cancel()
+            metrics.inc("password_hash_rejected_total")
+            raise Overloaded()
+        except BrokenProcessPool:
+            # a worker died, the next hash starts a new pool
+            logger.error("password hashing pool broke")
+            with self.lock:
+                if self.pool is pool:
+                    self.pool = None
+            raise
+        finally:
+            with self.lock:
+                self.pending -= 1
+            metrics.observe("password_hash_seconds", perf_counter() - start)
+
+    def check(self, password_hash: str, password: str) -> bool:
+        return self.run(check_password_hash, password_hash, password)
+
+    def hash(self, password: str) -> str:
+        return self.run(generate_password_hash, password)
+
+
+metrics.describe("password_hash_seconds", "histogram", "Password hash time including the wait for a worker")
+metrics.describe("password_hash_queue_depth", "gauge", "Password hashes queued or running")
+metrics.describe("password_hash_rejected_total", "counter", "Password hashes turned away by admission control")
+
+
+def init_auth(app):
+    password_hasher = app.extensions["password_hasher"] = PasswordHasher(
+        app.config["PASSWORD_HASH_WORKERS"], app.config["PASSWORD_HASH_MAX_PENDING"],
+        app.config["PASSWORD_HASH_TIMEOUT"])
+    metrics.gauge("password_hash_queue_depth", lambda: password_hasher.pending)
+
+
+def hasher() -> PasswordHasher:
+    return current_app.extensions["password_hasher"]
+
+
+def check_password(password_hash: str, password: str) -> bool:
+    return hasher().check(password_hash, password)
+
+
+def hash_password(password: str) -> str:
+    return hasher().hash(password)
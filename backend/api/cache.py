@@ -0,0 +1,98 @@
+import json
+from time import monotonic
+from threading import Lock
+from collections import OrderedDict
+
+
+# redis client shared by all caches once configured
+client = None
+
+
+class Cache:
+    registry: dict[str, "Cache"] = {}
+
+    def __init__(self, name: str, maxsize: int = 1024, ttl: float | None = None, shared: bool = True):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # shared caches move to redis when CACHE_REDIS_URL is configured,
+        # values must then be JSON serializable
+        self.shared = shared
+        self.client = client if shared else None
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+        self._entries = OrderedDict()
+        Cache.registry[name] = self
+
+    def get(self, key, default=None):
+        if self.client is not None:
+            value = self.client.get(f"{self.name}:{key}")
+            if value is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return json.loads(value)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (entry[1] is not None and entry[1] < monotonic()):
+                self._entries.pop(key, None)
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        if self.client is not None:
+            self.client.set(f"{self.name}:{key}", json.dumps(value),
+                            ex=int(self.ttl) if self.ttl else None)
+            return
+
+        with self._lock:
+            self._entries[key] = (
+                value, monotonic() + self.ttl if self.ttl else None)
+            self._entries.move_to_end(key)
+            # evict least recently used entries
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        if self.client is not None:
+            self.client.delete(f"{self.name}:{key}")
+            return
+
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        if self.client is not None:
+            for key in self.client.scan_iter(f"{self.name}:*"):
+                self.client.delete(key)
+            return
+
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0,
+            "size": len(self._entries) if self.client is None else None,
+            "backend": "local" if self.client is None else "redis",
+        }
+
+
+def init_cache(app):
+    global client
+
+    if url := app.config.get("CACHE_REDIS_URL"):
+        import redis
+
+        client = redis.Redis.from_url(url)
+        for cache in Cache.registry.values():
+            if cache.shared:
+                cache.client = client
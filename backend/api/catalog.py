@@ -0,0 +1,67 @@
+import hashlib
+from flask import request, current_app
+from sqlalchemy import select
+from api.cache import Cache
+from api.models import DataVersion
+from api.database import session, upsert
+
+
+CATALOG = "catalog"
+# bumped whenever scores are deleted, boards built from them start over
+SCORES = "scores"
+
+
+def init_catalog(app):
+    # serialized catalog responses keyed by "{catalog version}:{request path}",
+    # entries of older versions are never read again and age out of the cache
+    app.extensions["catalog_responses"] = Cache(
+        "catalog_responses", maxsize=app.config["CATALOG_CACHE_SIZE"],
+        ttl=app.config["CATALOG_CACHE_TTL"])
+
+
+def responses() -> Cache:
+    return current_app.extensions["catalog_responses"]
+
+
+def data_version(name: str) -> int:
+    return session.execute(
+        select(DataVersion.value).where(DataVersion.name == name)).scalar() or 0
+
+
+def bump_data_version(name: str):
+    # call in the transaction that makes the change so the new version is
+    # only visible together with it
+    stmt = upsert(DataVersion).values(name=name, value=1)
+    session.execute(stmt.on_conflict_do_update(
+        index_elements=["name"], set_=dict(value=DataVersion.value + 1)))
+
+
+def catalog_version() -> int:
+    return data_version(CATALOG)
+
+
+def bump_catalog_version():
+    # subjects, chapters or quizzes changed
+    bump_data_version(CATALOG)
+
+
+def digest(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()[:32]
+
+
+def cached_catalog(build, serialized: bool = True) -> dict:
+    # build() returns (payload, ids) and only runs on a miss; the returned
+    # entry holds the serialized payload as "body", or the payload itself
+    # as "payload" for callers that add to it, its etag and the ids it lists
+    key = f"{catalog_version()}:{request.full_path}"
+    if (entry := responses().get(key)) is None:
+        payload, ids = build()
+        body = current_app.json.dumps(payload)
+        entry = {"etag": digest(body), "ids": ids}
+        if serialized:
+            entry["body"] = body
+        else:
+            # as decoded JSON, dates already formatted, so it also fits redis
+            entry["payload"] = current_app.json.loads(body)
+        responses().set(key, entry)
+    return entry
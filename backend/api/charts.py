@@ -0,0 +1,130 @@
+import os
+import json
+import hashlib
+from threading import Lock
+from flask import current_app
+
+
+MONTHS = [
+    "January", "February", "March", "April", "May", "June",
+    "July", "August", "September", "October", "November", "December"
+]
+
+# serializes matplotlib use and cache eviction within a process
+render_lock = Lock()
+theme_applied = False
+
+
+def chart_filename(spec: dict) -> str:
+    # stable across processes, unlike hash(), so every worker shares the cache
+    digest = hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+    return f"{spec['kind']}-{digest[:32]}.png"
+
+
+def chart_path(filename: str) -> str:
+    return os.path.join(current_app.config["CHART_DIRECTORY"], filename)
+
+
+def rendered_filename(spec: dict) -> str | None:
+    # the chart's filename if it is on disk, not yet rendered or evicted otherwise
+    filename = chart_filename(spec)
+    return filename if os.path.exists(chart_path(filename)) else None
+
+
+def render_chart(spec: dict) -> str:
+    filename = chart_filename(spec)
+    path = chart_path(filename)
+    if os.path.exists(path):
+        # cache hit, bump the mtime used for LRU eviction
+        os.utime(path)
+        return filename
+
+    with render_lock:
+        figure = draw(spec)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        figure.savefig(temporary, format="png")
+        figure.clear()
+        os.replace(temporary, path)
+        evict(current_app.config["CHART_DIRECTORY"],
+              current_app.config["CHART_CACHE_MAX_FILES"],
+              current_app.config["CHART_CACHE_MAX_BYTES"])
+    return filename
+
+
+def draw(spec: dict):
+    global theme_applied
+
+    # the plotting stack is only imported by processes that render
+    from matplotlib.figure import Figure
+    import seaborn as sns
+
+    if not theme_applied:
+        sns.set_theme(style="whitegrid")
+        theme_applied = True
+
+    # a bare Figure on the Agg canvas is never registered with pyplot and
+    # is garbage collected once rendered
+    figure = Figure()
+    axes = figure.add_subplot()
+    if spec["kind"] == "bar":
+        axes.bar(spec["labels"], spec["values"])
+        axes.set_ylabel(spec.get("ylabel", ""))
+    elif spec["kind"] == "pie" and any(spec["values"]):
+        axes.pie(spec["values"], labels=spec["labels"], **spec.get("options", {}))
+    axes.set_xlabel(spec.get("xlabel", ""))
+    return figure
+
+
+def evict(directory: str, max_files: int, max_bytes: int):
+    # drop least recently used charts until both limits hold
+    charts = sorted(
+        (entry.stat().st_mtime, entry.stat().st_size, entry.path)
+        for entry in os.scandir(directory)
+        if entry.is_file() and entry.name.endswith(".png"))
+    count, size = len(charts), sum(chart[1] for chart in charts)
+    for _, chart_size, path in charts:
+        if count <= max_files and size <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        count, size = count - 1, size - chart_size
+
+
+def user_charts(by_subject: list[dict], by_month: list[dict]) -> tuple[dict, dict]:
+    return (
+        {
+            "kind": "bar",
+            "labels": [subject["subject"] for subject in by_subject],
+            "values": [subject["user_score"] for subject in by_subject],
+            "xlabel": "Subjects",
+            "ylabel": "Total score by subject",
+        },
+        {
+            "kind": "pie",
+            "labels": [f'{MONTHS[month["month"]-1]} ({month["attempts"]})' for month in by_month],
+            "values": [month["attempts"] for month in by_month],
+            "xlabel": "Month wise quiz attempts",
+            "options": {"labeldistance": 1.125},
+        },
+    )
+
+
+def admin_charts(by_subject: list[dict], by_month: list[dict], month: int) -> tuple[dict, dict]:
+    return (
+        {
+            "kind": "bar",
+            "labels": [subject["subject"] for subject in by_subject],
+            "values": [subject["max_score"] for subject in by_subject],
+            "xlabel": "Subjects",
+            "ylabel": "Max Score",
+        },
+        {
+            "kind": "pie",
+            "labels": [f'{subject["subject"]} ({subject["attempts"]})' for subject in by_month],
+            "values": [subject["attempts"] for subject in by_month],
+            "xlabel": MONTHS[month-1],
+            "options": {"rotatelabels": True, "labeldistance": 0.5},
+        },
+    )
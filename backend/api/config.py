@@ -1,5 +1,6 @@
 import os
 from flask import Config
+from datetime import timedelta
 from secrets import token_urlsafe
 
 
@@ -10,6 +11,97 @@ class AppConfig(Config):
     JWT_ACCESS_COOKIE_NAME = 'access_token_cookie'
     JWT_ACCESS_CSRF_HEADER_NAME = 'X-CSRF-TOKEN'
     JWT_ACCESS_CSRF_FIELD_NAME = 'csrf_access_token'
+    # short lived access tokens are renewed with the refresh token, which
+    # is only ever sent to the refresh endpoint
+    JWT_ACCESS_TOKEN_EXPIRES = timedelta(minutes=15)
+    JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=7)
+    JWT_REFRESH_COOKIE_PATH = '/api/token/refresh'
+    # any SQLAlchemy URL, e.g. postgresql://... to scale out past SQLite
+    DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///quiz-master.db")
+    DATABASE_ENGINE_OPTIONS = {
+        "pool_size": 10,
+        "max_overflow": 20,
+        "pool_pre_ping": True,
+    }
+    # seconds a connection waits on a locked database before failing
+    SQLITE_BUSY_TIMEOUT = 30
+    SQLITE_PRAGMAS = {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -64000,
+        "mmap_size": 268435456,
+        "temp_store": "MEMORY",
+        # SQLite ignores ON DELETE CASCADE and leaves orphans without it
+        "foreign_keys": "ON",
+    }
+    # password hashes run in PASSWORD_HASH_WORKERS processes per web worker,
+    # 0 hashes in the request thread; by default the cores are split between
+    # the WEB_CONCURRENCY web workers. Logins past PASSWORD_HASH_MAX_PENDING
+    # queued hashes or waiting longer than PASSWORD_HASH_TIMEOUT seconds are
+    # answered with 503
+    PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS") or max(
+        1, (os.cpu_count() or 1) // int(os.environ.get("WEB_CONCURRENCY", 1))))
+    PASSWORD_HASH_MAX_PENDING = 64
+    PASSWORD_HASH_TIMEOUT = 10
+    IDENTITY_CACHE_TTL = 60
+    IDENTITY_CACHE_SIZE = 4096
+    # profile every request and keep the slowest PROFILE_SLOWEST of them
+    PROFILE_REQUESTS = os.environ.get("PROFILE_REQUESTS") == "1"
+    PROFILE_SLOWEST = 20
+    # with CACHE_REDIS_URL every process publishes its counters at most every
+    # METRICS_PUBLISH_INTERVAL seconds and /api/admin/metrics adds up those
+    # heard from within METRICS_PROCESS_TTL; without it the numbers are the
+    # serving process's only
+    METRICS_PUBLISH_INTERVAL = 10
+    METRICS_PROCESS_TTL = 300
+    STATIC_DIRECTORY = "static"
+    # content addressed chart cache, least recently used charts are evicted
+    CHART_DIRECTORY = "static/images"
+    CHART_CACHE_MAX_FILES = 2000
+    CHART_CACHE_MAX_BYTES = 256 * 1024 * 1024
+    QUIZ_PAGE_SIZE = 50
+    QUIZ_PAGE_SIZE_MAX = 200
+    # answers submitted up to ATTEMPT_GRACE_SECONDS after the deadline are accepted
+    ATTEMPT_GRACE_SECONDS = 30
+    # with CACHE_REDIS_URL autosaves are written once AUTOSAVE_BATCH_SIZE
+    # attempts are pending or every AUTOSAVE_FLUSH_INTERVAL seconds, without
+    # it every autosave is written at once
+    AUTOSAVE_BATCH_SIZE = 500
+    AUTOSAVE_FLUSH_INTERVAL = 5
+    # acknowledge submissions at once and grade them in batches of
+    # GRADING_BATCH_SIZE, meant for exam windows where everyone submits together;
+    # the queue lives in redis, so it needs CACHE_REDIS_URL
+    GRADING_QUEUE = os.environ.get("GRADING_QUEUE") == "1"
+    GRADING_BATCH_SIZE = 200
+    GRADING_FLUSH_INTERVAL = 1
+    GRADING_STATUS_TTL = 3600
+    # a batch not acknowledged this many seconds after it was taken belonged
+    # to a worker that died, and is queued again
+    GRADING_ACK_TIMEOUT = 300
+    LEADERBOARD_SIZE_MAX = 100
+    # exports contain emails, keep them outside STATIC_DIRECTORY
+    EXPORT_DIRECTORY = "exports"
+    LEADERBOARD_SYNC_INTERVAL = 1
+    # serialized catalog responses, keyed by catalog version
+    CATALOG_CACHE_SIZE = 512
+    CATALOG_CACHE_TTL = 3600
+    # shared cache backend, caches stay in-process when unset
+    CACHE_REDIS_URL = os.environ.get("CACHE_REDIS_URL")
+    # statistics and exports read through a separate read-only connection;
+    # with ANALYTICS_SNAPSHOT set they read a copy of the database at that
+    # path instead, refreshed every ANALYTICS_SNAPSHOT_INTERVAL seconds
+    ANALYTICS_DATABASE_URL = os.environ.get("ANALYTICS_DATABASE_URL")
+    ANALYTICS_SNAPSHOT = os.environ.get("ANALYTICS_SNAPSHOT")
+    ANALYTICS_SNAPSHOT_INTERVAL = 300
+    # quizzes held more than ARCHIVE_AFTER_DAYS days ago move to the archive
+    # tables with their questions and scores, ARCHIVE_BATCH_SIZE quizzes per
+    # transaction; 0 keeps everything in place
+    ARCHIVE_AFTER_DAYS = int(os.environ.get("ARCHIVE_AFTER_DAYS", 0))
+    ARCHIVE_BATCH_SIZE = 100
+    # admin statistics lag new scores by at most STATS_REFRESH_INTERVAL seconds
+    STATS_REFRESH_INTERVAL = 60
+    STATS_JOB_TTL = 600
+    STATS_JOB_MAX_WAIT = 30
     CELERY = {
         'broker_url': 'redis://localhost',
         'result_backend': 'redis://localhost',
@@ -25,3 +117,15 @@ class LocalDevelopmentConfig(AppConfig):
 class ProductionConfig(AppConfig):
     JWT_COOKIE_SECURE = True
     JWT_COOKIE_CSRF_PROTECT = False
+
+
+class TestingConfig(LocalDevelopmentConfig):
+    TESTING = True
+    PASSWORD_HASH_WORKERS = 0
+    CELERY = {
+        'broker_url': 'memory://',
+        'result_backend': 'cache+memory://',
+        'task_ignore_result': False,
+        'task_always_eager': True,
+        'task_store_eager_result': True,
+    }
@@ -1,18 +1,55 @@
 from api.models import *
-from sqlalchemy import create_engine, select
+from api.migrations import migrate
+from sqlalchemy.engine import make_url
+from sqlalchemy.dialects import sqlite, postgresql
 from werkzeug.security import generate_password_hash
 from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy import create_engine, event, select, Engine
 
 
-engine = create_engine('sqlite:///quiz-master.db')
+# bound to the configured engine by init_db
+engine: Engine | None = None
 session = scoped_session(sessionmaker(
     autocommit=False,
-    autoflush=False,
-    bind=engine))
+    autoflush=False))
+
+
+def create_db_engine(config) -> Engine:
+    url = make_url(config["DATABASE_URL"])
+    options = dict(config["DATABASE_ENGINE_OPTIONS"])
+    if url.get_backend_name() != "sqlite":
+        return create_engine(url, **options)
+
+    # wait on locks held by other workers instead of failing immediately
+    options["connect_args"] = {
+        "timeout": config["SQLITE_BUSY_TIMEOUT"], **options.get("connect_args", {})}
+    sqlite_engine = create_engine(url, **options)
+    pragmas = config["SQLITE_PRAGMAS"]
+
+    @event.listens_for(sqlite_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, _):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    return sqlite_engine
+
+
+def upsert(model):
+    # dialect specific INSERT supporting on_conflict_do_update
+    if session.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(model)
+    return sqlite.insert(model)
 
 
 def init_db(app):
+    global engine
+
+    engine = create_db_engine(app.config)
+    session.configure(bind=engine)
     Base.metadata.create_all(bind=engine)
+    migrate(engine)
 
     with app.app_context():
         if not session.execute(select(User).where(User.email == 'admin@qm.xyz')).scalar():
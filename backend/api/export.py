@@ -0,0 +1,115 @@
+import io
+import os
+import csv
+import json
+import zlib
+from datetime import date
+from typing import Iterator
+from sqlalchemy import select
+from api.analytics import analytics
+from api.models import Score, User, Quiz, Subject, Chapter
+
+
+COLUMNS = (
+    "score_id", "user_id", "user", "email", "quiz_id", "quiz", "subject", "chapter",
+    "date_of_quiz", "user_score", "total_score", "submitted_at",
+)
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+}
+# rows fetched from the cursor per round trip, memory stays bounded by it
+BATCH_SIZE = 1000
+
+
+def export_filters(args) -> dict:
+    # request arguments to a JSON serializable filter dict, raises ValueError
+    filters = {}
+    for name in ("from", "to"):
+        if value := args.get(name):
+            filters[name] = date.fromisoformat(value).isoformat()
+    for name in ("subject_id", "quiz_id"):
+        if (value := args.get(name)) is not None:
+            filters[name] = int(value)
+    return filters
+
+
+def export_query(filters: dict):
+    query = (
+        select(
+            Score.id, User.id, User.name, User.email, Quiz.id, Quiz.name,
+            Subject.name, Chapter.name, Quiz.date_of_quiz,
+            Score.user_score, Score.total_score, Score.submitted_at)
+        .join(User, Score.user_id == User.id)
+        .join(Quiz, Score.quiz_id == Quiz.id)
+        .join(Chapter, Quiz.chapter_id == Chapter.id)
+        .join(Subject, Quiz.subject_id == Subject.id)
+        .order_by(Score.id)
+    )
+    if "from" in filters:
+        query = query.where(Quiz.date_of_quiz >= date.fromisoformat(filters["from"]))
+    if "to" in filters:
+        query = query.where(Quiz.date_of_quiz <= date.fromisoformat(filters["to"]))
+    if "subject_id" in filters:
+        query = query.where(Quiz.subject_id == filters["subject_id"])
+    if "quiz_id" in filters:
+        query = query.where(Score.quiz_id == filters["quiz_id"])
+    return query
+
+
+def export_batches(filters: dict) -> Iterator[list]:
+    # server side cursor on the analytics connection, rows are never all
+    # held in memory and a long export never delays writers
+    result = analytics.execute(export_query(filters), execution_options={"yield_per": BATCH_SIZE})
+    yield from result.partitions()
+
+
+def value(field):
+    return field.isoformat() if isinstance(field, date) else field
+
+
+def csv_chunks(batches: Iterator[list]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for batch in batches:
+        writer.writerows([value(field) for field in row] for row in batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def ndjson_chunks(batches: Iterator[list]) -> Iterator[str]:
+    for batch in batches:
+        yield "".join(
+            json.dumps(dict(zip(COLUMNS, map(value, row)))) + "\n" for row in batch)
+
+
+def gzip_chunks(chunks: Iterator[str]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        if data := compressor.compress(chunk.encode()):
+            yield data
+    yield compressor.flush()
+
+
+def export_chunks(filters: dict, format: str, compress: bool) -> Iterator[str | bytes]:
+    chunks = (csv_chunks if format == "csv" else ndjson_chunks)(export_batches(filters))
+    return gzip_chunks(chunks) if compress else chunks
+
+
+def export_filename(format: str, compress: bool) -> str:
+    return f"scores-{date.today().isoformat()}.{FORMATS[format][1]}" + (".gz" if compress else "")
+
+
+def write_export(directory: str, name: str, filters: dict, format: str, compress: bool) -> str:
+    # used by the export task, written under a temporary name and moved into
+    # place so a half written file is never served
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, name)
+    with open(f"{path}.tmp", "wb") as file:
+        for chunk in export_chunks(filters, format, compress):
+            file.write(chunk if isinstance(chunk, bytes) else chunk.encode())
+    os.replace(f"{path}.tmp", path)
+    return name
@@ -0,0 +1,252 @@
+import os
+import json
+import socket
+import logging
+from time import time
+from threading import Lock, get_ident
+from collections import deque
+from datetime import datetime, timezone
+from flask import current_app
+from sqlalchemy import select, update, bindparam
+from sqlalchemy.exc import OperationalError
+from api import cache
+from api.cache import Cache
+from api.catalog import catalog_version
+from api.models import Question, Quiz, Score, Attempt
+from api.database import session, upsert
+
+
+logger = logging.getLogger(__name__)
+
+# "{catalog version}:{quiz id}" -> {question_id: correct_option_id}, every
+# change to a quiz bumps the version so no process can read a key of an
+# edited, or deleted and reused, quiz id; question ids are kept as strings
+# to match the submitted payload and to survive JSON round trips
+answer_keys = Cache("answer_keys", maxsize=2048, ttl=3600)
+
+
+def get_answer_key(quiz_id: int, version: int | None = None) -> dict[str, int] | None:
+    # pass `version` when grading several quizzes against one catalog version
+    key = f"{catalog_version() if version is None else version}:{quiz_id}"
+    answer_key = answer_keys.get(key)
+    if answer_key is None:
+        answer_key = {
+            str(question_id): correct
+            for question_id, correct in session.execute(
+                select(Question.id, Question.correct).where(Question.quiz_id == quiz_id))
+        }
+        if not answer_key:
+            return None
+        answer_keys.set(key, answer_key)
+    return answer_key
+
+
+def score_columns(*quiz_ids: int) -> dict[int, dict]:
+    # quiz columns copied into each new score, by quiz id, one lookup for
+    # any number of quizzes; missing quizzes are left out
+    return {
+        quiz_id: dict(date_of_quiz=date_of_quiz, subject_id=subject_id)
+        for quiz_id, date_of_quiz, subject_id in session.execute(
+            select(Quiz.id, Quiz.date_of_quiz, Quiz.subject_id).where(Quiz.id.in_(quiz_ids)))
+    }
+
+
+def grade(answer_key: dict[str, int], selected: dict) -> int:
+    return sum(
+        1 for question_id, correct in answer_key.items()
+        if selected.get(question_id) == correct)
+
+
+class SubmissionQueue:
+    # submissions waiting to be graded, in arrival order, and the ones set
+    # aside because they failed on their own; redis lists, so every worker
+    # drains the same queue, the local deques are for benchmarks and tests.
+    # A taken batch moves to a processing list of the worker until ack(),
+    # batches of a worker that died before acknowledging are moved back by
+    # recover()
+    key = "grading_queue"
+    dead_letter_key = "grading_dead_letter"
+    # processing list -> time its worker last took a batch
+    processing_key = "grading_processing"
+
+    def __init__(self):
+        self.lock = Lock()
+        self.pending: deque[str] = deque()
+        self.dead: deque[str] = deque()
+
+    def put(self, entry: dict):
+        entry = json.dumps(entry)
+        if cache.client is not None:
+            cache.client.rpush(self.key, entry)
+            return
+        with self.lock:
+            self.pending.append(entry)
+
+    def processing_list(self) -> str:
+        # one per worker thread; looked up on every call, forked workers get their own
+        return f"{self.key}:{socket.gethostname()}:{os.getpid()}:{get_ident()}"
+
+    def take(self, limit: int) -> list[dict]:
+        if cache.client is not None:
+            # a batch this process never acknowledged goes back first
+            processing = self.processing_list()
+            self.requeue(processing)
+            pipe = cache.client.pipeline()
+            pipe.hset(self.processing_key, processing, time())
+            for _ in range(limit):
+                pipe.lmove(self.key, processing, "LEFT", "RIGHT")
+            entries = [entry for entry in pipe.execute()[1:] if entry is not None]
+        else:
+            with self.lock:
+                entries = [self.pending.popleft() for _ in range(min(limit, len(self.pending)))]
+        return [json.loads(entry) for entry in entries]
+
+    def ack(self):
+        # the batch taken last is written, put back or set aside
+        if cache.client is not None:
+            processing = self.processing_list()
+            cache.client.pipeline().delete(processing).hdel(self.processing_key, processing).execute()
+
+    def recover(self, timeout: float) -> int:
+        # put back, in their original order, the batches taken more than
+        # `timeout` seconds ago and never acknowledged; a worker that is only
+        # slow grades its batch twice, which the score keys make harmless
+        if cache.client is None:
+            return 0
+        recovered = 0
+        for processing, taken_at in cache.client.hgetall(self.processing_key).items():
+            if time() - float(taken_at) < timeout:
+                continue
+            recovered += self.requeue(processing)
+            cache.client.hdel(self.processing_key, processing)
+        return recovered
+
+    def requeue(self, processing: str) -> int:
+        # move a processing list back to the head of the queue, in order
+        count = 0
+        while cache.client.lmove(processing, self.key, "RIGHT", "LEFT") is not None:
+            count += 1
+        return count
+
+    def set_aside(self, entry: dict):
+        entry = json.dumps(entry)
+        if cache.client is not None:
+            cache.client.rpush(self.dead_letter_key, entry)
+            return
+        with self.lock:
+            self.dead.append(entry)
+
+    def __len__(self) -> int:
+        if cache.client is not None:
+            return cache.client.llen(self.key)
+        return len(self.pending)
+
+
+submissions = SubmissionQueue()
+
+
+def status_key(user_id: int, key: str) -> str:
+    # submission keys are chosen by clients and only unique per user
+    return f"{user_id}:{key}"
+
+
+def enqueue_submission(key: str, user_id: int, quiz_id: int, selected: dict,
+                       attempt_id: int | None = None):
+    queued().set(status_key(user_id, key), "queued")
+    submissions.put(dict(key=key, user_id=user_id, quiz_id=quiz_id,
+                         selected=selected, attempt_id=attempt_id))
+
+
+def write_scores(batch: list[dict]):
+    # grade the entries and write their scores in one transaction; entries
+    # that were not written, for a missing quiz or because the user already
+    # has a score for the quiz or the key, are marked failed
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    quizzes = score_columns(*{entry["quiz_id"] for entry in batch})
+    version = catalog_version()
+    rows, attempts = [], []
+    for entry in batch:
+        answer_key = get_answer_key(entry["quiz_id"], version)
+        if answer_key is None or entry["quiz_id"] not in quizzes:
+            continue
+        rows.append(dict(
+            user_id=entry["user_id"], quiz_id=entry["quiz_id"],
+            user_score=grade(answer_key, entry["selected"]),
+            total_score=len(answer_key), submission_key=entry["key"],
+            submitted_at=now, **quizzes[entry["quiz_id"]]))
+        if entry.get("attempt_id") is not None:
+            attempts.append(dict(attempt_id=entry["attempt_id"],
+                                 answers=json.dumps(entry["selected"]), finished_at=now))
+
+    written = set()
+    if rows:
+        written = {tuple(row) for row in session.execute(
+            upsert(Score).on_conflict_do_nothing().returning(Score.user_id, Score.submission_key),
+            rows)}
+    if attempts:
+        session.execute(
+            update(Attempt.__table__)
+            .where(Attempt.id == bindparam("attempt_id"), Attempt.finished_at.is_(None))
+            .values(answers=bindparam("answers"), saved_at=bindparam("finished_at"),
+                    finished_at=bindparam("finished_at")),
+            attempts)
+    session.commit()
+    for entry in batch:
+        if (entry["user_id"], entry["key"]) not in written:
+            # a retry of a graded key reads as graded, the score is found first
+            queued().set(status_key(entry["user_id"], entry["key"]), "failed")
+
+
+def grade_pending(limit: int) -> int:
+    # grade up to `limit` queued submissions in one transaction; when that
+    # fails they are written one by one, so one bad entry cannot hold back
+    # the rest, and the ones that still fail are set aside
+    batch = submissions.take(limit)
+    if not batch:
+        return 0
+    try:
+        write_scores(batch)
+    except OperationalError:
+        # the database is locked or unreachable, retry on the next run
+        session.rollback()
+        for entry in batch:
+            submissions.put(entry)
+        submissions.ack()
+        raise
+    except Exception:
+        session.rollback()
+        for entry in batch:
+            try:
+                write_scores([entry])
+            except Exception:
+                session.rollback()
+                logger.exception("failed to grade submission %s of user %s", entry["key"], entry["user_id"])
+                submissions.set_aside(entry)
+                queued().set(status_key(entry["user_id"], entry["key"]), "failed")
+    submissions.ack()
+    return len(batch)
+
+
+def submission_status(key: str, user_id: int) -> dict | None:
+    score = session.execute(select(Score.user_score, Score.total_score).where(
+        Score.user_id == user_id, Score.submission_key == key)).first()
+    if score is not None:
+        return {"status": "graded", "score": score.user_score, "total": score.total_score}
+    if (status := queued().get(status_key(user_id, key))) is not None:
+        return {"status": status}
+    return None
+
+
+def init_grading(app):
+    # "{user id}:{submission key}" -> "queued" or "failed" for submissions
+    # not graded yet, for status lookups
+    app.extensions["queued_submissions"] = Cache(
+        "queued_submissions", maxsize=65536, ttl=app.config["GRADING_STATUS_TTL"])
+    # the queue is drained by the periodic grade_submissions task, which
+    # runs in the celery worker and never sees a queue in this process
+    if app.config.get("GRADING_QUEUE") and cache.client is None:
+        raise RuntimeError("GRADING_QUEUE needs CACHE_REDIS_URL, the queue is kept in redis")
+
+
+def queued() -> Cache:
+    return current_app.extensions["queued_submissions"]
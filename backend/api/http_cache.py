@@ -0,0 +1,37 @@
+from datetime import datetime, timezone
+from flask import request, jsonify, make_response, Response
+
+
+def not_modified(etag: str, last_modified: datetime | None = None) -> bool:
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    return (last_modified is not None and request.if_modified_since is not None
+            and request.if_modified_since >= last_modified.replace(microsecond=0))
+
+
+def conditional_json(etag: str, last_modified: datetime | None, build):
+    # build() is only called when the client's copy is stale
+    if last_modified is not None and last_modified.tzinfo is None:
+        last_modified = last_modified.replace(tzinfo=timezone.utc)
+    if not_modified(etag, last_modified):
+        response = make_response('', 304)
+    else:
+        response = jsonify(build())
+    return revalidate(response, etag, last_modified)
+
+
+def conditional_body(etag: str, body: str):
+    # body is already serialized JSON, etag must change whenever its bytes do
+    if not_modified(etag):
+        return revalidate(make_response('', 304), etag)
+    return revalidate(Response(body, mimetype='application/json'), etag)
+
+
+def revalidate(response, etag: str, last_modified: datetime | None = None):
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # clients may keep a copy but must revalidate it on every use
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
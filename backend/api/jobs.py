@@ -0,0 +1,24 @@
+from celery.result import AsyncResult
+from flask import current_app
+
+
+# tasks are referenced by name so the web process never imports api.tasks
+# and the analytics stack it pulls in; workers start from worker.py
+
+
+def celery():
+    return current_app.extensions["celery"]
+
+
+def enqueue(name: str, *args, **kwargs) -> AsyncResult:
+    app = celery()
+    if app.conf.task_always_eager:
+        # send_task bypasses eager mode, run in process as delay() would
+        import api.tasks  # noqa: F401
+
+        return app.tasks[name].apply(args, kwargs)
+    return app.send_task(name, args, kwargs)
+
+
+def job_result(job_id: str) -> AsyncResult:
+    return celery().AsyncResult(job_id)
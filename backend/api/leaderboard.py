@@ -0,0 +1,138 @@
+from time import monotonic
+from threading import Lock
+from collections import defaultdict
+from sortedcontainers import SortedList
+from flask import current_app
+from sqlalchemy import select
+from api.database import session
+from api.catalog import SCORES, data_version
+from api.models import Score, Quiz, User
+
+
+class Board:
+    # users ordered by points, highest first, ties broken by user id; a
+    # local stand-in for a redis sorted set, moving a user and looking up
+    # a rank are O(log n)
+    def __init__(self):
+        self.points: dict[int, int] = {}
+        self.entries: SortedList[tuple[int, int]] = SortedList()
+
+    def add(self, user_id: int, points: int):
+        if (previous := self.points.get(user_id)) is not None:
+            self.entries.remove((-previous, user_id))
+            points += previous
+        self.points[user_id] = points
+        self.entries.add((-points, user_id))
+
+    def load(self, points: dict[int, int]):
+        # bulk build an empty board, one sort instead of n inserts
+        self.points = dict(points)
+        self.entries = SortedList((-total, user_id) for user_id, total in points.items())
+
+    def rank(self, user_id: int) -> int | None:
+        # 1-based position of the user, None if they are not on the board
+        if (points := self.points.get(user_id)) is None:
+            return None
+        return self.entries.bisect_left((-points, user_id)) + 1
+
+    def top(self, limit: int) -> list[tuple[int, int]]:
+        return [(user_id, -points) for points, user_id in self.entries.islice(0, limit)]
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+class Leaderboards:
+    # per quiz, per subject and global boards fed with scores newer than
+    # last_score_id, checked in the database at most once every `interval`
+    # seconds; scores submitted through this process are added at once and
+    # remembered in `applied` so the next check skips them; only deleted
+    # scores bump the scores version, which rebuilds every board
+    def __init__(self, interval: float = 0):
+        self.interval = interval
+        self.lock = Lock()
+        self.synced_at = None
+        self.reset(None)
+
+    def reset(self, version: int | None):
+        self.version = version
+        self.last_score_id = 0
+        self.applied: set[int] = set()
+        self.boards: dict[tuple[str, int], Board] = defaultdict(Board)
+
+    def apply(self, rows):
+        # rows of (user_id, quiz_id, subject_id, points)
+        deltas = defaultdict(lambda: defaultdict(int))
+        for user_id, quiz_id, subject_id, points in rows:
+            deltas["quiz", quiz_id][user_id] += points
+            deltas["subject", subject_id][user_id] += points
+            deltas["global", 0][user_id] += points
+        for name, points in deltas.items():
+            board = self.boards[name]
+            if not board:
+                board.load(points)
+                continue
+            for user_id, total in points.items():
+                board.add(user_id, total)
+
+    def add(self, score: Score):
+        # called once the score is committed, boards not built yet load it
+        # with everything else on their first sync
+        score_id, row = score.id, (score.user_id, score.quiz_id, score.subject_id, score.user_score)
+        with self.lock:
+            if self.synced_at is None or score_id <= self.last_score_id or score_id in self.applied:
+                return
+            self.applied.add(score_id)
+            self.apply([row])
+
+    def sync(self):
+        if self.synced_at is not None and monotonic() - self.synced_at < self.interval:
+            return
+        version = data_version(SCORES)
+        with self.lock:
+            self.synced_at = monotonic()
+            if version != self.version:
+                self.reset(version)
+            rows = session.execute(
+                select(Score.id, Score.user_id, Score.quiz_id, Quiz.subject_id, Score.user_score)
+                .join(Quiz, Score.quiz_id == Quiz.id)
+                .where(Score.id > self.last_score_id)
+                .order_by(Score.id)
+            ).all()
+            self.apply(row[1:] for row in rows if row.id not in self.applied)
+            if rows:
+                self.last_score_id = rows[-1].id
+                self.applied = {score_id for score_id in self.applied if score_id > self.last_score_id}
+
+    def lookup(self, kind: str, key: int, user_id: int, limit: int):
+        # top `limit` entries, board size and the user's rank and points
+        self.sync()
+        with self.lock:
+            board = self.boards.get((kind, key)) or Board()
+            return board.top(limit), len(board), board.rank(user_id), board.points.get(user_id)
+
+
+def init_leaderboards(app):
+    app.extensions["leaderboards"] = Leaderboards(app.config["LEADERBOARD_SYNC_INTERVAL"])
+
+
+def leaderboards() -> Leaderboards:
+    return current_app.extensions["leaderboards"]
+
+
+def record_score(score: Score):
+    leaderboards().add(score)
+
+
+def leaderboard(kind: str, key: int, user_id: int, limit: int) -> dict:
+    top, size, rank, points = leaderboards().lookup(kind, key, user_id, limit)
+    names = dict(session.execute(select(User.id, User.name).where(
+        User.id.in_([user for user, _ in top]))).all())
+    return {
+        "size": size,
+        "top": [
+            {"rank": position, "user_id": user, "name": names.get(user, ""), "points": total}
+            for position, (user, total) in enumerate(top, start=1)
+        ],
+        "me": {"rank": rank, "points": points} if rank is not None else None,
+    }
@@ -0,0 +1,286 @@
+import io
+import os
+import json
+import heapq
+import pstats
+import socket
+import logging
+import cProfile
+from time import perf_counter, monotonic, time
+from threading import Lock
+from collections import defaultdict
+from sqlalchemy import event, Engine
+from typing import Callable
+from flask import g, request, has_app_context
+from celery import signals
+from api import cache
+from api.cache import Cache
+
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float("inf"))
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for index, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self.lock = Lock()
+        self.histograms: dict[tuple[str, tuple], Histogram] = defaultdict(Histogram)
+        self.counters: dict[tuple[str, tuple], float] = defaultdict(float)
+        self.gauges: dict[tuple[str, tuple], Callable[[], float]] = {}
+        self.help: dict[str, tuple[str, str]] = {}
+
+    def describe(self, name: str, kind: str, text: str):
+        self.help[name] = (kind, text)
+
+    def observe(self, name: str, value: float, **labels):
+        with self.lock:
+            self.histograms[name, tuple(sorted(labels.items()))].observe(value)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        with self.lock:
+            self.counters[name, tuple(sorted(labels.items()))] += value
+
+    def gauge(self, name: str, read, **labels):
+        # read is called at scrape time
+        self.gauges[name, tuple(sorted(labels.items()))] = read
+
+    def snapshot(self) -> dict:
+        # counters and histograms as JSON, for other processes to add up
+        with self.lock:
+            return {
+                "counters": [[name, labels, value] for (name, labels), value in self.counters.items()],
+                "histograms": [
+                    [name, labels, histogram.counts, histogram.sum, histogram.count]
+                    for (name, labels), histogram in self.histograms.items()],
+            }
+
+    def merge(self, snapshot: dict):
+        with self.lock:
+            for name, labels, value in snapshot["counters"]:
+                self.counters[name, tuple(map(tuple, labels))] += value
+            for name, labels, counts, total, count in snapshot["histograms"]:
+                histogram = self.histograms[name, tuple(map(tuple, labels))]
+                histogram.counts = [a + b for a, b in zip(histogram.counts, counts)]
+                histogram.sum += total
+                histogram.count += count
+
+    def render(self, others: list[dict] = ()) -> str:
+        # `others` are snapshots of other processes, their counters and
+        # histograms are added to this one's; gauges are this process's own
+        combined = Registry()
+        for snapshot in (self.snapshot(), *others):
+            combined.merge(snapshot)
+        lines = []
+        series = defaultdict(list)
+        for (name, labels), histogram in combined.histograms.items():
+            series[name].append((labels, histogram))
+        for (name, labels), value in combined.counters.items():
+            series[name].append((labels, value))
+        for (name, labels), read in list(self.gauges.items()):
+            series[name].append((labels, read()))
+
+        for name in sorted(series):
+            kind, text = self.help.get(name, ("untyped", name))
+            lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in series[name]:
+                if isinstance(value, Histogram):
+                    cumulative = 0
+                    for bound, count in zip(BUCKETS, value.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else bound
+                        lines.append(f"{name}_bucket{format_labels(labels + (('le', le),))} {cumulative}")
+                    lines.append(f"{name}_sum{format_labels(labels)} {value.sum}")
+                    lines.append(f"{name}_count{format_labels(labels)} {value.count}")
+                else:
+                    lines.append(f"{name}{format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+metrics = Registry()
+metrics.describe("http_request_duration_seconds", "histogram", "Request latency by endpoint")
+metrics.describe("http_request_sql_queries", "histogram", "SQL statements executed per request")
+metrics.describe("http_request_sql_seconds", "histogram", "Time spent in SQL per request")
+metrics.describe("sql_queries_total", "counter", "SQL statements executed")
+metrics.describe("celery_task_duration_seconds", "histogram", "Celery task run time")
+metrics.describe("celery_task_queue_wait_seconds", "histogram", "Time between publishing and starting a task")
+metrics.describe("celery_task_failures_total", "counter", "Celery tasks that raised")
+metrics.describe("cache_hits", "counter", "Cache lookups served from the cache")
+metrics.describe("cache_misses", "counter", "Cache lookups that missed")
+
+
+# every process publishes its snapshot to this redis hash, so one scrape
+# covers all web and celery workers; without redis each process only
+# reports its own numbers
+PROCESSES_KEY = "metrics_processes"
+publish_interval = 10.0
+process_ttl = 300.0
+published_at = None
+
+
+def process_name() -> str:
+    # looked up on every publish, forked workers get their own
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def publish(force: bool = False):
+    global published_at
+
+    if cache.client is None:
+        return
+    if not force and published_at is not None and monotonic() - published_at < publish_interval:
+        return
+    published_at = monotonic()
+    try:
+        cache.client.hset(PROCESSES_KEY, process_name(), json.dumps({"at": time(), **metrics.snapshot()}))
+    except Exception:
+        logger.exception("failed to publish metrics")
+
+
+def watch_caches():
+    # caches are built by the init functions and blueprints after
+    # init_metrics, pick up every cache known by the time metrics are read
+    for name in Cache.registry:
+        metrics.gauge("cache_hits", lambda name=name: Cache.registry[name].hits, cache=name)
+        metrics.gauge("cache_misses", lambda name=name: Cache.registry[name].misses, cache=name)
+
+
+def render_metrics() -> str:
+    watch_caches()
+    if cache.client is None:
+        return metrics.render()
+    others, stale = [], []
+    for name, snapshot in cache.client.hgetall(PROCESSES_KEY).items():
+        name, snapshot = name.decode(), json.loads(snapshot)
+        if name == process_name():
+            continue
+        if time() - snapshot["at"] > process_ttl:
+            # the process is gone, its numbers stop counting
+            stale.append(name)
+            continue
+        others.append(snapshot)
+    if stale:
+        cache.client.hdel(PROCESSES_KEY, *stale)
+    return metrics.render(others)
+
+
+# slowest profiled requests as a min-heap of (duration, timestamp, endpoint, stats)
+slow_requests: list[tuple] = []
+slow_requests_lock = Lock()
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = perf_counter() - conn.info["query_start"].pop()
+    metrics.inc("sql_queries_total")
+    if has_app_context() and "sql" in g:
+        g.sql[0] += 1
+        g.sql[1] += elapsed
+
+
+def init_metrics(app):
+    global publish_interval, process_ttl
+
+    publish_interval = app.config["METRICS_PUBLISH_INTERVAL"]
+    process_ttl = app.config["METRICS_PROCESS_TTL"]
+    @app.before_request
+    def start_request():
+        g.request_start = perf_counter()
+        g.sql = [0, 0.0]
+        if app.config.get("PROFILE_REQUESTS"):
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+    @app.teardown_request
+    def finish_request(_):
+        if "request_start" not in g:
+            return
+        elapsed = perf_counter() - g.pop("request_start")
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        labels = dict(endpoint=endpoint, method=request.method)
+        metrics.observe("http_request_duration_seconds", elapsed, **labels)
+        metrics.observe("http_request_sql_queries", g.sql[0], **labels)
+        metrics.observe("http_request_sql_seconds", g.sql[1], **labels)
+        publish()
+
+        if (profiler := g.pop("profiler", None)) is not None:
+            profiler.disable()
+            record_slow_request(app.config["PROFILE_SLOWEST"],
+                                elapsed, f"{request.method} {request.full_path}", profiler)
+
+
+def record_slow_request(keep: int, elapsed: float, endpoint: str, profiler: cProfile.Profile):
+    with slow_requests_lock:
+        if len(slow_requests) >= keep and elapsed <= slow_requests[0][0]:
+            return
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(25)
+        entry = (elapsed, time(), endpoint, output.getvalue())
+        if len(slow_requests) < keep:
+            heapq.heappush(slow_requests, entry)
+        else:
+            heapq.heapreplace(slow_requests, entry)
+
+
+def slowest_requests() -> str:
+    with slow_requests_lock:
+        entries = sorted(slow_requests, reverse=True)
+    return "\n".join(
+        f"=== {endpoint} {elapsed * 1000:.1f}ms\n{stats}"
+        for elapsed, _, endpoint, stats in entries)
+
+
+@signals.before_task_publish.connect
+def stamp_task(headers=None, **_):
+    # travels with the message so the worker can measure queue wait
+    if headers is not None:
+        headers["published_at"] = time()
+
+
+@signals.task_prerun.connect
+def start_task(task=None, **_):
+    task.request.started_at = perf_counter()
+    if published_at := getattr(task.request, "published_at", None):
+        metrics.observe("celery_task_queue_wait_seconds",
+                        max(0.0, time() - published_at), task=task.name)
+
+
+@signals.task_postrun.connect
+def finish_task(task=None, state=None, **_):
+    if started_at := getattr(task.request, "started_at", None):
+        metrics.observe("celery_task_duration_seconds",
+                        perf_counter() - started_at, task=task.name, state=state)
+    publish()
+
+
+@signals.task_failure.connect
+def failed_task(sender=None, exception=None, **_):
+    metrics.inc("celery_task_failures_total", task=sender.name)
+    logger.error("celery task %s failed: %s", sender.name, exception)
@@ -0,0 +1,194 @@
+from datetime import date
+from sqlalchemy import (
+    select, insert, delete, update, func, text, inspect, tuple_, Column, Table, Engine)
+from sqlalchemy.schema import CreateTable
+from api.models import (
+    Base, User, Subject, Chapter, Quiz, Question, Option, Score, Attempt, SchemaVersion,
+    SubjectMonthStat, StatWatermark)
+
+
+# applied in order, each at most once per database; migrations must also be
+# safe on fresh databases where create_all already built the current schema
+MIGRATIONS = []
+
+
+def migration(func):
+    MIGRATIONS.append(func)
+    return func
+
+
+def create_indexes(connection, *names: str):
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name in names:
+                index.create(connection, checkfirst=True)
+
+
+def rebuild_table(connection, table: Table):
+    # SQLite cannot alter constraints, copy the rows into a table with the
+    # current definition and swap it in; foreign keys are not enforced while
+    # migrating, so dropping the old table cascades nowhere
+    name = connection.dialect.identifier_preparer.format_table(table)
+    columns = ", ".join(connection.dialect.identifier_preparer.quote(column.name) for column in table.columns)
+    connection.execute(text(str(CreateTable(table).compile(connection)).replace(
+        f"CREATE TABLE {name} ", f"CREATE TABLE {table.name}_rebuilt ", 1)))
+    connection.execute(text(f"INSERT INTO {table.name}_rebuilt ({columns}) SELECT {columns} FROM {name}"))
+    connection.execute(text(f"DROP TABLE {name}"))
+    connection.execute(text(f"ALTER TABLE {table.name}_rebuilt RENAME TO {name}"))
+    create_indexes(connection, *(index.name for index in table.indexes))
+
+
+def add_column(connection, column: Column):
+    # nullable columns without server defaults only, as SQLite requires
+    if column.name not in {existing["name"] for existing in inspect(connection).get_columns(column.table.name)}:
+        connection.execute(text(
+            f"ALTER TABLE {column.table.name} ADD COLUMN {column.name} "
+            f"{column.type.compile(connection.dialect)}"))
+
+
+@migration
+def add_lookup_indexes(connection):
+    create_indexes(
+        connection,
+        "ix_chapter_subject_id", "ix_quiz_subject_id", "ix_quiz_chapter_id",
+        "ix_question_quiz_id", "ix_option_question_id", "ix_score_quiz_id")
+    # keep the first submission of every (user, quiz) pair before enforcing
+    # uniqueness, then rebuild the score aggregates without the duplicates
+    connection.execute(delete(Score).where(Score.id.not_in(
+        select(func.min(Score.id)).group_by(Score.user_id, Score.quiz_id))))
+    connection.execute(delete(SubjectMonthStat))
+    connection.execute(update(StatWatermark).values(last_score_id=0))
+    create_indexes(connection, "uq_score_user_quiz")
+
+
+@migration
+def add_modification_times(connection):
+    add_column(connection, Score.__table__.c.submitted_at)
+    add_column(connection, SubjectMonthStat.__table__.c.updated_at)
+
+
+@migration
+def add_submission_keys(connection):
+    add_column(connection, Score.__table__.c.submission_key)
+    create_indexes(connection, "ix_score_submission_key")
+
+
+@migration
+def add_search_index(connection):
+    # api.search depends on api.database, which imports this module
+    from api.search import CREATE_SEARCH_INDEX, available, rebuild_search_index
+
+    if available(connection):
+        connection.execute(text(CREATE_SEARCH_INDEX))
+        rebuild_search_index(connection)
+
+
+@migration
+def add_score_history_index(connection):
+    add_column(connection, Score.__table__.c.date_of_quiz)
+    add_column(connection, Score.__table__.c.subject_id)
+    connection.execute(update(Score).values(
+        date_of_quiz=select(Quiz.date_of_quiz).where(Quiz.id == Score.quiz_id).scalar_subquery(),
+        subject_id=select(Quiz.subject_id).where(Quiz.id == Score.quiz_id).scalar_subquery()))
+    create_indexes(connection, "ix_score_history")
+
+
+@migration
+def enforce_foreign_keys(connection):
+    # question.correct holds an option id but was declared as a reference to
+    # question.id, which enforced foreign keys would reject
+    for foreign_key in inspect(connection).get_foreign_keys("question"):
+        if foreign_key["constrained_columns"] != ["correct"]:
+            continue
+        if connection.dialect.name == "sqlite":
+            rebuild_table(connection, Question.__table__)
+        else:
+            connection.execute(text(f'ALTER TABLE question DROP CONSTRAINT "{foreign_key["name"]}"'))
+    # rows left behind while SQLite ignored the cascades, parents first
+    for model, column, parent in (
+        (Chapter, Chapter.subject_id, Subject.id),
+        (Quiz, Quiz.subject_id, Subject.id),
+        (Quiz, Quiz.chapter_id, Chapter.id),
+        (Question, Question.quiz_id, Quiz.id),
+        (Option, Option.question_id, Question.id),
+        (Score, Score.quiz_id, Quiz.id),
+        (Score, Score.user_id, User.id),
+        (Attempt, Attempt.quiz_id, Quiz.id),
+        (Attempt, Attempt.user_id, User.id),
+        (SubjectMonthStat, SubjectMonthStat.subject_id, Subject.id),
+    ):
+        connection.execute(delete(model).where(column.not_in(select(parent))))
+
+
+@migration
+def scope_submission_keys_to_users(connection):
+    connection.execute(text("DROP INDEX IF EXISTS ix_score_submission_key"))
+    create_indexes(connection, "uq_score_user_submission_key")
+
+
+@migration
+def never_reuse_score_ids(connection):
+    if connection.dialect.name != "sqlite":
+        return
+    schema = connection.execute(text("SELECT sql FROM sqlite_master WHERE name = 'score'")).scalar()
+    if "AUTOINCREMENT" not in schema:
+        rebuild_table(connection, Score.__table__)
+    # ids freed before the rebuild may still be below the statistics watermark
+    last_id = max(
+        connection.execute(select(func.max(Score.id))).scalar() or 0,
+        connection.execute(select(func.max(StatWatermark.last_score_id))).scalar() or 0)
+    connection.execute(text("DELETE FROM sqlite_sequence WHERE name = 'score'"))
+    connection.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES ('score', :seq)"), {"seq": last_id})
+
+
+def migrate(engine: Engine):
+    with engine.connect() as connection:
+        sqlite = connection.dialect.name == "sqlite"
+        if sqlite:
+            # table rebuilds must not fire cascades, references are checked
+            # once all migrations ran; the pragma is ignored inside a transaction
+            connection.exec_driver_sql("PRAGMA foreign_keys=OFF")
+            connection.commit()
+        try:
+            with connection.begin():
+                version = connection.execute(
+                    select(func.max(SchemaVersion.version))).scalar() or 0
+                for number, apply in enumerate(MIGRATIONS[version:], start=version + 1):
+                    apply(connection)
+                    connection.execute(insert(SchemaVersion).values(
+                        version=number, name=apply.__name__))
+                if sqlite and (violations := connection.exec_driver_sql("PRAGMA foreign_key_check").all()):
+                    raise RuntimeError(f"foreign key violations after migrating: {violations[:10]}")
+        finally:
+            if sqlite:
+                connection.exec_driver_sql("PRAGMA foreign_keys=ON")
+                connection.commit()
+
+
+# lookups that must be served by an index, checked by `flask check-query-plans`
+HOT_QUERIES = {
+    "chapters by subject": select(Chapter.id).where(Chapter.subject_id == 1),
+    "quizzes by subject": select(Quiz.id).where(Quiz.subject_id == 1),
+    "quizzes by chapter": select(Quiz.id).where(Quiz.chapter_id == 1),
+    "questions by quiz": select(Question.id, Question.correct).where(Question.quiz_id == 1),
+    "options by question": select(Option.id).where(Option.question_id == 1),
+    "scores by user": select(Score.id).where(Score.user_id == 1),
+    "scores by quiz": select(Score.id).where(Score.quiz_id == 1),
+    "attempted quizzes": select(Score.quiz_id).where(
+        Score.user_id == 1, Score.quiz_id.in_([1, 2, 3])),
+    "score history": select(Score.id, Score.date_of_quiz, Score.user_score)
+    .where(Score.user_id == 1, tuple_(Score.date_of_quiz, Score.id) < tuple_(date(2025, 1, 1), 1))
+    .order_by(Score.date_of_quiz.desc(), Score.id.desc()).limit(50),
+}
+
+
+def check_query_plans(engine: Engine) -> list[str]:
+    # returns a description of every hot query that falls back to a table scan
+    problems = []
+    with engine.connect() as connection:
+        for name, query in HOT_QUERIES.items():
+            sql = query.compile(engine, compile_kwargs={"literal_binds": True})
+            plan = [row[-1] for row in connection.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+            if any(step.startswith("SCAN") for step in plan):
+                problems.append(f"{name}: {'; '.join(plan)}")
+    return problems
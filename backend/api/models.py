@@ -1,7 +1,7 @@
 import enum
-from datetime import date
+from datetime import date, datetime
 from typing import Set, Literal
-from sqlalchemy import ForeignKey, Enum
+from sqlalchemy import ForeignKey, Enum, Index, Table, Column, DateTime, func
 from sqlalchemy.orm import Mapped, mapped_column, relationship, declarative_base
 
 type UserQualification = Literal["Matriculation",
@@ -20,7 +20,7 @@ class User(Base):
     qualification: Mapped[UserQualification] = mapped_column()
     dob: Mapped[date] = mapped_column()
     scores: Mapped[Set["Score"]] = relationship(
-        back_populates="user", cascade="all, delete")
+        back_populates="user", cascade="all, delete", passive_deletes=True)
 
 
 class Subject(Base):
@@ -28,10 +28,12 @@ class Subject(Base):
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str]
     description: Mapped[str] = mapped_column(default="")
+    # children are removed by the foreign key cascades, not loaded and
+    # deleted row by row
     chapters: Mapped[Set["Chapter"]] = relationship(
-        back_populates="subject", cascade="all, delete")
+        back_populates="subject", cascade="all, delete", passive_deletes=True)
     quizzes: Mapped[Set["Quiz"]] = relationship(
-        back_populates="subject", cascade="all, delete")
+        back_populates="subject", cascade="all, delete", passive_deletes=True)
 
 
 class Chapter(Base):
@@ -40,11 +42,10 @@ class Chapter(Base):
     name: Mapped[str]
     description: Mapped[str] = mapped_column(default="")
     subject_id: Mapped[int] = mapped_column(
-        ForeignKey("subject.id", ondelete="CASCADE"))
-    subject: Mapped["Subject"] = relationship(
-        back_populates="chapters", cascade="all, delete-orphan", single_parent=True)
+        ForeignKey("subject.id", ondelete="CASCADE"), index=True)
+    subject: Mapped["Subject"] = relationship(back_populates="chapters")
     quizzes: Mapped[Set["Quiz"]] = relationship(
-        back_populates="chapter", cascade="all, delete")
+        back_populates="chapter", cascade="all, delete", passive_deletes=True)
 
 
 class Quiz(Base):
@@ -52,21 +53,19 @@ class Quiz(Base):
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str]
     subject_id: Mapped[int] = mapped_column(
-        ForeignKey("subject.id", ondelete="CASCADE"))
+        ForeignKey("subject.id", ondelete="CASCADE"), index=True)
     chapter_id: Mapped[int] = mapped_column(
-        ForeignKey("chapter.id", ondelete="CASCADE"))
+        ForeignKey("chapter.id", ondelete="CASCADE"), index=True)
     date_of_quiz: Mapped[date]
     hours: Mapped[int] = mapped_column()
     minutes: Mapped[int] = mapped_column()
     remarks: Mapped[str] = mapped_column(default="")
-    subject: Mapped["Subject"] = relationship(
-        back_populates="quizzes", cascade="all, delete-orphan", single_parent=True)
-    chapter: Mapped["Chapter"] = relationship(
-        back_populates="quizzes", cascade="all, delete-orphan", single_parent=True)
+    subject: Mapped["Subject"] = relationship(back_populates="quizzes")
+    chapter: Mapped["Chapter"] = relationship(back_populates="quizzes")
     questions: Mapped[Set["Question"]] = relationship(
-        back_populates="quiz", cascade="all, delete")
+        back_populates="quiz", cascade="all, delete", passive_deletes=True)
     scores: Mapped[Set["Score"]] = relationship(
-        back_populates="quiz", cascade="all, delete")
+        back_populates="quiz", cascade="all, delete", passive_deletes=True)
 
 
 class Question(Base):
@@ -74,10 +73,12 @@ class Question(Base):
     id: Mapped[int] = mapped_column(primary_key=True)
     statement: Mapped[str]
     quiz_id: Mapped[int] = mapped_column(
-        ForeignKey("quiz.id", ondelete="CASCADE"))
+        ForeignKey("quiz.id", ondelete="CASCADE"), index=True)
     quiz: Mapped["Quiz"] = relationship("Quiz")
-    correct: Mapped[int] = mapped_column(ForeignKey("question.id"))
-    options: Mapped[Set["Option"]] = relationship(cascade="all, delete")
+    # id of the correct option, staged before the options exist so it is
+    # not a foreign key
+    correct: Mapped[int]
+    options: Mapped[Set["Option"]] = relationship(cascade="all, delete", passive_deletes=True)
 
 
 class Option(Base):
@@ -85,19 +86,106 @@ class Option(Base):
     id: Mapped[int] = mapped_column(primary_key=True)
     statement: Mapped[str]
     question_id: Mapped[int] = mapped_column(
-        ForeignKey("question.id", ondelete="CASCADE"))
+        ForeignKey("question.id", ondelete="CASCADE"), index=True)
 
 
 class Score(Base):
     __tablename__ = "score"
+    __table_args__ = (
+        # one submission per user and quiz, also serves user_id lookups
+        Index("uq_score_user_quiz", "user_id", "quiz_id", unique=True),
+        # idempotency keys are chosen by clients, unique per user only
+        Index("uq_score_user_submission_key", "user_id", "submission_key", unique=True),
+        # covers score history pages, newest first
+        Index("ix_score_history", "user_id", "date_of_quiz", "id",
+              "subject_id", "quiz_id", "user_score", "total_score"),
+        # statistics and leaderboards fold new scores by id, so ids of
+        # deleted scores must never be handed out again
+        {"sqlite_autoincrement": True},
+    )
     id: Mapped[int] = mapped_column(primary_key=True)
     user_id: Mapped[int] = mapped_column(
         ForeignKey("user.id", ondelete="CASCADE"))
     quiz_id: Mapped[int] = mapped_column(
-        ForeignKey("quiz.id", ondelete="CASCADE"))
+        ForeignKey("quiz.id", ondelete="CASCADE"), index=True)
     user_score: Mapped[int]
     total_score: Mapped[int]
+    submitted_at: Mapped[datetime | None] = mapped_column(
+        default=func.current_timestamp())
+    # copied from the quiz so score history never has to join it, set by
+    # every insert from grading.score_columns
+    date_of_quiz: Mapped[date | None]
+    subject_id: Mapped[int | None]
+    # client supplied idempotency key, retried submissions reuse it
+    submission_key: Mapped[str | None]
     user: Mapped["User"] = relationship(
         back_populates="scores", cascade="save-update")
-    quiz: Mapped["Quiz"] = relationship(
-        back_populates="scores", cascade="all, delete")
+    quiz: Mapped["Quiz"] = relationship(back_populates="scores")
+
+
+class Attempt(Base):
+    __tablename__ = "attempt"
+    __table_args__ = (
+        Index("uq_attempt_user_quiz", "user_id", "quiz_id", unique=True),
+    )
+    id: Mapped[int] = mapped_column(primary_key=True)
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey("user.id", ondelete="CASCADE"))
+    quiz_id: Mapped[int] = mapped_column(
+        ForeignKey("quiz.id", ondelete="CASCADE"), index=True)
+    started_at: Mapped[datetime]
+    # None for quizzes without a time limit
+    deadline: Mapped[datetime | None]
+    # JSON object of question id -> selected option id
+    answers: Mapped[str] = mapped_column(default="{}")
+    saved_at: Mapped[datetime | None]
+    finished_at: Mapped[datetime | None]
+
+
+def archive_table(model) -> Table:
+    # same columns without keys, constraints or indexes, plus when the row moved
+    return Table(
+        f"{model.__tablename__}_archive", Base.metadata,
+        *(Column(column.name, column.type) for column in model.__table__.columns),
+        Column("archived_at", DateTime, server_default=func.current_timestamp()))
+
+
+# old quizzes and everything under them, moved out of the hot tables
+quiz_archive = archive_table(Quiz)
+question_archive = archive_table(Question)
+option_archive = archive_table(Option)
+score_archive = archive_table(Score)
+
+
+class SubjectMonthStat(Base):
+    __tablename__ = "subject_month_stat"
+    subject_id: Mapped[int] = mapped_column(
+        ForeignKey("subject.id", ondelete="CASCADE"), primary_key=True)
+    year: Mapped[int] = mapped_column(primary_key=True)
+    month: Mapped[int] = mapped_column(primary_key=True)
+    attempts: Mapped[int] = mapped_column(default=0)
+    user_score: Mapped[int] = mapped_column(default=0)
+    total_score: Mapped[int] = mapped_column(default=0)
+    ratio_sum: Mapped[float] = mapped_column(default=0)
+    max_ratio: Mapped[float] = mapped_column(default=0)
+    updated_at: Mapped[datetime | None] = mapped_column(
+        default=func.current_timestamp())
+
+
+class StatWatermark(Base):
+    __tablename__ = "stat_watermark"
+    name: Mapped[str] = mapped_column(primary_key=True)
+    last_score_id: Mapped[int] = mapped_column(default=0)
+
+
+# monotonically increasing counters that readers use to key their caches
+class DataVersion(Base):
+    __tablename__ = "data_version"
+    name: Mapped[str] = mapped_column(primary_key=True)
+    value: Mapped[int] = mapped_column(default=0)
+
+
+class SchemaVersion(Base):
+    __tablename__ = "schema_version"
+    version: Mapped[int] = mapped_column(primary_key=True)
+    name: Mapped[str]
@@ -1,15 +1,27 @@
+import io
+import csv
+import logging
 from api.models import *
-from datetime import datetime
+from datetime import date, datetime
+from typing import NamedTuple
+from api.cache import Cache
+from itertools import groupby
 from api.database import session
+from api.catalog import SCORES, cached_catalog, bump_catalog_version, bump_data_version, digest
+from api.http_cache import conditional_body, conditional_json
+from api.search import search, index_subject, index_quizzes, unindex_subject
+from api.archive import delete_quizzes
 from flask_restful import Resource, Api
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy import select, delete, update
-from flask import request, jsonify, make_response
+from sqlalchemy import select, delete, func, tuple_
+from sqlalchemy.orm import joinedload, selectinload
+from flask import request, jsonify, make_response, current_app, Response, stream_with_context
 from flask_jwt_extended import JWTManager, jwt_required, current_user
 
 
 api = Api()
 jwt = JWTManager()
+logger = logging.getLogger(__name__)
 
 
 @jwt.user_identity_loader
@@ -17,16 +29,49 @@ def user_identity_lookup(user):
     return user.email
 
 
+# immutable, session independent view of the authenticated user
+class UserRecord(NamedTuple):
+    id: int
+    name: str
+    email: str
+
+
+def init_identities(app):
+    app.extensions["identities"] = Cache(
+        "identities", maxsize=app.config["IDENTITY_CACHE_SIZE"],
+        ttl=app.config["IDENTITY_CACHE_TTL"], shared=False)
+
+
+def identities() -> Cache:
+    return current_app.extensions["identities"]
+
+
 @jwt.user_lookup_loader
 def user_lookup_callback(_, jwt_data):
     identity = jwt_data["sub"]
-    return session.execute(select(User).where(User.email == identity)).scalar()
+    if (user := identities().get(identity)) is None:
+        row = session.execute(select(User.id, User.name, User.email).where(
+            User.email == identity)).first()
+        if row is None:
+            return None
+        user = UserRecord(*row)
+        identities().set(identity, user)
+    return user
+
+
+def invalidate_identity(email: str):
+    # call whenever a user is created or their profile changes
+    identities().delete(email)
 
 
 class Subjects(Resource):
     @jwt_required()
     def get(self):
-        return jsonify(subjects=[
+        entry = cached_catalog(self.build)
+        return conditional_body(entry["etag"], entry["body"])
+
+    def build(self):
+        return {"subjects": [
             {
                 "id": subject.id,
                 "name": subject.name,
@@ -37,8 +82,9 @@ class Subjects(Resource):
                     for chapter in subject.chapters
                 ],
             }
-            for subject in session.execute(select(Subject)).scalars()
-        ])
+            for subject in session.execute(
+                select(Subject).options(selectinload(Subject.chapters))).scalars()
+        ]}, []
 
     @jwt_required()
     def post(self):
@@ -60,6 +106,9 @@ class Subjects(Resource):
                 for chapter in chapters
             }
             session.add_all(chapters)
+            session.flush()
+            index_subject(subject, chapters)
+            bump_catalog_version()
             session.commit()
             return make_response('subject created successfully', 201)
         except IntegrityError:
@@ -68,7 +117,12 @@ class Subjects(Resource):
     @jwt_required()
     def delete(self, subject_id: int):
         try:
+            unindex_subject(subject_id)
+            # the foreign key cascades remove chapters, quizzes and everything
+            # under them, the subject's aggregates included
             session.execute(delete(Subject).where(Subject.id == subject_id))
+            bump_catalog_version()
+            bump_data_version(SCORES)
             session.commit()
             return make_response('subject deleted successfully')
         except IntegrityError:
@@ -77,16 +131,145 @@ class Subjects(Resource):
             return make_response(f'unknown error {error}', 500)
 
 
+def catalog_filters(query):
+    if (after_id := request.args.get("after_id", type=int)) is not None:
+        query = query.where(Quiz.id > after_id)
+    if (subject_id := request.args.get("subject_id", type=int)) is not None:
+        query = query.where(Quiz.subject_id == subject_id)
+    if (chapter_id := request.args.get("chapter_id", type=int)) is not None:
+        query = query.where(Quiz.chapter_id == chapter_id)
+    return query
+
+
+def attempted(quiz_ids: list[int]) -> set[int]:
+    # quizzes among quiz_ids already attempted by the current user
+    return set(session.execute(
+        select(Score.quiz_id).where(
+            Score.user_id == current_user.id,
+            Score.quiz_id.in_(quiz_ids))
+    ).scalars())
+
+
+def add_quizzes(payloads: list[dict]) -> list[Quiz]:
+    # stage quizzes with their questions and options, ids are assigned by a
+    # single batched flush so the caller can commit everything at once
+    quizzes, answers = [], []
+    for payload in payloads:
+        quiz = Quiz(
+            name=payload["name"],
+            remarks=payload.get("remarks") or "",
+            subject_id=int(payload["subject"]),
+            chapter_id=int(payload["chapter"]),
+            date_of_quiz=datetime.strptime(
+                payload["date_of_quiz"], "%Y-%m-%d"
+            ).date(),
+            hours=int(payload["hh"]),
+            minutes=int(payload["mm"]),
+        )
+        session.add(quiz)
+        # attach in authoring order so ids follow the submitted order
+        for question in payload["questions"]:
+            options = [Option(statement=option["statement"])
+                       for option in question["options"]]
+            answer = int(question["answer"])
+            question = Question(statement=question["statement"], correct=answer)
+            quiz.questions.add(question)
+            for option in options:
+                question.options.add(option)
+            answers.append((question, options[answer]))
+        quizzes.append(quiz)
+
+    session.flush()
+    # point each question at its correct option now that options have ids
+    for question, option in answers:
+        question.correct = option.id
+    session.flush()
+    index_quizzes(quizzes)
+    return quizzes
+
+
+def read_quiz_csv(stream) -> list[dict]:
+    # one row per question: name, remarks, subject, chapter, date_of_quiz,
+    # hh, mm, question, answer (0-based option index) and the options in the
+    # remaining columns; consecutive rows with the same quiz columns form a quiz
+    quizzes = []
+    for row in csv.reader(stream):
+        if not row or row[0] == "name":
+            continue
+        name, remarks, subject, chapter, date_of_quiz, hh, mm, statement, answer, *options = row
+        header = dict(name=name, remarks=remarks, subject=subject, chapter=chapter,
+                      date_of_quiz=date_of_quiz, hh=hh, mm=mm)
+        if not quizzes or {key: quizzes[-1][key] for key in header} != header:
+            quizzes.append({**header, "questions": []})
+        quizzes[-1]["questions"].append({
+            "statement": statement,
+            "answer": answer,
+            "options": [{"statement": option} for option in options if option],
+        })
+    return quizzes
+
+
 class Quizzes(Resource):
     @jwt_required()
     def get(self, quiz_id: int | None = None):
         if quiz_id is not None:
-            quizzes = session.execute(
-                select(Quiz).where(Quiz.id == quiz_id).join(
-                    Score, Score.user_id != current_user.id)
-            ).scalar()
-            return jsonify(quizzes)
-        return jsonify(quizzes=[
+            return self.get_quiz(quiz_id)
+        page_size = max(1, min(
+            request.args.get("limit", current_app.config["QUIZ_PAGE_SIZE"], type=int),
+            current_app.config["QUIZ_PAGE_SIZE_MAX"]))
+        build = self.get_full if request.args.get("view", "summary") == "full" else self.get_summary
+        entry = cached_catalog(lambda: build(page_size), serialized=False)
+
+        # the page is shared by every user, attempts are added per user and
+        # the page is only serialized when the client's copy is stale
+        done = sorted(attempted(entry["ids"]))
+        return conditional_json(
+            f'{entry["etag"]}-{digest(str(done))}', None,
+            lambda: {**entry["payload"], "done": done})
+
+    def get_summary(self, page_size: int):
+        # quiz metadata only, no ORM hydration
+        quizzes = session.execute(catalog_filters(
+            select(
+                Quiz.id, Quiz.name, Quiz.remarks,
+                Subject.name.label("subject"), Chapter.name.label("chapter"),
+                Quiz.hours, Quiz.minutes, Quiz.date_of_quiz)
+            .join(Chapter, Quiz.chapter_id == Chapter.id)
+            .join(Subject, Chapter.subject_id == Subject.id)
+            .order_by(Quiz.id).limit(page_size)
+        )).all()
+        quiz_ids = [quiz.id for quiz in quizzes]
+        question_counts = dict(session.execute(
+            select(Question.quiz_id, func.count(Question.id))
+            .where(Question.quiz_id.in_(quiz_ids))
+            .group_by(Question.quiz_id)
+        ).all())
+
+        return {"quizzes": [
+            {
+                "quiz_id": quiz.id,
+                "name": quiz.name,
+                "remarks": quiz.remarks,
+                "subject": quiz.subject,
+                "chapter": quiz.chapter,
+                "hh": quiz.hours,
+                "mm": quiz.minutes,
+                "date_of_quiz": quiz.date_of_quiz,
+                "question_count": question_counts.get(quiz.id, 0),
+            }
+            for quiz in quizzes
+        ], "next_after_id": quiz_ids[-1] if len(quiz_ids) == page_size else None}, quiz_ids
+
+    def get_full(self, page_size: int):
+        # load one page of the catalog with its relationships in batched queries
+        quizzes = session.execute(catalog_filters(
+            select(Quiz).options(
+                joinedload(Quiz.chapter).joinedload(Chapter.subject),
+                selectinload(Quiz.questions).selectinload(Question.options),
+            ).order_by(Quiz.id).limit(page_size)
+        )).unique().scalars().all()
+
+        return {"quizzes": [
             {
                 "quiz_id": quiz.id,
                 "name": quiz.name,
@@ -109,54 +292,64 @@ class Quizzes(Resource):
                     }
                     for question in quiz.questions
                 ],
-                "done": current_user in (score.user for score in quiz.scores)
             }
-            for quiz in session.execute(select(Quiz)).scalars()
-        ])
+            for quiz in quizzes
+        ], "next_after_id": quizzes[-1].id if len(quizzes) == page_size else None}, [quiz.id for quiz in quizzes]
+
+    def get_quiz(self, quiz_id: int):
+        quiz = session.execute(
+            select(
+                Quiz.id, Quiz.name, Quiz.remarks,
+                Subject.name.label("subject"), Chapter.name.label("chapter"),
+                Quiz.hours, Quiz.minutes, Quiz.date_of_quiz)
+            .join(Chapter, Quiz.chapter_id == Chapter.id)
+            .join(Subject, Chapter.subject_id == Subject.id)
+            .where(Quiz.id == quiz_id)
+        ).first()
+        if quiz is None:
+            return make_response('quiz not found', 404)
+        header = current_app.json.dumps({
+            "quiz_id": quiz.id,
+            "name": quiz.name,
+            "remarks": quiz.remarks,
+            "subject": quiz.subject,
+            "chapter": quiz.chapter,
+            "hh": quiz.hours,
+            "mm": quiz.minutes,
+            "date_of_quiz": quiz.date_of_quiz,
+            "done": quiz.id in attempted([quiz.id]),
+        })
+        rows = session.execute(
+            select(Question.id, Question.statement,
+                   Option.id.label("option_id"), Option.statement.label("option"))
+            .outerjoin(Option, Option.question_id == Question.id)
+            .where(Question.quiz_id == quiz_id)
+            .order_by(Question.id, Option.id)
+        )
+
+        # stream the question/option tree one question at a time
+        def generate():
+            yield '{"quiz":' + header[:-1] + ',"questions":['
+            for index, (question_id, group) in enumerate(groupby(rows, key=lambda row: row.id)):
+                group = list(group)
+                yield (',' if index else '') + current_app.json.dumps({
+                    "id": question_id,
+                    "statement": group[0].statement,
+                    "options": [
+                        {"id": row.option_id, "statement": row.option}
+                        for row in group if row.option_id is not None
+                    ],
+                })
+            yield ']}}'
+
+        return Response(stream_with_context(generate()), mimetype='application/json')
 
     @jwt_required()
     def post(self):
         try:
-            print(current_user.email)
-            quiz = request.json
-
-            questions = quiz.pop("questions")
-            quiz = Quiz(
-                name=quiz["name"],
-                remarks=quiz["remarks"],
-                subject_id=int(quiz["subject"]),
-                chapter_id=int(quiz["chapter"]),
-                date_of_quiz=datetime.strptime(
-                    quiz["date_of_quiz"], "%Y-%m-%d"
-                ).date(),
-                hours=int(quiz["hh"]),
-                minutes=int(quiz["mm"]),
-            )
-
-            session.add(quiz)
+            add_quizzes([request.json])
+            bump_catalog_version()
             session.commit()
-            for question in questions:
-                options = question.pop("options")
-                answer = question.pop("answer")
-                print(answer)
-                question = Question(
-                    statement=question.pop("statement"), quiz_id=quiz.id,
-                    correct=answer
-                )
-                session.add(question)
-                session.commit()
-                options = [
-                    Option(
-                        statement=option['statement'],
-                        question_id=question.id,
-                    )
-                    for option in options
-                ]
-                session.add_all(options)
-                session.commit()
-                session.execute(update(Question).where(
-                    Question.id == question.id).values(correct=options[answer].id))
-                session.commit()
             return make_response('quiz created successfully', 201)
         except IntegrityError:
             return make_response('failed to create quiz', 500)
@@ -166,41 +359,108 @@ class Quizzes(Resource):
     @jwt_required()
     def delete(self, quiz_id: int):
         try:
-            quiz = session.execute(select(Quiz).where(
-                Quiz.id == quiz_id)).scalar()
-            session.delete(quiz)
+            if session.execute(select(Quiz.id).where(Quiz.id == quiz_id)).scalar() is None:
+                return make_response('quiz not found', 404)
+            delete_quizzes(quiz_id)
             session.commit()
             return make_response('quiz deleted successfully', 200)
         except IntegrityError as error:
-            print(error)
+            logger.error("failed to delete quiz %s: %s", quiz_id, error)
             return make_response('failed to delete quiz!', 500)
         except Exception as error:
             return make_response(f'unknown error: {error}', 500)
 
 
+class QuizImport(Resource):
+    @jwt_required()
+    def post(self):
+        if current_user.email != 'admin@qm.xyz':
+            return make_response('admin access required', 403)
+        try:
+            if request.mimetype == 'text/csv':
+                payloads = read_quiz_csv(io.StringIO(request.get_data(as_text=True)))
+            elif 'file' in request.files:
+                payloads = read_quiz_csv(io.TextIOWrapper(request.files['file'].stream, encoding='utf-8'))
+            else:
+                payloads = request.get_json()
+                payloads = payloads.get("quizzes", []) if isinstance(payloads, dict) else payloads
+
+            quizzes = add_quizzes(payloads)
+            bump_catalog_version()
+            session.commit()
+            return make_response({"quizzes": [quiz.id for quiz in quizzes]}, 201)
+        except (KeyError, IndexError, ValueError) as error:
+            session.rollback()
+            return make_response(f'invalid quiz data: {error}', 400)
+        except IntegrityError:
+            session.rollback()
+            return make_response('failed to import quizzes', 500)
+
+
+class Search(Resource):
+    @jwt_required()
+    def get(self):
+        kind = request.args.get("kind")
+        if kind not in (None, "subject", "chapter", "quiz", "question"):
+            return make_response('unknown kind', 400)
+        limit = max(1, min(request.args.get("limit", 20, type=int),
+                           current_app.config["QUIZ_PAGE_SIZE_MAX"]))
+        offset = max(0, request.args.get("offset", 0, type=int))
+        results = search(request.args.get("q", ""), kind, limit, offset)
+        return jsonify(results=results,
+                       next_offset=offset + limit if len(results) == limit else None)
+
+
 class UserScores(Resource):
     @jwt_required()
     def get(self):
+        # newest first, one page per call; pass the returned `next` back as
+        # before_date/before_id for the following page
+        page_size = max(1, min(
+            request.args.get("limit", current_app.config["QUIZ_PAGE_SIZE"], type=int),
+            current_app.config["QUIZ_PAGE_SIZE_MAX"]))
+        query = (
+            select(Score.id, Score.quiz_id, Quiz.name, Score.total_score, Score.user_score,
+                   Score.date_of_quiz, Score.subject_id)
+            .join(Quiz, Score.quiz_id == Quiz.id)
+            .where(Score.user_id == current_user.id)
+            .order_by(Score.date_of_quiz.desc(), Score.id.desc())
+            .limit(page_size)
+        )
         try:
-            print([score.user_score for score in current_user.scores])
-            return jsonify({
-                "scores": [
-                    {
-                        "total": score.total_score,
-                        "correct": score.user_score,
-                        "date_of_quiz": score.quiz.date_of_quiz,
-                        "id": score.id,
-                        "subject_id": score.quiz.subject_id,
-                    }
-                    for score in current_user.scores
-                ]
-            })
-        except IntegrityError:
-            return make_response('failed to fetch user scores', 500)
-        except Exception as error:
-            return make_response(f'unknown error: {error}', 500)
+            if (subject_id := request.args.get("subject_id", type=int)) is not None:
+                query = query.where(Score.subject_id == subject_id)
+            if start := request.args.get("from"):
+                query = query.where(Score.date_of_quiz >= date.fromisoformat(start))
+            if end := request.args.get("to"):
+                query = query.where(Score.date_of_quiz <= date.fromisoformat(end))
+            before_date, before_id = request.args.get("before_date"), request.args.get("before_id", type=int)
+            if before_date and before_id is not None:
+                query = query.where(tuple_(Score.date_of_quiz, Score.id)
+                                    < tuple_(date.fromisoformat(before_date), before_id))
+        except ValueError:
+            return make_response('invalid date', 400)
+
+        scores = session.execute(query).all()
+        return jsonify(scores=[
+            {
+                "total": score.total_score,
+                "correct": score.user_score,
+                "date_of_quiz": score.date_of_quiz,
+                "id": score.id,
+                "quiz_id": score.quiz_id,
+                "quiz": score.name,
+                "subject_id": score.subject_id,
+            }
+            for score in scores
+        ], next={
+            "before_date": scores[-1].date_of_quiz.isoformat(),
+            "before_id": scores[-1].id,
+        } if len(scores) == page_size else None)
 
 
 api.add_resource(Quizzes, "/api/quizzes", "/api/quizzes/<int:quiz_id>")
+api.add_resource(QuizImport, "/api/quizzes/import")
 api.add_resource(Subjects, "/api/subjects", "/api/subjects/<int:subject_id>")
 api.add_resource(UserScores, "/api/scores")
+api.add_resource(Search, "/api/search")
@@ -1,27 +1,59 @@
 import os
-from sqlalchemy import select
-from datetime import datetime
+from api.cache import Cache
+from sqlalchemy import select, func
+from datetime import datetime, date
 from api.database import session
-from api.models import User, Quiz, Score
+from api.analytics import analytics, analytics_as_of, with_staleness
+from api.models import User, Score, Attempt
 from sqlalchemy.exc import IntegrityError
-from api.tasks import compute_monthly_statistics, compute_user_statistics
-from werkzeug.security import check_password_hash, generate_password_hash
-from flask import request, send_from_directory, make_response, jsonify, Blueprint
+from celery.exceptions import TimeoutError
+from api.http_cache import conditional_json
+from api.statistics import (
+    subject_stats, month_stats, monthly_series, quiz_series, stats_updated_at, user_statistics)
+from api.charts import admin_charts, rendered_filename
+from api.grading import get_answer_key, grade, score_columns, enqueue_submission, submission_status
+from api.attempts import (
+    AttemptClosed, start_attempt, get_attempt, save_answers, final_answers,
+    finish_attempt, current_answers, remaining_seconds, time_limit)
+from api.metrics import render_metrics, slowest_requests
+from api.leaderboard import leaderboard, record_score
+from api.export import FORMATS, export_filters, export_chunks, export_filename
+from api.resources import invalidate_identity
+from api.jobs import enqueue, job_result
+from api.auth import Overloaded, check_password, hash_password
+from flask import (
+    request, make_response, jsonify, Blueprint, current_app, send_from_directory,
+    stream_with_context)
 from flask_jwt_extended import (
     jwt_required,
     create_access_token,
+    create_refresh_token,
     set_access_cookies,
+    set_refresh_cookies,
     unset_jwt_cookies,
     current_user
 )
 
 
 routes = Blueprint('routes', __name__)
+user_stats_cache = Cache("user_stats", maxsize=4096)
 
 
-@routes.route('/', methods=('GET',))
-def index():
-    return send_from_directory('static', 'index.html', mimetype='text/html')
+@routes.record_once
+def init_routes(state):
+    state.app.extensions["stats_jobs"] = Cache(
+        "stats_jobs", maxsize=4096, ttl=state.app.config["STATS_JOB_TTL"])
+
+
+def stats_jobs() -> Cache:
+    return current_app.extensions["stats_jobs"]
+
+
+def busy():
+    # the password hashing pool turned the request away
+    response = make_response('too many logins, try again shortly', 503)
+    response.headers["Retry-After"] = "1"
+    return response
 
 
 @routes.route('/api/login', methods=('POST',))
@@ -29,21 +61,37 @@ def login():
     email = request.json.get('email')
     password = request.json.get('password')
 
-    if user := session.execute(select(User).where(User.email == email)).scalar():
-        if check_password_hash(user.password, password):
+    if user := session.execute(select(User.id, User.name, User.email, User.password)
+                               .where(User.email == email)).first():
+        # hand the connection back while the hash runs
+        session.rollback()
+        try:
+            valid = check_password(user.password, password)
+        except Overloaded:
+            return busy()
+        if valid:
             response = make_response({
                 "id": user.id,
                 "name": user.name,
                 "isAdmin": user.email == 'admin@qm.xyz'
             })
 
-            access_token = create_access_token(identity=user)
-            set_access_cookies(response, access_token)
+            set_access_cookies(response, create_access_token(identity=user))
+            set_refresh_cookies(response, create_refresh_token(identity=user))
             return response
         return make_response('invalid credentials', 401)
     return make_response('failed to login user', 404)
 
 
+@routes.route('/api/token/refresh', methods=('POST',))
+@jwt_required(refresh=True)
+def refresh_token():
+    # extends the session without the password, and so without a hash
+    response = make_response('token refreshed', 200)
+    set_access_cookies(response, create_access_token(identity=current_user))
+    return response
+
+
 @routes.route('/api/users/me', methods=('GET',))
 @jwt_required()
 def get_user():
@@ -61,15 +109,47 @@ def register():
         user = User(
             name=user.get("name"),
             email=user.get("email"),
-            password=generate_password_hash(user.get("password")),
+            password=hash_password(user.get("password")),
             qualification=user.get("qualification"),
             dob=datetime.strptime(user.get("dob"), "%Y-%m-%d").date(),
         )
         session.add(user)
         session.commit()
+        invalidate_identity(user.email)
         return make_response('user created successfully', 201)
     except IntegrityError:
+        session.rollback()
         return make_response('user already exists', 400)
+    except Overloaded:
+        return busy()
+
+
+@routes.route('/api/admin/caches', methods=('GET',))
+@jwt_required()
+def cache_stats():
+    if current_user.email != 'admin@qm.xyz':
+        return make_response('admin access required', 403)
+    return jsonify(caches={
+        name: cache.stats() for name, cache in Cache.registry.items()})
+
+
+@routes.route('/api/admin/metrics', methods=('GET',))
+@jwt_required()
+def prometheus_metrics():
+    if current_user.email != 'admin@qm.xyz':
+        return make_response('admin access required', 403)
+    # counters and histograms of every process with redis, gauges and
+    # everything without it are this process's
+    return current_app.response_class(
+        render_metrics(), mimetype='text/plain; version=0.0.4')
+
+
+@routes.route('/api/admin/metrics/slow', methods=('GET',))
+@jwt_required()
+def slow_request_profiles():
+    if current_user.email != 'admin@qm.xyz':
+        return make_response('admin access required', 403)
+    return current_app.response_class(slowest_requests(), mimetype='text/plain')
 
 
 @routes.route('/api/logout', methods=('GET',))
@@ -82,57 +162,326 @@ def logout():
 @routes.route('/api/quiz/<int:quiz_id>/submit', methods=('POST',))
 @jwt_required()
 def submit_quiz(quiz_id):
+    # clients may send an Idempotency-Key so that retries are answered with
+    # the outcome of the first submission instead of a conflict
+    key = request.headers.get("Idempotency-Key")
     try:
         payload = request.get_json()
-        quiz = session.execute(select(Quiz).where(
-            Quiz.id == quiz_id)).scalar()
+        # timed submissions go through the attempt and its deadline
+        attempt = session.execute(select(Attempt).where(
+            Attempt.user_id == current_user.id, Attempt.quiz_id == quiz_id)).scalar()
+        if attempt is None and time_limit(quiz_id):
+            # the clock of a timed quiz starts with its attempt, without one
+            # there is no deadline to hold the answers to
+            return jsonify(message='start the quiz before submitting it', code=409)
+        if current_app.config["GRADING_QUEUE"]:
+            selected = payload["selected"]
+            if attempt is not None:
+                selected = final_answers(attempt, selected)
+            return queue_submission(quiz_id, selected, key, attempt)
+        if attempt is not None:
+            record_score(finish_attempt(attempt, payload["selected"], key))
+            return jsonify(message='user score updated!', code=201)
 
-        user_score = 0
-        for question in quiz.questions:
-            if question.correct == payload["selected"][str(question.id)]:
-                user_score += 1
+        answer_key = get_answer_key(quiz_id)
+        columns = score_columns(quiz_id).get(quiz_id)
+        if answer_key is None or columns is None:
+            return jsonify(message='quiz not found', code=404)
 
-        user_score = Score(user_id=current_user.id, quiz_id=quiz.id,
-                           user_score=user_score, total_score=len(quiz.questions))
-        session.add(user_score)
+        score = Score(user_id=current_user.id, quiz_id=quiz_id,
+                      user_score=grade(answer_key, payload["selected"]),
+                      total_score=len(answer_key), submission_key=key, **columns)
+        session.add(score)
         session.commit()
+        record_score(score)
         return jsonify(message='user score updated!', code=201)
-    except IntegrityError:
-        return jsonify(message='failed to delete quiz', code=409)
+    except (IntegrityError, AttemptClosed):
+        session.rollback()
+        if key is not None and (submission_status(key, current_user.id) or {}).get("status") == "graded":
+            return jsonify(message='user score updated!', code=201)
+        return jsonify(message='quiz already submitted', code=409)
     except Exception as error:
         return jsonify(message=f'unknown error: {error}', code=500)
 
 
-@routes.route('/api/user/stats', methods=('GET',))
+def queue_submission(quiz_id: int, selected: dict, key: str | None, attempt: Attempt | None = None):
+    if get_answer_key(quiz_id) is None:
+        return jsonify(message='quiz not found', code=404)
+    # one score per user and quiz, so that pair is a safe default key
+    key = key or f"{current_user.id}-{quiz_id}"
+    enqueue_submission(key, current_user.id, quiz_id, selected,
+                       attempt.id if attempt is not None else None)
+    return make_response(jsonify(message='submission queued', code=202, submission=key), 202)
+
+
+@routes.route('/api/submissions/<key>', methods=('GET',))
+@jwt_required()
+def submission(key):
+    status = submission_status(key, current_user.id)
+    if status is None:
+        return make_response('submission not found', 404)
+    return jsonify(status)
+
+
+def attempt_json(attempt: Attempt) -> dict:
+    return {
+        "id": attempt.id,
+        "quiz_id": attempt.quiz_id,
+        "started_at": attempt.started_at,
+        "deadline": attempt.deadline,
+        "remaining": remaining_seconds(attempt),
+        "finished": attempt.finished_at is not None,
+        "answers": current_answers(attempt),
+    }
+
+
+@routes.route('/api/quiz/<int:quiz_id>/attempt', methods=('POST',))
+@jwt_required()
+def start_quiz_attempt(quiz_id):
+    attempt = start_attempt(current_user.id, quiz_id)
+    if attempt is None:
+        return make_response('quiz not found', 404)
+    return jsonify(attempt=attempt_json(attempt))
+
+
+@routes.route('/api/attempts/<int:attempt_id>', methods=('GET',))
+@jwt_required()
+def quiz_attempt(attempt_id):
+    attempt = get_attempt(attempt_id, current_user.id)
+    if attempt is None:
+        return make_response('attempt not found', 404)
+    return jsonify(attempt=attempt_json(attempt))
+
+
+@routes.route('/api/attempts/<int:attempt_id>/answers', methods=('PUT',))
+@jwt_required()
+def autosave_attempt(attempt_id):
+    attempt = get_attempt(attempt_id, current_user.id)
+    if attempt is None:
+        return make_response('attempt not found', 404)
+    try:
+        save_answers(attempt, request.get_json()["selected"])
+        return make_response({"remaining": remaining_seconds(attempt)}, 202)
+    except AttemptClosed:
+        return make_response('attempt is closed', 409)
+
+
+@routes.route('/api/attempts/<int:attempt_id>/finish', methods=('POST',))
+@jwt_required()
+def finish_quiz_attempt(attempt_id):
+    attempt = get_attempt(attempt_id, current_user.id)
+    if attempt is None:
+        return make_response('attempt not found', 404)
+    key = request.headers.get("Idempotency-Key")
+    try:
+        payload = request.get_json(silent=True) or {}
+        if current_app.config["GRADING_QUEUE"]:
+            return queue_submission(
+                attempt.quiz_id, final_answers(attempt, payload.get("selected")), key, attempt)
+        score = finish_attempt(attempt, payload.get("selected"), key)
+        record_score(score)
+        return jsonify(message='user score updated!', code=201,
+                       score=score.user_score, total=score.total_score)
+    except (IntegrityError, AttemptClosed):
+        session.rollback()
+        return make_response('quiz already submitted', 409)
+
+
+@routes.route('/api/leaderboard', methods=('GET',), defaults={'kind': 'global', 'key': 0})
+@routes.route('/api/leaderboard/<any(quiz, subject):kind>/<int:key>', methods=('GET',))
+@jwt_required()
+def ranking(kind, key):
+    limit = max(1, min(request.args.get("limit", 10, type=int),
+                       current_app.config["LEADERBOARD_SIZE_MAX"]))
+    return jsonify(board=kind, key=key, **leaderboard(kind, key, current_user.id, limit))
+
+
+def as_of() -> str | None:
+    # when the data behind a stats response was copied, None when it is live
+    return copied.isoformat() if (copied := analytics_as_of()) else None
+
+
+def score_fingerprint(user_id: int | None = None) -> str:
+    # changes whenever scores visible to analytics, the user's or everyone's,
+    # are added or removed
+    query = select(func.count(Score.id), func.max(Score.id))
+    if user_id is not None:
+        query = query.where(Score.user_id == user_id)
+    count, last_id = analytics.execute(query).one()
+    return f"{count}-{last_id}"
+
+
+@routes.route('/api/user/stats', methods=('POST',))
 @jwt_required()
 def user_stats():
-    result = compute_user_statistics.delay(dict(
-        email=current_user.email,
-        scores=[dict(
-            subject=score.quiz.subject.name,
-            date_of_quiz=score.quiz.date_of_quiz,
-            user_score=score.user_score,
-            total_score=score.total_score,
-        ) for score in current_user.scores],
-    ))
-    while not result.ready():
-        pass
-    [by_subject, by_month] = result.get()
-    return jsonify({
-        "by_subject": by_subject,
-        "by_month": by_month
-    })
+    fingerprint = score_fingerprint(current_user.id)
+    cached = user_stats_cache.get(current_user.id)
+    if cached is not None and cached["fingerprint"] == fingerprint:
+        return with_staleness(make_response({"status": "done", **cached["stats"]}, 200))
+
+    result = enqueue("compute_user_statistics", dict(
+        id=current_user.id, email=current_user.email))
+    stats_jobs().set(result.id, dict(
+        user_id=current_user.id, fingerprint=fingerprint, as_of=as_of()))
+    return make_response({"status": "pending", "job_id": result.id}, 202)
+
+
+@routes.route('/api/user/stats/data', methods=('GET',))
+@jwt_required()
+def user_stats_data():
+    count, last_id, last_modified = analytics.execute(
+        select(func.count(Score.id), func.max(Score.id), func.max(Score.submitted_at))
+        .where(Score.user_id == current_user.id)).one()
+    copied = as_of()
+    return with_staleness(conditional_json(
+        f"user-{current_user.id}-{count}-{last_id}-{copied or 'live'}", last_modified,
+        lambda: dict(user_statistics(current_user.id), as_of=copied)))
+
+
+@routes.route('/api/user/stats/<job_id>', methods=('GET',))
+@jwt_required()
+def user_stats_job(job_id):
+    job = stats_jobs().get(job_id)
+    if job is None or job["user_id"] != current_user.id:
+        return make_response('job not found', 404)
+
+    # long-poll for at most STATS_JOB_MAX_WAIT seconds
+    result = job_result(job_id)
+    timeout = min(request.args.get("timeout", 0, type=float),
+                  current_app.config["STATS_JOB_MAX_WAIT"])
+    if not result.ready() and timeout > 0:
+        try:
+            result.get(timeout=timeout, propagate=False)
+        except TimeoutError:
+            pass
+    if not result.ready():
+        return make_response({"status": "pending", "job_id": job_id}, 202)
+    if not result.successful() or not result.result:
+        stats_jobs().delete(job_id)
+        return make_response({"status": "failed", "job_id": job_id}, 500)
+
+    [by_subject, by_month] = result.result
+    stats = {"by_subject": by_subject, "by_month": by_month, "as_of": job.get("as_of")}
+    user_stats_cache.set(current_user.id, dict(
+        fingerprint=job["fingerprint"], stats=stats))
+    return with_staleness(make_response({"status": "done", **stats}, 200))
 
 
 @routes.route('/api/admin/stats', methods=('GET',))
 @jwt_required()
 def admin_stats():
-    by_month = "admin_month_wise.png"
-    by_subject = "admin_subject_wise.png"
+    if current_user.email != 'admin@qm.xyz':
+        return make_response('admin access required', 403)
+    # the refresh_statistics task folds new scores and renders these charts,
+    # this only reads; a chart it has not rendered yet, or one the chart
+    # cache evicted, is null until its next run
+    today = date.today()
+    by_subject = subject_stats()
+    specs = admin_charts(by_subject, month_stats(today), today.month)
+
+    return with_staleness(make_response({
+        "by_subject": rendered_filename(specs[0]),
+        "by_month": rendered_filename(specs[1]),
+        "subjects": by_subject,
+        "as_of": as_of(),
+    }, 200))
+
 
-    compute_monthly_statistics.delay()
+@routes.route('/api/admin/stats/data', methods=('GET',))
+@jwt_required()
+def admin_stats_data():
+    if current_user.email != 'admin@qm.xyz':
+        return make_response('admin access required', 403)
+    # the aggregates change when scores are folded or recomputed after a
+    # delete, the per-quiz series with every score added or removed
+    updated_at = stats_updated_at()
+    copied = as_of()
+    return with_staleness(conditional_json(
+        f"admin-{score_fingerprint()}-{updated_at.timestamp() if updated_at else 0}-{copied or 'live'}",
+        updated_at,
+        lambda: dict(by_subject=subject_stats(), by_month=monthly_series(), by_quiz=quiz_series(),
+                     as_of=copied)))
+
+
+def export_options():
+    # (filters, format, compress) from the request, None if they are invalid
+    format = request.args.get("format", "csv")
+    if format not in FORMATS:
+        return None
+    try:
+        return export_filters(request.args), format, request.args.get("gzip") == "1"
+    except ValueError:
+        return None
+
+
+@routes.route('/api/admin/export/scores', methods=('GET',))
+@jwt_required()
+def stream_scores_export():
+    if current_user.email != 'admin@qm.xyz':
+        return make_response('admin access required', 403)
+    if (options := export_options()) is None:
+        return make_response('invalid export options', 400)
+    filters, format, compress = options
+    response = current_app.response_class(
+        stream_with_context(export_chunks(filters, format, compress)),
+        mimetype="application/gzip" if compress else FORMATS[format][0])
+    response.headers["Content-Disposition"] = \
+        f"attachment; filename={export_filename(format, compress)}"
+    return with_staleness(response)
+
+
+@routes.route('/api/admin/export/scores', methods=('POST',))
+@jwt_required()
+def queue_scores_export():
+    if current_user.email != 'admin@qm.xyz':
+        return make_response('admin access required', 403)
+    if (options := export_options()) is None:
+        return make_response('invalid export options', 400)
+    filters, format, compress = options
+    job = enqueue("export_scores", filters, format, compress)
+    return make_response({"status": "pending", "job_id": job.id}, 202)
 
-    return make_response({
-        "by_subject": by_subject,
-        "by_month": by_month
-    }, 200)
+
+@routes.route('/api/admin/export/<job_id>', methods=('GET',))
+@jwt_required()
+def scores_export(job_id):
+    if current_user.email != 'admin@qm.xyz':
+        return make_response('admin access required', 403)
+    result = job_result(job_id)
+    if not result.ready():
+        return make_response({"status": "pending", "job_id": job_id}, 202)
+    if not result.successful():
+        return make_response({"status": "failed", "job_id": job_id}, 500)
+    return send_from_directory(
+        os.path.abspath(current_app.config["EXPORT_DIRECTORY"]), result.result, as_attachment=True)
+
+
+@routes.route('/api/admin/archive', methods=('POST',))
+@jwt_required()
+def queue_archive():
+    if current_user.email != 'admin@qm.xyz':
+        return make_response('admin access required', 403)
+    # quizzes held before `before`, ARCHIVE_AFTER_DAYS ago by default
+    before = request.args.get("before")
+    if before is None and not current_app.config["ARCHIVE_AFTER_DAYS"]:
+        return make_response('archiving is disabled, pass before', 400)
+    try:
+        if before is not None:
+            before = date.fromisoformat(before).isoformat()
+    except ValueError:
+        return make_response('invalid date', 400)
+    job = enqueue("archive_quizzes", before)
+    return make_response({"status": "pending", "job_id": job.id}, 202)
+
+
+@routes.route('/api/admin/archive/<job_id>', methods=('GET',))
+@jwt_required()
+def archive_status(job_id):
+    if current_user.email != 'admin@qm.xyz':
+        return make_response('admin access required', 403)
+    result = job_result(job_id)
+    if not result.ready():
+        return make_response({"status": "pending", "job_id": job_id}, 202)
+    if not result.successful():
+        return make_response({"status": "failed", "job_id": job_id}, 500)
+    return make_response({"status": "done", "job_id": job_id, "archived": result.result}, 200)
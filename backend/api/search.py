@@ -0,0 +1,140 @@
+import re
+from sqlalchemy import select, text
+from api.database import session
+from api.models import Subject, Chapter, Quiz, Question
+
+
+# one row per searchable record, the rowid encodes kind and id so rows can
+# be replaced and deleted without scanning the index
+KINDS = ("subject", "chapter", "quiz", "question")
+CREATE_SEARCH_INDEX = """
+CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+    kind UNINDEXED, title, body, subject_id UNINDEXED, quiz_id UNINDEXED,
+    tokenize = 'porter unicode61'
+)
+"""
+# title matches weigh more than body matches
+SEARCH = """
+SELECT rowid, kind, title, snippet(search_index, 2, '[', ']', '...', 12) AS snippet,
+       subject_id, quiz_id, bm25(search_index, 0.0, 10.0, 1.0, 0.0, 0.0) AS score
+FROM search_index
+WHERE search_index MATCH :query {kind}
+ORDER BY score, rowid
+LIMIT :limit OFFSET :offset
+"""
+
+
+def rowid(kind: str, id: int) -> int:
+    return id * len(KINDS) + KINDS.index(kind)
+
+
+def match_query(terms: str) -> str | None:
+    # quote every word so user input can never be read as FTS5 syntax, the
+    # last word also matches as a prefix for search-as-you-type
+    words = re.findall(r"\w+", terms)
+    if not words:
+        return None
+    return " ".join(f'"{word}"' for word in words) + "*"
+
+
+def available(connection) -> bool:
+    # FTS5 is SQLite only, other databases go without search
+    dialect = connection.dialect if hasattr(connection, "dialect") else connection.get_bind().dialect
+    return dialect.name == "sqlite"
+
+
+def index_rows(connection, rows: list[dict]):
+    if not rows or not available(connection):
+        return
+    for row in rows:
+        row["rowid"] = rowid(row["kind"], row.pop("id"))
+    connection.execute(text("DELETE FROM search_index WHERE rowid = :rowid"), rows)
+    connection.execute(text(
+        "INSERT INTO search_index (rowid, kind, title, body, subject_id, quiz_id) "
+        "VALUES (:rowid, :kind, :title, :body, :subject_id, :quiz_id)"), rows)
+
+
+def subject_rows(subjects: list[Subject], chapters: list[Chapter]) -> list[dict]:
+    return [
+        dict(kind="subject", id=subject.id, title=subject.name, body=subject.description or "",
+             subject_id=subject.id, quiz_id=None)
+        for subject in subjects
+    ] + [
+        dict(kind="chapter", id=chapter.id, title=chapter.name, body=chapter.description or "",
+             subject_id=chapter.subject_id, quiz_id=None)
+        for chapter in chapters
+    ]
+
+
+def quiz_rows(quizzes: list[Quiz]) -> list[dict]:
+    rows = []
+    for quiz in quizzes:
+        rows.append(dict(kind="quiz", id=quiz.id, title=quiz.name, body=quiz.remarks or "",
+                         subject_id=quiz.subject_id, quiz_id=quiz.id))
+        rows.extend(
+            dict(kind="question", id=question.id, title="", body=question.statement,
+                 subject_id=quiz.subject_id, quiz_id=quiz.id)
+            for question in quiz.questions)
+    return rows
+
+
+def index_subject(subject: Subject, chapters: list[Chapter]):
+    index_rows(session, subject_rows([subject], chapters))
+
+
+def index_quizzes(quizzes: list[Quiz]):
+    index_rows(session, quiz_rows(quizzes))
+
+
+def unindex(kind: str, *ids: int):
+    if ids and available(session):
+        session.execute(text("DELETE FROM search_index WHERE rowid = :rowid"),
+                        [{"rowid": rowid(kind, id)} for id in ids])
+
+
+def unindex_subject(subject_id: int):
+    # call before deleting the subject, its chapters, quizzes and questions go too
+    quiz_ids = session.execute(select(Quiz.id).where(Quiz.subject_id == subject_id)).scalars().all()
+    unindex("subject", subject_id)
+    unindex("chapter", *session.execute(
+        select(Chapter.id).where(Chapter.subject_id == subject_id)).scalars())
+    unindex_quizzes(*quiz_ids)
+
+
+def unindex_quizzes(*quiz_ids: int):
+    unindex("quiz", *quiz_ids)
+    unindex("question", *session.execute(
+        select(Question.id).where(Question.quiz_id.in_(quiz_ids))).scalars())
+
+
+def rebuild_search_index(connection):
+    connection.execute(text("DELETE FROM search_index"))
+    chapters = connection.execute(select(Chapter.id, Chapter.name, Chapter.description, Chapter.subject_id)).all()
+    index_rows(connection, subject_rows(
+        connection.execute(select(Subject.id, Subject.name, Subject.description)).all(), chapters))
+    index_rows(connection, [
+        dict(kind="quiz", id=quiz.id, title=quiz.name, body=quiz.remarks or "",
+             subject_id=quiz.subject_id, quiz_id=quiz.id)
+        for quiz in connection.execute(select(Quiz.id, Quiz.name, Quiz.remarks, Quiz.subject_id))
+    ])
+    index_rows(connection, [
+        dict(kind="question", id=question.id, title="", body=question.statement,
+             subject_id=question.subject_id, quiz_id=question.quiz_id)
+        for question in connection.execute(
+            select(Question.id, Question.statement, Question.quiz_id, Quiz.subject_id)
+            .join(Quiz, Question.quiz_id == Quiz.id))
+    ])
+
+
+def search(terms: str, kind: str | None, limit: int, offset: int) -> list[dict]:
+    if (query := match_query(terms)) is None or not available(session):
+        return []
+    params = dict(query=query, limit=limit, offset=offset)
+    if kind is not None:
+        params["kind"] = kind
+    return [
+        dict(kind=row.kind, id=row.rowid // len(KINDS), title=row.title, snippet=row.snippet,
+             subject_id=row.subject_id, quiz_id=row.quiz_id)
+        for row in session.execute(
+            text(SEARCH.format(kind="AND kind = :kind" if kind is not None else "")), params)
+    ]
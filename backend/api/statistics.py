@@ -0,0 +1,262 @@
+import numpy as np
+from itertools import chain
+from datetime import date, datetime
+from api.database import session, upsert
+from api.analytics import analytics
+from sqlalchemy import select, insert, update, delete, func, extract, case, tuple_
+from api.models import Score, Quiz, Subject, SubjectMonthStat, StatWatermark
+
+
+SUBJECT_MONTH_STAT = "subject_month_stat"
+
+
+def subject_month():
+    return Quiz.subject_id, extract("year", Quiz.date_of_quiz), extract("month", Quiz.date_of_quiz)
+
+
+def score_aggregates(*where):
+    # one row of subject_month_stat columns per (subject, year, month),
+    # followed by the highest score id in the group
+    ratio = case((Score.total_score > 0, Score.user_score * 1.0 / Score.total_score), else_=0.0)
+    return (
+        select(
+            *subject_month(),
+            func.count(Score.id), func.sum(Score.user_score), func.sum(Score.total_score),
+            func.sum(ratio), func.max(ratio), func.max(Score.id))
+        .join(Quiz, Score.quiz_id == Quiz.id)
+        .where(*where)
+        .group_by(*subject_month()))
+
+
+def stat_watermark() -> StatWatermark:
+    watermark = session.get(StatWatermark, SUBJECT_MONTH_STAT)
+    if watermark is None:
+        watermark = StatWatermark(name=SUBJECT_MONTH_STAT, last_score_id=0)
+        session.add(watermark)
+        session.flush()
+    return watermark
+
+
+# fold scores inserted since the last run into subject_month_stat and
+# return the number of newly absorbed scores
+def refresh_subject_stats() -> int:
+    last_score_id = stat_watermark().last_score_id
+    deltas = session.execute(score_aggregates(Score.id > last_score_id)).all()
+    if not deltas:
+        session.rollback()
+        return 0
+
+    for subject_id, year, month, attempts, user_score, total_score, ratio_sum, max_ratio, _ in deltas:
+        stmt = upsert(SubjectMonthStat).values(
+            subject_id=subject_id, year=year, month=month, attempts=attempts,
+            user_score=user_score, total_score=total_score,
+            ratio_sum=ratio_sum, max_ratio=max_ratio)
+        session.execute(stmt.on_conflict_do_update(
+            index_elements=["subject_id", "year", "month"],
+            set_=dict(
+                attempts=SubjectMonthStat.attempts + stmt.excluded.attempts,
+                user_score=SubjectMonthStat.user_score + stmt.excluded.user_score,
+                total_score=SubjectMonthStat.total_score + stmt.excluded.total_score,
+                ratio_sum=SubjectMonthStat.ratio_sum + stmt.excluded.ratio_sum,
+                updated_at=func.current_timestamp(),
+                max_ratio=case(
+                    (stmt.excluded.max_ratio > SubjectMonthStat.max_ratio, stmt.excluded.max_ratio),
+                    else_=SubjectMonthStat.max_ratio),
+            )))
+
+    # advance the watermark only if no concurrent refresh got there first
+    advanced = session.execute(
+        update(StatWatermark)
+        .where(StatWatermark.name == SUBJECT_MONTH_STAT,
+               StatWatermark.last_score_id == last_score_id)
+        .values(last_score_id=max(row[-1] for row in deltas))
+    ).rowcount
+    if not advanced:
+        session.rollback()
+        return 0
+    session.commit()
+    return sum(row[3] for row in deltas)
+
+
+def subject_month_keys(*quiz_ids: int) -> list[tuple[int, int, int]]:
+    # the (subject, year, month) aggregates scores of these quizzes are in
+    return [tuple(key) for key in session.execute(
+        select(*subject_month()).where(Quiz.id.in_(quiz_ids)).distinct())]
+
+
+def recompute_subject_stats(keys: list[tuple[int, int, int]]):
+    # scores in these aggregates were removed, rebuild just them from the
+    # scores that remain up to the watermark; call in the deleting
+    # transaction, newer scores are folded by the next refresh as usual
+    if not keys:
+        return
+    last_score_id = stat_watermark().last_score_id
+    session.execute(delete(SubjectMonthStat).where(tuple_(
+        SubjectMonthStat.subject_id, SubjectMonthStat.year, SubjectMonthStat.month).in_(keys)))
+    rows = session.execute(score_aggregates(
+        Score.id <= last_score_id, tuple_(*subject_month()).in_(keys))).all()
+    if rows:
+        session.execute(insert(SubjectMonthStat), [
+            dict(subject_id=subject_id, year=year, month=month, attempts=attempts,
+                 user_score=user_score, total_score=total_score,
+                 ratio_sum=ratio_sum, max_ratio=max_ratio)
+            for subject_id, year, month, attempts, user_score, total_score, ratio_sum, max_ratio, _ in rows
+        ])
+
+
+# the readers from here on go through the analytics connection
+def subject_stats() -> list[dict]:
+    return [
+        {
+            "subject": name,
+            "attempts": attempts,
+            "user_score": user_score,
+            "total_score": total_score,
+            "average": ratio_sum / attempts if attempts else 0,
+            "max_score": max_ratio,
+        }
+        for name, attempts, user_score, total_score, ratio_sum, max_ratio in analytics.execute(
+            select(
+                Subject.name,
+                func.sum(SubjectMonthStat.attempts), func.sum(SubjectMonthStat.user_score),
+                func.sum(SubjectMonthStat.total_score), func.sum(SubjectMonthStat.ratio_sum),
+                func.max(SubjectMonthStat.max_ratio))
+            .join(Subject, SubjectMonthStat.subject_id == Subject.id)
+            .group_by(Subject.id)
+            .order_by(Subject.name))
+    ]
+
+
+def monthly_series() -> list[dict]:
+    return [
+        {
+            "subject": name,
+            "year": year,
+            "month": month,
+            "attempts": attempts,
+            "user_score": user_score,
+            "total_score": total_score,
+            "average": ratio_sum / attempts if attempts else 0,
+            "max_score": max_ratio,
+        }
+        for name, year, month, attempts, user_score, total_score, ratio_sum, max_ratio in analytics.execute(
+            select(
+                Subject.name, SubjectMonthStat.year, SubjectMonthStat.month,
+                SubjectMonthStat.attempts, SubjectMonthStat.user_score,
+                SubjectMonthStat.total_score, SubjectMonthStat.ratio_sum,
+                SubjectMonthStat.max_ratio)
+            .join(Subject, SubjectMonthStat.subject_id == Subject.id)
+            .order_by(SubjectMonthStat.year, SubjectMonthStat.month, Subject.name))
+    ]
+
+
+def quiz_series() -> list[dict]:
+    ratio = case((Score.total_score > 0, Score.user_score * 1.0 / Score.total_score), else_=0.0)
+    return [
+        {
+            "quiz_id": quiz_id,
+            "quiz": name,
+            "attempts": attempts,
+            "average": average,
+            "max_score": max_score,
+        }
+        for quiz_id, name, attempts, average, max_score in analytics.execute(
+            select(Quiz.id, Quiz.name, func.count(Score.id), func.avg(ratio), func.max(ratio))
+            .join(Score, Score.quiz_id == Quiz.id)
+            .group_by(Quiz.id)
+            .order_by(Quiz.id))
+    ]
+
+
+def stats_updated_at() -> datetime | None:
+    # when scores were last folded into, or recomputed in, the aggregates
+    return analytics.execute(select(func.max(SubjectMonthStat.updated_at))).scalar()
+
+
+def month_stats(day: date) -> list[dict]:
+    return [
+        {"subject": name, "attempts": attempts}
+        for name, attempts in analytics.execute(
+            select(Subject.name, SubjectMonthStat.attempts)
+            .join(Subject, SubjectMonthStat.subject_id == Subject.id)
+            .where(SubjectMonthStat.year == day.year, SubjectMonthStat.month == day.month)
+            .order_by(Subject.name))
+    ]
+
+
+SCORE_COLUMNS = ("user_id", "quiz_id", "subject_id", "year", "month", "user_score", "total_score")
+
+
+def score_frame(user_id: int | None = None) -> dict[str, np.ndarray]:
+    # every score as columnar int64 arrays, pulled with one joined query
+    query = (
+        select(
+            Score.user_id, Score.quiz_id, Quiz.subject_id,
+            extract("year", Quiz.date_of_quiz), extract("month", Quiz.date_of_quiz),
+            Score.user_score, Score.total_score)
+        .join(Quiz, Score.quiz_id == Quiz.id))
+    if user_id is not None:
+        query = query.where(Score.user_id == user_id)
+    rows = analytics.execute(query).all()
+    values = np.fromiter(chain.from_iterable(rows), dtype=np.int64,
+                         count=len(rows) * len(SCORE_COLUMNS)).reshape(len(rows), len(SCORE_COLUMNS))
+    return {name: values[:, index] for index, name in enumerate(SCORE_COLUMNS)}
+
+
+def aggregate(frame: dict[str, np.ndarray], *by: str, percentiles=(50, 90)) -> list[dict]:
+    # group-by over the frame: one output row per distinct combination of `by`
+    if not len(frame["user_score"]):
+        return []
+    user_score = frame["user_score"].astype(np.float64)
+    total_score = frame["total_score"].astype(np.float64)
+    ratio = np.divide(user_score, total_score,
+                      out=np.zeros_like(user_score), where=total_score > 0)
+
+    # factorize each key column, then group on the combined 1-d code
+    levels, codes = zip(*(np.unique(frame[column], return_inverse=True) for column in by))
+    groups, inverse = np.unique(
+        np.ravel_multi_index(codes, [len(level) for level in levels]), return_inverse=True)
+    keys = np.stack([level[code] for level, code in zip(
+        levels, np.unravel_index(groups, [len(level) for level in levels]))], axis=1)
+    attempts = np.bincount(inverse, minlength=len(keys))
+
+    # sort ratios within each group so percentiles and max are index lookups
+    ordered = ratio[np.lexsort((ratio, inverse))]
+    starts = np.cumsum(attempts) - attempts
+    result = {
+        "attempts": attempts,
+        "user_score": np.bincount(inverse, weights=user_score, minlength=len(keys)),
+        "total_score": np.bincount(inverse, weights=total_score, minlength=len(keys)),
+        "average": np.bincount(inverse, weights=ratio, minlength=len(keys)) / attempts,
+        "max": ordered[starts + attempts - 1],
+    }
+    for percentile in percentiles:
+        position = starts + (attempts - 1) * percentile / 100
+        lower, upper = np.floor(position).astype(np.int64), np.ceil(position).astype(np.int64)
+        result[f"p{percentile}"] = ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+    return [
+        {
+            **{column: int(value) for column, value in zip(by, key)},
+            **{name: column[index].item() for name, column in result.items()},
+        }
+        for index, key in enumerate(keys)
+    ]
+
+
+def subject_names() -> dict[int, str]:
+    return dict(analytics.execute(select(Subject.id, Subject.name)).all())
+
+
+def user_statistics(user_id: int | None = None) -> dict[str, list[dict]]:
+    # per-subject, per-month and per-quiz aggregates for one user or everyone
+    frame = score_frame(user_id)
+    names = subject_names()
+    by_subject = aggregate(frame, "subject_id")
+    for subject in by_subject:
+        subject["subject"] = names.get(subject["subject_id"], "")
+    return {
+        "by_subject": by_subject,
+        "by_month": aggregate(frame, "year", "month"),
+        "by_quiz": aggregate(frame, "quiz_id"),
+    }
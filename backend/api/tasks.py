@@ -1,122 +1,98 @@
-from sqlalchemy import select
+import logging
 from celery import shared_task
-from api.database import session
-from api.models import Score, User
-from matplotlib import pyplot as plt
-import seaborn as sns
-from datetime import datetime
+from flask import current_app
+from datetime import date, timedelta
+from api.attempts import flush_autosaves
+from api.grading import grade_pending, submissions
+from api.analytics import refresh_stale_snapshot
+from api.archive import archive_quizzes
+from api.export import write_export, export_filename
+from api.charts import render_chart, user_charts, admin_charts
+from api.statistics import (
+    refresh_subject_stats, subject_stats, month_stats,
+    score_frame, subject_names, aggregate)
 
 
-MONTHS = [
-    "January", "February", "March", "April", "May", "June",
-    "July", "August", "September", "October", "November", "December"
-]
+logger = logging.getLogger(__name__)
 
 
 @shared_task(name="compute_user_statistics", ignore_results=False)
 def compute_user_statistics(user: dict) -> tuple[str, str] | tuple:
-    sns.set_theme(style="whitegrid")
-
     try:
-        by_month = {}
-        by_subject = {}
-
-        default_subject = {
-            "scores": [],
-            "average": 0,
-            "total": 0,
-            "score": 0,
-        }
-
-        for score in user["scores"]:
-            # add subject if not exists
-            if score["subject"] not in by_subject:
-                by_subject[score["subject"]] = {
-                    "name": score["subject"],
-                    **default_subject
-                }
-            # add user attempt by month
-            if score["date_of_quiz"].month not in by_month:
-                by_month[score["date_of_quiz"].month] = {
-                    "month": score["date_of_quiz"].month, "count": 0}
-            # increment user attempt count
-            by_month[score["date_of_quiz"].month]["count"] += 1
-            # add user attempt by subject
-            by_subject[score["subject"]]["scores"].append({
-                "total": score["total_score"],
-                "correct": score["user_score"],
-                "date_of_quiz": score["date_of_quiz"],
-            })
-            # compute total score and user score
-            by_subject[score["subject"]]["total"] += score["total_score"]
-            by_subject[score["subject"]]["score"] += score["user_score"]
-        # compute average score for each subject
-        for subject in by_subject.values():
-            subject["average"] = subject["score"] / subject["total"]
-
-        # plot the subject-wise user scores
-        fig = plt.figure()
-        plt.bar(by_subject.keys(), [subject["score"]
-                for subject in by_subject.values()])
-        plt.xlabel("Subjects")
-        plt.ylabel("Total score by subject")
-        filename_by_subject = f"by_subject-{hash(user["email"])}.png"
-        fig.savefig(f"static/images/{filename_by_subject}")
-        fig = plt.figure()
-        # plot the month-wise user attempts
-        plt.pie(
-            [month["count"] for month in by_month.values()],
-            labels=[
-                f'{MONTHS[month-1]} ({by_month[month]["count"]})' for month in by_month],
-            labeldistance=1.125)
-        plt.xlabel("Month wise quiz attempts")
-        filename_by_month = f"by_month-{hash(user["email"])}.png"
-        fig.savefig(f"static/images/{filename_by_month}")
-
-        return (filename_by_subject, filename_by_month)
-    except Exception as error:
-        print('CELERY ERROR:', error)
+        frame = score_frame(user["id"])
+        names = subject_names()
+        by_subject = aggregate(frame, "subject_id")
+        for subject in by_subject:
+            subject["subject"] = names.get(subject["subject_id"], "")
+
+        return tuple(render_chart(spec) for spec in user_charts(
+            by_subject, aggregate(frame, "month")))
+    except Exception:
+        logger.exception('failed to compute statistics')
         return tuple()
 
 
 @shared_task(name="compute_monthly_statistics", ignore_results=False)
 def compute_monthly_statistics() -> tuple[str, str] | tuple:
-    sns.set_theme(style="whitegrid")
-
     try:
-        by_subject = {}
-        # compute subject-wise max scores and monthly user attempts
-        for score in session.execute(select(Score)).scalars():
-            if score.quiz.subject.name not in by_subject:
-                by_subject[score.quiz.subject.name] = {
-                    "max_score": 0,
-                    "user_count": 0
-                }
-            by_subject[score.quiz.subject.name]["max_score"] = max(
-                by_subject[score.quiz.subject.name]["max_score"], score.user_score / score.total_score)
-            by_subject[score.quiz.subject.name]["user_count"] += 1
-
-        # compute max scores by subject
-        fig = plt.figure()
-        plt.bar(by_subject.keys(), [subject["max_score"]
-                for subject in by_subject.values()])
-        plt.xlabel("Subjects")
-        plt.ylabel("Max Score")
-        filename_subjects = "static/images/admin_subject_wise.png"
-        fig.savefig(filename_subjects)
-        # compute monthly user attempts by subject
-        fig = plt.figure()
-        plt.pie(
-            [by_subject[subject]["user_count"] for subject in by_subject],
-            labels=[f'{subject} ({values["user_count"]})' for subject,
-                    values in by_subject.items()],
-            rotatelabels=True,
-            labeldistance=0.5)
-        plt.xlabel(MONTHS[datetime.now().month-1])
-        filename_user_count = "static/images/admin_month_wise.png"
-        fig.savefig(filename_user_count)
-
-        return (filename_subjects, filename_user_count)
-    except Exception as error:
-        print('CELERY ERROR:', error)
+        # absorb new scores, unchanged aggregates hit the chart cache
+        refresh_subject_stats()
+        today = date.today()
+        return tuple(render_chart(spec) for spec in admin_charts(
+            subject_stats(), month_stats(today), today.month))
+    except Exception:
+        logger.exception('failed to compute statistics')
         return tuple()
+
+
+@shared_task(name="refresh_statistics")
+def refresh_statistics() -> int:
+    # fold scores submitted since the last run into subject_month_stat and
+    # render the admin charts for them, so the stats endpoints only read
+    folded = refresh_subject_stats()
+    today = date.today()
+    for spec in admin_charts(subject_stats(), month_stats(today), today.month):
+        render_chart(spec)
+    return folded
+
+
+@shared_task(name="flush_autosaves")
+def flush_attempt_autosaves() -> int:
+    return flush_autosaves()
+
+
+@shared_task(name="grade_submissions")
+def grade_submissions() -> int:
+    # batches of a worker that died while grading are picked up again
+    submissions.recover(current_app.config["GRADING_ACK_TIMEOUT"])
+    graded = 0
+    while count := grade_pending(current_app.config["GRADING_BATCH_SIZE"]):
+        graded += count
+    return graded
+
+
+@shared_task(name="refresh_analytics_snapshot")
+def refresh_analytics_snapshot() -> bool:
+    # fold new scores first so the copy carries current aggregates, the
+    # age limit is a little under the interval so a beat tick is never skipped
+    refresh_subject_stats()
+    return refresh_stale_snapshot(current_app.config["ANALYTICS_SNAPSHOT_INTERVAL"] * 0.9)
+
+
+@shared_task(name="export_scores", ignore_results=False)
+def export_scores(filters: dict, format: str, compress: bool) -> str:
+    # the file name is unique per job so concurrent exports never collide
+    name = f"{export_scores.request.id}-{export_filename(format, compress)}"
+    return write_export(current_app.config["EXPORT_DIRECTORY"], name, filters, format, compress)
+
+
+@shared_task(name="archive_quizzes", ignore_results=False)
+def archive_old_quizzes(before: str | None = None) -> int:
+    # defaults to ARCHIVE_AFTER_DAYS before today, batches commit one by one
+    # so writers are never locked out for the whole run
+    if before is None:
+        before = (date.today() - timedelta(days=current_app.config["ARCHIVE_AFTER_DAYS"])).isoformat()
+    archived = 0
+    while count := archive_quizzes(date.fromisoformat(before), current_app.config["ARCHIVE_BATCH_SIZE"]):
+        archived += count
+    return archived
@@ -1,19 +1,31 @@
+import os
 from api.database import *
 from flask_cors import CORS
 from api.routes import routes
+from api.assets import assets
+from api.analytics import init_analytics
+from api.auth import init_auth
+from api.cache import init_cache
+from api.catalog import init_catalog
+from api.attempts import init_attempts
+from api.leaderboard import init_leaderboards
+from api.metrics import init_metrics
+from api.migrations import check_query_plans
 from flask import Flask, jsonify
-from api.resources import api, jwt
-from celery.schedules import crontab
+from api.resources import api, jwt, init_identities
 from api.celery_init import celery_init_app
-from api.tasks import compute_monthly_statistics
+from api.grading import init_grading
 from flask_restful import NotFound, MethodNotAllowed
-from api.config import LocalDevelopmentConfig, ProductionConfig
+from api.config import LocalDevelopmentConfig, ProductionConfig, TestingConfig
 
 
-def create_app():
-    app = Flask(__name__)
+def create_app(config=None):
+    # static files are served by the assets blueprint
+    app = Flask(__name__, static_folder=None)
     # update app config
-    if app.config.get("DEBUG"):
+    if config is not None:
+        app.config.from_object(config)
+    elif app.config.get("DEBUG"):
         app.config.from_object(LocalDevelopmentConfig)
     else:
         app.config.from_object(ProductionConfig)
@@ -22,28 +34,43 @@ def create_app():
         cors = CORS(app, supports_credentials=True)
     api.init_app(app)
     jwt.init_app(app)
+    # state sized from the config is kept in app.extensions by the init
+    # functions and read through accessors on current_app, so nothing holds
+    # on to the objects of a previous create_app
+    init_auth(app)
+    init_cache(app)
+    init_catalog(app)
+    init_identities(app)
+    init_attempts(app)
+    init_leaderboards(app)
+    init_metrics(app)
+    init_grading(app)
     app.app_context().push()
 
     return app
 
 
 # initialize the app
-app = create_app()
+app = create_app(TestingConfig if os.environ.get("QUIZ_MASTER_TESTING") else None)
 # initialize the database
 init_db(app)
+# statistics and exports read through their own connection
+init_analytics(app)
 # initialize celery app
+# tasks are registered by worker.py, the web app enqueues them by name
 celery = celery_init_app(app)
-celery.autodiscover_tasks()
 app.register_blueprint(routes)
+app.register_blueprint(assets)
 
 
-@celery.on_after_finalize.connect
-def setup_periodic_tasks(sender, **kwargs):
-    sender.add_periodic_task(
-        crontab(0, 0, month_of_year='*'),
-        compute_monthly_statistics.s(),
-        name='update monthly statistics',
-    )
+@app.cli.command("check-query-plans")
+def check_plans():
+    problems = check_query_plans(session.get_bind())
+    for problem in problems:
+        print("table scan in", problem)
+    if problems:
+        raise SystemExit(1)
+    print("all hot queries use indexes")
 
 
 @app.errorhandler(NotFound)
@@ -0,0 +1,121 @@
+# burst of concurrent quiz submissions against a scratch SQLite file,
+# comparing one transaction per submit with the batched grading queue
+#
+#   cd backend && python -m benchmarks.grading_load [submissions] [concurrency]
+import os
+import sys
+import tempfile
+import statistics
+from datetime import date
+from threading import Thread, Event
+from time import perf_counter, sleep
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+from api.config import AppConfig
+from api.database import create_db_engine, session
+from api.models import Base, User, Subject, Chapter, Quiz, Question, Score
+from api.grading import (
+    answer_keys, get_answer_key, grade, score_columns, enqueue_submission, grade_pending,
+    init_grading)
+
+
+QUESTIONS = 20
+# the queue's status cache lives on an app, as in create_app
+app = Flask(__name__)
+app.config.from_object(AppConfig)
+init_grading(app)
+
+
+def setup(config, users):
+    engine = create_db_engine(config)
+    Base.metadata.create_all(engine)
+    with Session(engine) as db:
+        db.add_all(User(name=f"user{i}", password="", email=f"user{i}@qm.xyz",
+                        qualification="PhD", dob=date(2000, 1, 1))
+                   for i in range(users))
+        db.add(Subject(id=1, name="subject"))
+        db.add(Chapter(id=1, name="chapter", subject_id=1))
+        db.add(Quiz(id=1, name="quiz", subject_id=1, chapter_id=1,
+                    date_of_quiz=date.today(), hours=1, minutes=0))
+        db.add_all(Question(id=i + 1, statement=f"q{i}", quiz_id=1, correct=1)
+                   for i in range(QUESTIONS))
+        db.commit()
+    session.configure(bind=engine)
+    answer_keys.clear()
+    return engine
+
+
+def selected(user_id):
+    return {str(question): 1 if (question + user_id) % 3 else 2
+            for question in range(1, QUESTIONS + 1)}
+
+
+def submit_direct(user_id):
+    # same shape as submit_quiz without the queue
+    start = perf_counter()
+    answer_key = get_answer_key(1)
+    session.add(Score(user_id=user_id, quiz_id=1,
+                      user_score=grade(answer_key, selected(user_id)),
+                      total_score=len(answer_key), submission_key=f"{user_id}-1",
+                      **score_columns(1)[1]))
+    session.commit()
+    return perf_counter() - start
+
+
+def submit_queued(user_id):
+    start = perf_counter()
+    with app.app_context():
+        get_answer_key(1)
+        enqueue_submission(f"{user_id}-1", user_id, 1, selected(user_id))
+    return perf_counter() - start
+
+
+def grader(stop: Event):
+    with app.app_context():
+        while not stop.is_set():
+            if not grade_pending(AppConfig.GRADING_BATCH_SIZE):
+                sleep(0.01)
+    session.remove()
+
+
+def run(name, submit, submissions, concurrency, queued=False):
+    with tempfile.TemporaryDirectory() as directory:
+        config = {
+            "DATABASE_URL": f"sqlite:///{os.path.join(directory, 'bench.db')}",
+            "DATABASE_ENGINE_OPTIONS": AppConfig.DATABASE_ENGINE_OPTIONS,
+            "SQLITE_BUSY_TIMEOUT": AppConfig.SQLITE_BUSY_TIMEOUT,
+            "SQLITE_PRAGMAS": AppConfig.SQLITE_PRAGMAS,
+        }
+        engine = setup(config, submissions)
+        stop = Event()
+        worker = Thread(target=grader, args=(stop,))
+        if queued:
+            worker.start()
+
+        start = perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            latencies = sorted(pool.map(submit, range(1, submissions + 1)))
+        acknowledged = perf_counter() - start
+        with Session(engine) as db:
+            while db.execute(select(func.count(Score.id))).scalar() < submissions:
+                sleep(0.01)
+        graded = perf_counter() - start
+        stop.set()
+        if queued:
+            worker.join()
+        session.remove()
+        engine.dispose()
+
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    print(f"{name:<8} p50 {p50:>8.2f}ms  p99 {p99:>8.2f}ms  "
+          f"acked {submissions / acknowledged:>8.1f}/s  graded {submissions / graded:>8.1f}/s")
+
+
+if __name__ == "__main__":
+    submissions = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+    run("direct", submit_direct, submissions, concurrency)
+    run("queued", submit_queued, submissions, concurrency, queued=True)
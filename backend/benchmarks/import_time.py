@@ -0,0 +1,57 @@
+# boot cost of the web and worker entry points: import time, peak RSS and
+# whether the plotting stack was loaded, each measured in a fresh interpreter
+#
+#   cd backend && python -m benchmarks.import_time [runs]
+#
+# exits with status 1 when the web entry point imports matplotlib or seaborn
+import os
+import sys
+import json
+import tempfile
+import statistics
+import subprocess
+
+
+ENTRY_POINTS = ("app", "worker")
+HEAVY = ("matplotlib", "seaborn", "numpy", "api.tasks")
+PROBE = """
+import sys, json, resource
+from time import perf_counter
+start = perf_counter()
+import {module}
+elapsed = perf_counter() - start
+print(json.dumps({{
+    "seconds": elapsed,
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "loaded": [name for name in {heavy!r} if name in sys.modules],
+}}))
+"""
+
+
+def probe(module, env):
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY)],
+        env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+if __name__ == "__main__":
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    failed = False
+    with tempfile.TemporaryDirectory() as directory:
+        env = {
+            **os.environ,
+            "QUIZ_MASTER_TESTING": "1",
+            "DATABASE_URL": f"sqlite:///{os.path.join(directory, 'bench.db')}",
+        }
+        for module in ENTRY_POINTS:
+            samples = [probe(module, env) for _ in range(runs)]
+            loaded = samples[-1]["loaded"]
+            print(f"{module:<8} {statistics.median(s['seconds'] for s in samples):>7.3f}s "
+                  f"{statistics.median(s['rss_mb'] for s in samples):>8.1f}MB  "
+                  f"loaded: {', '.join(loaded) or '-'}")
+            if module == "app" and {"matplotlib", "seaborn", "api.tasks"} & set(loaded):
+                failed = True
+    if failed:
+        print("the web entry point imports the analytics stack")
+        raise SystemExit(1)
@@ -0,0 +1,74 @@
+# burst of concurrent logins for several password hash costs, checking
+# hashes in the request threads against the process pool, with and without
+# admission control; "probe" is the p99 latency of a small pure python task
+# run alongside the burst, standing in for the rest of the traffic
+#
+#   cd backend && python -m benchmarks.login_throughput [logins] [concurrency]
+import os
+import sys
+import statistics
+from threading import Thread, Event
+from time import perf_counter, sleep
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.security import generate_password_hash
+from api.auth import PasswordHasher, Overloaded
+
+
+METHODS = ("pbkdf2:sha256:100000", "pbkdf2:sha256:600000", "scrypt:32768:8:1")
+PASSWORD = "correct horse battery staple"
+
+
+def p99(samples):
+    return samples[max(0, int(len(samples) * 0.99) - 1)] * 1000 if samples else 0.0
+
+
+def probe(stop: Event, samples: list):
+    while not stop.is_set():
+        start = perf_counter()
+        sum(range(20_000))
+        samples.append(perf_counter() - start)
+        sleep(0.005)
+
+
+def run(name, hasher, password_hash, logins, concurrency):
+    def login(_):
+        start = perf_counter()
+        try:
+            assert hasher.check(password_hash, PASSWORD)
+        except Overloaded:
+            return None
+        return perf_counter() - start
+
+    # start the pool outside the measurement
+    hasher.check(password_hash, PASSWORD)
+    stop, probes = Event(), []
+    prober = Thread(target=probe, args=(stop, probes))
+    prober.start()
+    start = perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(login, range(logins)))
+    elapsed = perf_counter() - start
+    stop.set()
+    prober.join()
+    if hasher.pool is not None:
+        hasher.pool.shutdown()
+
+    latencies = sorted(result for result in results if result is not None)
+    print(f"  {name:<12} {len(latencies) / elapsed:>8.1f}/s  "
+          f"p50 {statistics.median(latencies) * 1000 if latencies else 0:>8.1f}ms  "
+          f"p99 {p99(latencies):>8.1f}ms  rejected {logins - len(latencies):>5}  "
+          f"probe p99 {p99(sorted(probes)):>7.2f}ms")
+
+
+if __name__ == "__main__":
+    logins = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+    workers = os.cpu_count() or 1
+    for method in METHODS:
+        password_hash = generate_password_hash(PASSWORD, method)
+        start = perf_counter()
+        generate_password_hash(PASSWORD, method)
+        print(f"{method} ({(perf_counter() - start) * 1000:.1f}ms per hash, {workers} workers)")
+        run("inline", PasswordHasher(), password_hash, logins, concurrency)
+        run("pool", PasswordHasher(workers), password_hash, logins, concurrency)
+        run("pool+limit", PasswordHasher(workers, 4 * workers), password_hash, logins, concurrency)
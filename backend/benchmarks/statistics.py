@@ -0,0 +1,92 @@
+# vectorized statistics against the previous per-row dict aggregation over a
+# synthetic score table
+#
+#   cd backend && python -m benchmarks.statistics [rows]
+import os
+import sys
+import random
+import tempfile
+from time import perf_counter
+from datetime import date
+from sqlalchemy import insert, select
+from api.config import AppConfig
+from api.database import create_db_engine, session
+from api.analytics import analytics
+from api.models import Base, User, Subject, Chapter, Quiz, Score
+from api.statistics import score_frame, aggregate
+
+
+def populate(rows: int):
+    quizzes = 1000
+    users = -(-rows // quizzes)
+    # scores reference users and quizzes, foreign keys are enforced
+    session.execute(insert(User), [
+        dict(id=i, name=f"user{i}", password="", email=f"user{i}@qm.xyz",
+             qualification="PhD", dob=date(2000, 1, 1))
+        for i in range(1, users + 1)])
+    session.execute(insert(Subject), [dict(id=i, name=f"subject{i}") for i in range(1, 21)])
+    session.execute(insert(Chapter), [dict(id=i, name=f"chapter{i}", subject_id=i) for i in range(1, 21)])
+    session.execute(insert(Quiz), [
+        dict(id=i, name=f"quiz{i}", subject_id=i % 20 + 1, chapter_id=i % 20 + 1,
+             date_of_quiz=date(2020 + i % 5, i % 12 + 1, 1), hours=1, minutes=0)
+        for i in range(1, quizzes + 1)])
+    batch = []
+    for index in range(rows):
+        total = random.randint(5, 50)
+        quiz_id = index % quizzes + 1
+        batch.append(dict(user_id=index // quizzes + 1, quiz_id=quiz_id,
+                          user_score=random.randint(0, total), total_score=total,
+                          date_of_quiz=date(2020 + quiz_id % 5, quiz_id % 12 + 1, 1),
+                          subject_id=quiz_id % 20 + 1))
+        if len(batch) == 100_000:
+            session.execute(insert(Score), batch)
+            batch.clear()
+    if batch:
+        session.execute(insert(Score), batch)
+    session.commit()
+    return users
+
+
+def per_row():
+    # the previous approach: ORM rows and nested dict lookups
+    by_subject = {}
+    for score in session.execute(select(Score)).scalars():
+        subject = by_subject.setdefault(score.quiz.subject.name, {"max_score": 0, "user_count": 0})
+        subject["max_score"] = max(subject["max_score"], score.user_score / score.total_score)
+        subject["user_count"] += 1
+    return by_subject
+
+
+def timed(name, function):
+    start = perf_counter()
+    result = function()
+    print(f"{name:<32} {perf_counter() - start:>8.2f}s")
+    return result
+
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    with tempfile.TemporaryDirectory() as directory:
+        config = {
+            "DATABASE_URL": f"sqlite:///{os.path.join(directory, 'bench.db')}",
+            "DATABASE_ENGINE_OPTIONS": AppConfig.DATABASE_ENGINE_OPTIONS,
+            "SQLITE_BUSY_TIMEOUT": AppConfig.SQLITE_BUSY_TIMEOUT,
+            "SQLITE_PRAGMAS": AppConfig.SQLITE_PRAGMAS,
+        }
+        engine = create_db_engine(config)
+        Base.metadata.create_all(engine)
+        session.configure(bind=engine)
+        analytics.configure(bind=engine)
+        timed(f"populate {rows} scores", lambda: populate(rows))
+
+        frame = timed("score_frame (all users)", score_frame)
+        timed("aggregate by subject", lambda: aggregate(frame, "subject_id"))
+        timed("aggregate by year, month", lambda: aggregate(frame, "year", "month"))
+        timed("aggregate by quiz", lambda: aggregate(frame, "quiz_id"))
+        timed("aggregate by user", lambda: aggregate(frame, "user_id"))
+        timed("one user end to end", lambda: aggregate(score_frame(1), "subject_id"))
+        if rows <= 200_000 or "--per-row" in sys.argv:
+            timed("per-row ORM loop by subject", per_row)
+        analytics.remove()
+        session.remove()
+        engine.dispose()
@@ -0,0 +1,90 @@
+# concurrent submit throughput against a scratch SQLite file, comparing the
+# previous bare engine with the tuned AppConfig engine
+#
+#   cd backend && python -m benchmarks.submit_throughput [processes] [submits]
+import os
+import sys
+import tempfile
+from time import perf_counter
+from datetime import date
+from multiprocessing import Pool
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import OperationalError
+from api.config import AppConfig
+from api.database import create_db_engine
+from api.models import Base, User, Subject, Chapter, Quiz, Question, Score
+
+
+BASELINE = {
+    "DATABASE_ENGINE_OPTIONS": {},
+    "SQLITE_BUSY_TIMEOUT": 5,
+    "SQLITE_PRAGMAS": {},
+}
+TUNED = {
+    "DATABASE_ENGINE_OPTIONS": AppConfig.DATABASE_ENGINE_OPTIONS,
+    "SQLITE_BUSY_TIMEOUT": AppConfig.SQLITE_BUSY_TIMEOUT,
+    "SQLITE_PRAGMAS": AppConfig.SQLITE_PRAGMAS,
+}
+
+
+def setup(config, processes, submits):
+    engine = create_db_engine(config)
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add_all(User(name=f"user{i}", password="", email=f"user{i}@qm.xyz",
+                             qualification="PhD", dob=date(2000, 1, 1))
+                        for i in range(processes))
+        session.add(Subject(id=1, name="subject"))
+        session.add(Chapter(id=1, name="chapter", subject_id=1))
+        # a score per (user, quiz), so every submit goes to a quiz of its own
+        session.add_all(Quiz(id=quiz_id, name=f"quiz{quiz_id}", subject_id=1, chapter_id=1,
+                             date_of_quiz=date.today(), hours=1, minutes=0)
+                        for quiz_id in range(1, submits + 1))
+        session.add_all(Question(statement=f"q{i}", quiz_id=quiz_id, correct=1)
+                        for quiz_id in range(1, submits + 1) for i in range(20))
+        session.commit()
+    engine.dispose()
+
+
+def submit(args):
+    config, user_id, submits = args
+    engine = create_db_engine(config)
+    ok = failed = 0
+    for quiz_id in range(1, submits + 1):
+        try:
+            # same shape as submit_quiz: read the answer key and the quiz
+            # columns copied into score, insert one score
+            with Session(engine) as session:
+                total = len(session.execute(
+                    select(Question.id, Question.correct).where(Question.quiz_id == quiz_id)).all())
+                date_of_quiz, subject_id = session.execute(
+                    select(Quiz.date_of_quiz, Quiz.subject_id).where(Quiz.id == quiz_id)).one()
+                session.add(Score(user_id=user_id, quiz_id=quiz_id, user_score=0, total_score=total,
+                                  date_of_quiz=date_of_quiz, subject_id=subject_id))
+                session.commit()
+            ok += 1
+        except OperationalError:
+            failed += 1
+    engine.dispose()
+    return ok, failed
+
+
+def run(name, config, processes, submits):
+    with tempfile.TemporaryDirectory() as directory:
+        config = {**config, "DATABASE_URL": f"sqlite:///{os.path.join(directory, 'bench.db')}"}
+        setup(config, processes, submits)
+        start = perf_counter()
+        with Pool(processes) as pool:
+            results = pool.map(submit, [(config, i + 1, submits) for i in range(processes)])
+        elapsed = perf_counter() - start
+    ok = sum(result[0] for result in results)
+    failed = sum(result[1] for result in results)
+    print(f"{name:<10} {ok:>7} ok {failed:>5} locked {elapsed:>8.2f}s {ok / elapsed:>9.1f} submits/s")
+
+
+if __name__ == "__main__":
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    submits = int(sys.argv[2]) if len(sys.argv) > 2 else 250
+    run("baseline", BASELINE, processes, submits)
+    run("tuned", TUNED, processes, submits)
@@ -0,0 +1,90 @@
+# smoke tests against a scratch SQLite database
+#
+#   cd backend && python -m pytest
+import os
+import sys
+import tempfile
+from itertools import count
+import pytest
+
+# app.py builds the app when imported, point it at a scratch directory and
+# database first; relative paths (charts, exports) land there too
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRATCH = tempfile.mkdtemp(prefix="quiz-master-tests-")
+os.environ["QUIZ_MASTER_TESTING"] = "1"
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(SCRATCH, 'quiz-master.db')}"
+os.environ.pop("CACHE_REDIS_URL", None)
+os.environ.pop("GRADING_QUEUE", None)
+sys.path.insert(0, BACKEND)
+os.chdir(SCRATCH)
+os.makedirs(os.path.join("static", "images"), exist_ok=True)
+
+users = count(1)
+
+
+@pytest.fixture(scope="session")
+def app():
+    from app import app
+
+    return app
+
+
+@pytest.fixture(scope="session")
+def admin(app):
+    client = app.test_client()
+    assert client.post('/api/login', json={'email': 'admin@qm.xyz', 'password': 'admin'}).status_code == 200
+    return client
+
+
+@pytest.fixture
+def make_user(app):
+    # a new user for every call, so tests never see each other's scores
+    def make_user():
+        client = app.test_client()
+        email = f"user{next(users)}@qm.xyz"
+        client.post('/api/register', json={'name': email, 'email': email, 'password': 'secret',
+                                           'qualification': 'PhD', 'dob': '2000-01-01'})
+        assert client.post('/api/login', json={'email': email, 'password': 'secret'}).status_code == 200
+        return client
+    return make_user
+
+
+@pytest.fixture
+def user(make_user):
+    return make_user()
+
+
+@pytest.fixture(scope="session")
+def subject(admin):
+    response = admin.post('/api/subjects', json={
+        'name': 'Physics', 'description': 'mechanics',
+        'chapters': [{'name': 'Kinematics', 'description': 'motion'}]})
+    assert response.status_code == 201
+    subject = admin.get('/api/subjects').json['subjects'][0]
+    return subject['id'], subject['chapters'][0]['id']
+
+
+@pytest.fixture
+def make_quiz(admin, subject):
+    def make_quiz(hours=0, minutes=0, day='2025-01-02', questions=3):
+        response = admin.post('/api/quizzes/import', json=[{
+            'name': 'quiz', 'remarks': '', 'subject': subject[0], 'chapter': subject[1],
+            'date_of_quiz': day, 'hh': hours, 'mm': minutes,
+            'questions': [
+                {'statement': f'q{i}', 'answer': 1,
+                 'options': [{'statement': 'wrong'}, {'statement': 'right'}]}
+                for i in range(questions)],
+        }])
+        assert response.status_code == 201
+        return response.json['quizzes'][0]
+    return make_quiz
+
+
+@pytest.fixture
+def answers(admin):
+    # the first `right` questions answered correctly, the rest wrongly
+    def answers(quiz_id, right):
+        questions = admin.get(f'/api/quizzes/{quiz_id}').json['quiz']['questions']
+        return {str(question['id']): question['options'][1 if index < right else 0]['id']
+                for index, question in enumerate(questions)}
+    return answers
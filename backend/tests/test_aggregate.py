@@ -0,0 +1,38 @@
+import numpy as np
+from pytest import approx
+from api.statistics import aggregate
+
+
+def frame(*rows):
+    columns = ("subject_id", "year", "month", "user_score", "total_score")
+    return {name: np.array([row[index] for row in rows], dtype=np.int64)
+            for index, name in enumerate(columns)}
+
+
+def test_aggregate_groups_like_a_loop():
+    rows = [(1, 2025, 1, 3, 4), (1, 2025, 2, 1, 4), (2, 2025, 1, 0, 0),
+            (1, 2025, 1, 4, 4), (1, 2024, 12, 2, 4), (1, 2025, 1, 1, 4)]
+    result = aggregate(frame(*rows), "subject_id")
+    assert [group["subject_id"] for group in result] == [1, 2]
+
+    ratios = [user / total for subject, _, _, user, total in rows if subject == 1]
+    first = result[0]
+    assert first["attempts"] == 5
+    assert (first["user_score"], first["total_score"]) == (11, 20)
+    assert first["average"] == approx(np.mean(ratios))
+    assert first["max"] == 1.0
+    assert first["p50"] == approx(np.percentile(ratios, 50))
+    assert first["p90"] == approx(np.percentile(ratios, 90))
+    # a quiz without points counts as a zero ratio
+    assert result[1]["average"] == 0.0
+
+
+def test_aggregate_by_several_columns():
+    rows = [(1, 2025, 1, 1, 2), (1, 2024, 12, 2, 2), (1, 2025, 1, 2, 2)]
+    result = aggregate(frame(*rows), "year", "month")
+    assert [(group["year"], group["month"], group["attempts"]) for group in result] == [
+        (2024, 12, 1), (2025, 1, 2)]
+
+
+def test_aggregate_of_nothing():
+    assert aggregate(frame(), "subject_id") == []
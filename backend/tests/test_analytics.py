@@ -0,0 +1,41 @@
+import pytest
+from sqlalchemy import select, func, text
+from sqlalchemy.exc import OperationalError
+from api.analytics import analytics, create_analytics_engine, refresh_snapshot
+from api.models import Score
+
+
+def score_count(connection):
+    return connection.execute(select(func.count(Score.id))).scalar()
+
+
+def test_analytics_reads_committed_scores_and_cannot_write(user, make_quiz, answers):
+    before = score_count(analytics)
+    analytics.close()
+    quiz_id = make_quiz()
+    user.post(f'/api/quiz/{quiz_id}/submit', json={'selected': answers(quiz_id, 1)})
+    assert score_count(analytics) == before + 1
+    with pytest.raises(OperationalError):
+        analytics.execute(text("DELETE FROM score"))
+    analytics.rollback()
+    analytics.close()
+
+
+def test_snapshot_lags_until_refreshed(app, tmp_path, user, make_quiz, answers):
+    path = str(tmp_path / 'snapshot.db')
+    refresh_snapshot(path)
+    engine = create_analytics_engine({**app.config, 'ANALYTICS_SNAPSHOT': path})
+    with engine.connect() as connection:
+        copied = score_count(connection)
+    quiz_id = make_quiz()
+    user.post(f'/api/quiz/{quiz_id}/submit', json={'selected': answers(quiz_id, 1)})
+    with engine.connect() as connection:
+        assert score_count(connection) == copied
+    refresh_snapshot(path)
+    with engine.connect() as connection:
+        assert score_count(connection) == copied + 1
+    engine.dispose()
+
+
+def test_stats_responses_report_their_staleness(user):
+    assert user.get('/api/user/stats/data').headers['X-Data-Staleness'] == '0'
@@ -0,0 +1,27 @@
+from flask import Flask
+from api import config, resources
+
+
+def test_testing_config(app):
+    assert app.testing
+    assert app.config["PASSWORD_HASH_WORKERS"] == 0
+    assert app.config["CELERY"]["task_always_eager"]
+
+
+def test_caches_follow_the_app_config(app):
+    class Config(config.TestingConfig):
+        IDENTITY_CACHE_TTL = 5
+
+    other = Flask(__name__)
+    other.config.from_object(Config)
+    resources.init_identities(other)
+    # each app reads its own cache, whichever was built last
+    with other.app_context():
+        assert resources.identities().ttl == 5
+    with app.app_context():
+        assert resources.identities().ttl == config.TestingConfig.IDENTITY_CACHE_TTL
+
+
+def test_unknown_route(app):
+    response = app.test_client().get('/api/nothing-here')
+    assert response.status_code == 404
@@ -0,0 +1,50 @@
+from sqlalchemy import select, func
+from api.database import session
+from api.models import (
+    Subject, Chapter, Quiz, Question, Option, Score, Attempt, quiz_archive, score_archive)
+
+
+def count(column, *where):
+    session.expire_all()
+    return session.execute(select(func.count()).select_from(column.table).where(*where)).scalar()
+
+
+def test_deleting_a_subject_removes_everything_under_it(admin, user, answers):
+    response = admin.post('/api/subjects', json={
+        'name': 'Chemistry', 'description': '', 'chapters': [{'name': 'Acids', 'description': ''}]})
+    assert response.status_code == 201
+    subject = [entry for entry in admin.get('/api/subjects').json['subjects'] if entry['name'] == 'Chemistry'][0]
+    response = admin.post('/api/quizzes/import', json=[{
+        'name': 'acids', 'remarks': '', 'subject': subject['id'], 'chapter': subject['chapters'][0]['id'],
+        'date_of_quiz': '2025-01-02', 'hh': 0, 'mm': 10,
+        'questions': [{'statement': 'pH of water?', 'answer': 0,
+                       'options': [{'statement': '7'}, {'statement': '1'}]}]}])
+    quiz_id = response.json['quizzes'][0]
+    attempt = user.post(f'/api/quiz/{quiz_id}/attempt').json['attempt']
+    user.post(f"/api/attempts/{attempt['id']}/finish", json={'selected': answers(quiz_id, 1)})
+    question_ids = session.execute(select(Question.id).where(Question.quiz_id == quiz_id)).scalars().all()
+
+    assert admin.delete(f"/api/subjects/{subject['id']}").status_code == 200
+    assert count(Subject.id, Subject.id == subject['id']) == 0
+    assert count(Chapter.id, Chapter.subject_id == subject['id']) == 0
+    assert count(Quiz.id, Quiz.id == quiz_id) == 0
+    assert count(Question.id, Question.quiz_id == quiz_id) == 0
+    assert count(Option.id, Option.question_id.in_(question_ids)) == 0
+    assert count(Score.id, Score.quiz_id == quiz_id) == 0
+    assert count(Attempt.id, Attempt.quiz_id == quiz_id) == 0
+
+
+def test_archived_quizzes_move_with_their_scores(admin, user, make_quiz, answers):
+    old, recent = make_quiz(day='2001-06-01'), make_quiz(day='2025-06-01')
+    for quiz_id in (old, recent):
+        user.post(f'/api/quiz/{quiz_id}/submit', json={'selected': answers(quiz_id, 2)})
+
+    response = admin.post('/api/admin/archive', query_string={'before': '2002-01-01'})
+    assert response.status_code == 202
+    assert count(Quiz.id, Quiz.id == old) == 0
+    assert count(Score.id, Score.quiz_id == old) == 0
+    assert count(quiz_archive.c.id, quiz_archive.c.id == old) == 1
+    assert session.execute(select(score_archive.c.user_score).where(
+        score_archive.c.quiz_id == old)).scalar() == 2
+    assert count(Quiz.id, Quiz.id == recent) == 1
+    assert admin.post('/api/admin/archive', query_string={'before': 'soon'}).status_code == 400
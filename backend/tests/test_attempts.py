@@ -0,0 +1,61 @@
+import json
+from datetime import timedelta
+from sqlalchemy import select
+from api.database import session
+from api.models import Attempt, Score
+from api.attempts import utcnow
+
+
+def expire(attempt_id, app):
+    # move the deadline past the grace period
+    attempt = session.get(Attempt, attempt_id)
+    attempt.deadline = utcnow() - timedelta(seconds=app.config["ATTEMPT_GRACE_SECONDS"] + 60)
+    session.commit()
+
+
+def test_timed_quiz_needs_an_attempt(user, make_quiz, answers):
+    quiz_id = make_quiz(hours=1)
+    response = user.post(f'/api/quiz/{quiz_id}/submit', json={'selected': answers(quiz_id, 3)})
+    assert response.json['code'] == 409
+    assert session.execute(select(Score).where(Score.quiz_id == quiz_id)).first() is None
+
+
+def test_attempt_in_time(user, make_quiz, answers):
+    quiz_id = make_quiz(minutes=10)
+    attempt = user.post(f'/api/quiz/{quiz_id}/attempt').json['attempt']
+    assert 0 < attempt['remaining'] <= 600
+    response = user.post(f"/api/attempts/{attempt['id']}/finish", json={'selected': answers(quiz_id, 3)})
+    assert response.json['score'] == 3
+
+
+def test_late_answers_are_ignored(app, user, make_quiz, answers):
+    quiz_id = make_quiz(minutes=10)
+    attempt = user.post(f'/api/quiz/{quiz_id}/attempt').json['attempt']
+    response = user.put(f"/api/attempts/{attempt['id']}/answers", json={'selected': answers(quiz_id, 1)})
+    assert response.status_code == 202
+    expire(attempt['id'], app)
+
+    response = user.put(f"/api/attempts/{attempt['id']}/answers", json={'selected': answers(quiz_id, 2)})
+    assert response.status_code == 409
+    # graded with the last answers saved before the deadline
+    response = user.post(f'/api/quiz/{quiz_id}/submit', json={'selected': answers(quiz_id, 3)})
+    assert response.json['code'] == 201
+    score = session.execute(select(Score).where(Score.quiz_id == quiz_id)).scalar_one()
+    assert score.user_score == 1
+
+
+def test_finished_attempt_is_closed(user, make_quiz, answers):
+    quiz_id = make_quiz(minutes=10)
+    attempt = user.post(f'/api/quiz/{quiz_id}/attempt').json['attempt']
+    user.post(f"/api/attempts/{attempt['id']}/finish", json={'selected': answers(quiz_id, 2)})
+    response = user.post(f"/api/attempts/{attempt['id']}/finish", json={'selected': answers(quiz_id, 3)})
+    assert response.status_code == 409
+
+
+def test_autosaves_reach_the_database_at_once(user, make_quiz, answers):
+    # without redis no other worker could see a save held in this process
+    quiz_id = make_quiz(minutes=10)
+    attempt = user.post(f'/api/quiz/{quiz_id}/attempt').json['attempt']
+    user.put(f"/api/attempts/{attempt['id']}/answers", json={'selected': answers(quiz_id, 2)})
+    session.expire_all()
+    assert json.loads(session.get(Attempt, attempt['id']).answers) == answers(quiz_id, 2)
@@ -0,0 +1,32 @@
+import pytest
+from werkzeug.security import generate_password_hash
+from api.auth import PasswordHasher, Overloaded, hasher
+
+
+def test_refresh_token_renews_the_access_token(user):
+    assert user.post('/api/token/refresh').status_code == 200
+    user.delete_cookie('access_token_cookie')
+    assert user.get('/api/users/me').status_code == 401
+    assert user.post('/api/token/refresh').status_code == 200
+    assert user.get('/api/users/me').status_code == 200
+
+    user.delete_cookie('refresh_token_cookie', path='/api/token/refresh')
+    assert user.post('/api/token/refresh').status_code == 401
+
+
+def test_hashing_pool_starts_with_the_first_hash():
+    password_hasher = PasswordHasher(workers=1)
+    assert password_hasher.pool is None
+    assert password_hasher.check(generate_password_hash('secret', 'pbkdf2:sha256:1000'), 'secret')
+    assert password_hasher.pool is not None
+    password_hasher.pool.shutdown()
+
+
+def test_logins_past_the_queue_limit_are_turned_away(app, monkeypatch):
+    monkeypatch.setattr(hasher(), 'max_pending', 1)
+    monkeypatch.setattr(hasher(), 'pending', 1)
+    with pytest.raises(Overloaded):
+        hasher().check('', '')
+    response = app.test_client().post('/api/login', json={'email': 'admin@qm.xyz', 'password': 'admin'})
+    assert response.status_code == 503
+    assert response.headers['Retry-After']
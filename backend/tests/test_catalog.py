@@ -0,0 +1,35 @@
+def test_quiz_catalog_pages(user, make_quiz):
+    for _ in range(3):
+        make_quiz()
+    pages, params = [], {}
+    while params is not None:
+        page = user.get('/api/quizzes', query_string={'limit': 2, **params}).json
+        pages.append(page)
+        params = {'after_id': page['next_after_id']} if page['next_after_id'] is not None else None
+    assert all(len(page['quizzes']) <= 2 for page in pages)
+    ids = [quiz['quiz_id'] for page in pages for quiz in page['quizzes']]
+    assert ids == sorted(set(ids))
+    assert len(ids) >= 3
+
+
+def test_catalog_cache_follows_the_catalog_version(admin, user, make_quiz, answers):
+    response = user.get('/api/quizzes')
+    etag = response.headers['ETag']
+    assert user.get('/api/quizzes', headers={'If-None-Match': etag}).status_code == 304
+
+    quiz_id = make_quiz()
+    response = user.get('/api/quizzes', query_string={'limit': 100}, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert quiz_id in [quiz['quiz_id'] for quiz in response.json['quizzes']]
+
+    # the shared page is reused, the user's own attempts still change it
+    etag = response.headers['ETag']
+    user.post(f'/api/quiz/{quiz_id}/submit', json={'selected': answers(quiz_id, 1)})
+    response = user.get('/api/quizzes', query_string={'limit': 100}, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert quiz_id in response.json['done']
+
+    etag = response.headers['ETag']
+    assert admin.delete(f'/api/quizzes/{quiz_id}').status_code == 200
+    response = user.get('/api/quizzes', query_string={'limit': 100}, headers={'If-None-Match': etag})
+    assert quiz_id not in [quiz['quiz_id'] for quiz in response.json['quizzes']]
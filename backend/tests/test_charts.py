@@ -0,0 +1,29 @@
+import os
+from api.charts import chart_filename, render_chart
+
+
+def spec(value):
+    return {"kind": "bar", "labels": ["a", "b"], "values": [value, 1], "ylabel": "score"}
+
+
+def test_charts_are_named_by_content(app, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, "CHART_DIRECTORY", str(tmp_path))
+    filename = render_chart(spec(1))
+    assert filename == chart_filename(spec(1)) != chart_filename(spec(2))
+    modified = os.stat(tmp_path / filename).st_mtime_ns
+    os.utime(tmp_path / filename, ns=(modified - 10**9, modified - 10**9))
+    # a hit only bumps the mtime, the file is not drawn again
+    assert render_chart(spec(1)) == filename
+    assert os.stat(tmp_path / filename).st_mtime_ns >= modified
+    assert os.listdir(tmp_path) == [filename]
+
+
+def test_least_recently_used_charts_are_evicted(app, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, "CHART_DIRECTORY", str(tmp_path))
+    monkeypatch.setitem(app.config, "CHART_CACHE_MAX_FILES", 2)
+    first, second = render_chart(spec(1)), render_chart(spec(2))
+    os.utime(tmp_path / first, (1, 1))
+    os.utime(tmp_path / second, (2, 2))
+    render_chart(spec(1))
+    third = render_chart(spec(3))
+    assert sorted(os.listdir(tmp_path)) == sorted([first, third])
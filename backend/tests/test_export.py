@@ -0,0 +1,40 @@
+import csv
+import gzip
+import io
+import json
+
+
+def submitted_quiz(make_quiz, answers, *clients):
+    quiz_id = make_quiz()
+    for right, client in enumerate(clients, start=1):
+        client.post(f'/api/quiz/{quiz_id}/submit', json={'selected': answers(quiz_id, right)})
+    return quiz_id
+
+
+def test_streamed_exports(admin, user, make_user, make_quiz, answers):
+    quiz_id = submitted_quiz(make_quiz, answers, user, make_user())
+    response = admin.get('/api/admin/export/scores', query_string={'quiz_id': quiz_id})
+    assert response.mimetype == 'text/csv'
+    assert 'attachment' in response.headers['Content-Disposition']
+    header, *rows = csv.reader(io.StringIO(response.get_data(as_text=True)))
+    assert [row[header.index('user_score')] for row in rows] == ['1', '2']
+
+    response = admin.get('/api/admin/export/scores',
+                         query_string={'quiz_id': quiz_id, 'format': 'ndjson', 'gzip': '1'})
+    lines = gzip.decompress(response.get_data()).decode().splitlines()
+    assert [json.loads(line)['user_score'] for line in lines] == [1, 2]
+
+
+def test_export_options_are_checked(admin, user):
+    assert admin.get('/api/admin/export/scores', query_string={'format': 'xml'}).status_code == 400
+    assert admin.get('/api/admin/export/scores', query_string={'from': 'soon'}).status_code == 400
+    assert user.get('/api/admin/export/scores').status_code == 403
+
+
+def test_queued_export(admin, user, make_quiz, answers):
+    quiz_id = submitted_quiz(make_quiz, answers, user)
+    response = admin.post('/api/admin/export/scores', query_string={'quiz_id': quiz_id})
+    assert response.status_code == 202
+    response = admin.get(f"/api/admin/export/{response.json['job_id']}")
+    assert response.status_code == 200
+    assert len(response.get_data(as_text=True).splitlines()) == 2
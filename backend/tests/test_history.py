@@ -0,0 +1,48 @@
+from sqlalchemy import select
+from api.database import session
+from api.models import Score
+
+
+def pages(client, url, cursor):
+    # follow the keyset cursor until the last page, returns every page
+    pages, params = [], {}
+    while True:
+        page = client.get(url, query_string={'limit': 2, **params}).json
+        pages.append(page)
+        if (params := cursor(page)) is None:
+            return pages
+
+
+def test_score_history(user, make_quiz, answers):
+    # two quizzes share a date, so the id breaks the tie
+    quizzes = []
+    for day in ('2025-03-01', '2025-01-15', '2025-03-01', '2024-12-31', '2025-02-10'):
+        quiz_id = make_quiz(day=day)
+        user.post(f'/api/quiz/{quiz_id}/submit', json={'selected': answers(quiz_id, 1)})
+        quizzes.append((day, quiz_id))
+
+    result = pages(user, '/api/scores', lambda page: page['next'])
+    assert [len(page['scores']) for page in result] == [2, 2, 1]
+    # newest quiz date first, later submissions first on the same date
+    assert [score['quiz_id'] for page in result for score in page['scores']] == [
+        quiz_id for _, quiz_id in sorted(quizzes, reverse=True)]
+
+
+def test_score_history_filters(user, make_quiz, answers):
+    for day in ('2025-01-01', '2025-06-01'):
+        quiz_id = make_quiz(day=day)
+        user.post(f'/api/quiz/{quiz_id}/submit', json={'selected': answers(quiz_id, 1)})
+    scores = user.get('/api/scores', query_string={'from': '2025-03-01'}).json['scores']
+    assert len(scores) == 1
+    assert user.get('/api/scores', query_string={'from': 'soon'}).status_code == 400
+
+
+def test_scores_copy_their_quiz_columns(user, subject, make_quiz, answers):
+    direct, timed = make_quiz(day='2025-04-01'), make_quiz(minutes=10, day='2025-04-02')
+    user.post(f'/api/quiz/{direct}/submit', json={'selected': answers(direct, 1)})
+    attempt = user.post(f'/api/quiz/{timed}/attempt').json['attempt']
+    user.post(f"/api/attempts/{attempt['id']}/finish", json={'selected': answers(timed, 1)})
+    scores = session.execute(select(Score.date_of_quiz, Score.subject_id).where(
+        Score.quiz_id.in_([direct, timed])).order_by(Score.quiz_id)).all()
+    assert [(day.isoformat(), subject_id) for day, subject_id in scores] == [
+        ('2025-04-01', subject[0]), ('2025-04-02', subject[0])]
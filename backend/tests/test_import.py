@@ -0,0 +1,50 @@
+from sqlalchemy import select, func
+from api.database import session
+from api.models import Quiz, Question, Option
+
+
+def quizzes_named(name):
+    session.expire_all()
+    return session.execute(select(func.count(Quiz.id)).where(Quiz.name == name)).scalar()
+
+
+def csv_rows(subject, name, *rows):
+    return "\n".join(
+        f"{name},,{subject[0]},{subject[1]},2025-01-02,0,10,{statement},{answer},no,yes"
+        for statement, answer in rows)
+
+
+def test_csv_import(admin, subject):
+    body = "name,remarks,subject,chapter,date_of_quiz,hh,mm,question,answer,options\n" + "\n".join((
+        csv_rows(subject, 'csv one', ('q1', 1), ('q2', 0)),
+        csv_rows(subject, 'csv two', ('q1', 1))))
+    response = admin.post('/api/quizzes/import', data=body, content_type='text/csv')
+    assert response.status_code == 201
+    first, second = response.json['quizzes']
+    questions = session.execute(select(Question).where(Question.quiz_id == first)).scalars().all()
+    assert len(questions) == 2
+    # answers are option indexes in the file and option ids once stored
+    assert [session.get(Option, question.correct).statement for question in questions] == ['yes', 'no']
+    assert quizzes_named('csv two') == 1
+
+
+def test_invalid_import_adds_nothing(admin, subject):
+    body = "\n".join((csv_rows(subject, 'rolled back', ('q1', 1)),
+                      csv_rows(subject, 'rolled back too', ('q1', 5))))
+    response = admin.post('/api/quizzes/import', data=body, content_type='text/csv')
+    assert response.status_code == 400
+    assert quizzes_named('rolled back') == quizzes_named('rolled back too') == 0
+
+    response = admin.post('/api/quizzes/import', json={'quizzes': [
+        {'name': 'json rolled back', 'remarks': '', 'subject': subject[0], 'chapter': subject[1],
+         'date_of_quiz': '2025-01-02', 'hh': 0, 'mm': 10, 'questions': []},
+        {'name': 'json rolled back', 'subject': subject[0], 'chapter': subject[1],
+         'date_of_quiz': 'someday', 'hh': 0, 'mm': 10, 'questions': []},
+    ]})
+    assert response.status_code == 400
+    assert quizzes_named('json rolled back') == 0
+
+
+def test_import_needs_admin(user, subject):
+    response = user.post('/api/quizzes/import', json=[])
+    assert response.status_code == 403
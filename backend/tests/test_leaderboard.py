@@ -0,0 +1,32 @@
+from api.leaderboard import Board, leaderboards
+
+
+def test_board_orders_by_points_then_user():
+    board = Board()
+    board.load({1: 5, 2: 7})
+    board.add(3, 5)
+    board.add(1, 4)
+    assert board.top(10) == [(1, 9), (2, 7), (3, 5)]
+    assert [board.rank(user) for user in (1, 2, 3, 4)] == [1, 2, 3, None]
+    board.add(3, 2)
+    # ties go to the lower user id
+    assert board.top(2) == [(1, 9), (2, 7)]
+    assert board.rank(3) == 3 and len(board) == 3
+
+
+def test_quiz_leaderboard(app, admin, user, make_user, make_quiz, answers, monkeypatch):
+    monkeypatch.setattr(leaderboards(), 'interval', 0)
+    quiz_id = make_quiz()
+    other = make_user()
+    user.post(f'/api/quiz/{quiz_id}/submit', json={'selected': answers(quiz_id, 1)})
+    other.post(f'/api/quiz/{quiz_id}/submit', json={'selected': answers(quiz_id, 3)})
+
+    board = user.get(f'/api/leaderboard/quiz/{quiz_id}').json
+    assert board['size'] == 2
+    assert [entry['points'] for entry in board['top']] == [3, 1]
+    assert board['me'] == {'rank': 2, 'points': 1}
+
+    # deleting scores rebuilds the boards without them
+    assert admin.delete(f'/api/quizzes/{quiz_id}').status_code == 200
+    board = user.get(f'/api/leaderboard/quiz/{quiz_id}').json
+    assert board['size'] == 0 and board['me'] is None
@@ -0,0 +1,10 @@
+def test_metrics_need_admin(user):
+    assert user.get('/api/admin/metrics').status_code == 403
+
+
+def test_metrics_cover_requests_and_caches(admin):
+    admin.get('/api/subjects')
+    text = admin.get('/api/admin/metrics').get_data(as_text=True)
+    assert 'http_request_duration_seconds_count{endpoint="/api/subjects",method="GET"}' in text
+    # built when the blueprint was registered, after init_metrics
+    assert 'cache_hits{cache="stats_jobs"}' in text
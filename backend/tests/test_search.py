@@ -0,0 +1,32 @@
+def import_quiz(admin, subject, name, statement):
+    response = admin.post('/api/quizzes/import', json=[{
+        'name': name, 'remarks': 'searchable', 'subject': subject[0], 'chapter': subject[1],
+        'date_of_quiz': '2025-01-02', 'hh': 0, 'mm': 10,
+        'questions': [{'statement': statement, 'answer': 0,
+                       'options': [{'statement': 'yes'}, {'statement': 'no'}]}],
+    }])
+    return response.json['quizzes'][0]
+
+
+def search(client, **params):
+    return client.get('/api/search', query_string=params).json['results']
+
+
+def test_search_finds_quizzes_and_questions(admin, user, subject):
+    quiz_id = import_quiz(admin, subject, 'Thermodynamics basics', 'What does entropy measure?')
+    assert [(result['kind'], result['id']) for result in search(user, q='thermodyn', kind='quiz')] == [
+        ('quiz', quiz_id)]
+    [question] = search(user, q='entropy')
+    assert question['kind'] == 'question' and '[entropy]' in question['snippet']
+    assert search(user, q='physics', kind='subject')[0]['id'] == subject[0]
+    # punctuation is not query syntax
+    assert search(user, q='"entropy') == search(user, q='entropy')
+    assert user.get('/api/search', query_string={'q': 'x', 'kind': 'user'}).status_code == 400
+
+
+def test_deleted_quizzes_leave_the_index(admin, user, subject):
+    quiz_id = import_quiz(admin, subject, 'Optics revision', 'Why is the sky refracting?')
+    assert search(user, q='refracting')
+    assert admin.delete(f'/api/quizzes/{quiz_id}').status_code == 200
+    assert search(user, q='refracting') == []
+    assert search(user, q='optics', kind='quiz') == []
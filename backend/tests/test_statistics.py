@@ -0,0 +1,49 @@
+import os
+from api.database import session
+from api.models import SubjectMonthStat
+from api.statistics import refresh_subject_stats
+from api.tasks import refresh_statistics
+
+
+def month_stat(subject_id, year, month):
+    session.expire_all()
+    stat = session.get(SubjectMonthStat, (subject_id, year, month))
+    return stat and (stat.attempts, stat.user_score, stat.total_score)
+
+
+def test_new_scores_are_folded_into_the_aggregates(user, make_user, subject, make_quiz, answers):
+    refresh_subject_stats()
+    quiz_id = make_quiz(day='2030-01-10')
+    user.post(f'/api/quiz/{quiz_id}/submit', json={'selected': answers(quiz_id, 2)})
+    make_user().post(f'/api/quiz/{quiz_id}/submit', json={'selected': answers(quiz_id, 3)})
+    assert refresh_subject_stats() == 2
+    assert month_stat(subject[0], 2030, 1) == (2, 5, 6)
+    assert refresh_subject_stats() == 0
+
+
+def test_scores_after_a_delete_are_not_skipped(admin, user, subject, make_quiz, answers):
+    # the deleted score held the highest id; a reused id would sit below the
+    # watermark and never be folded
+    quiz_id = make_quiz(day='2030-02-10')
+    user.post(f'/api/quiz/{quiz_id}/submit', json={'selected': answers(quiz_id, 1)})
+    refresh_subject_stats()
+    assert admin.delete(f'/api/quizzes/{quiz_id}').status_code == 200
+    assert month_stat(subject[0], 2030, 2) is None
+
+    quiz_id = make_quiz(day='2030-02-11')
+    user.post(f'/api/quiz/{quiz_id}/submit', json={'selected': answers(quiz_id, 3)})
+    assert refresh_subject_stats() == 1
+    assert month_stat(subject[0], 2030, 2) == (1, 3, 3)
+
+
+def test_admin_stats_names_only_rendered_charts(app, admin, subject, make_quiz, user, answers):
+    quiz_id = make_quiz(day='2030-03-10')
+    user.post(f'/api/quiz/{quiz_id}/submit', json={'selected': answers(quiz_id, 1)})
+    refresh_subject_stats()
+    stats = admin.get('/api/admin/stats').json
+    assert stats['by_subject'] is None and stats['by_month'] is None
+
+    refresh_statistics()
+    stats = admin.get('/api/admin/stats').json
+    for filename in (stats['by_subject'], stats['by_month']):
+        assert os.path.exists(os.path.join(app.config['CHART_DIRECTORY'], filename))
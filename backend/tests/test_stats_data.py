@@ -0,0 +1,28 @@
+def test_stats_data_needs_admin(user):
+    assert user.get('/api/admin/stats').status_code == 403
+    assert user.get('/api/admin/stats/data').status_code == 403
+
+
+def test_unchanged_stats_data_is_not_modified(admin, user, make_quiz, answers):
+    quiz_id = make_quiz()
+    user.post(f'/api/quiz/{quiz_id}/submit', json={'selected': answers(quiz_id, 1)})
+    for client, url in ((admin, '/api/admin/stats/data'), (user, '/api/user/stats/data')):
+        response = client.get(url)
+        assert response.status_code == 200 and response.headers['ETag']
+        response = client.get(url, headers={'If-None-Match': response.headers['ETag']})
+        assert response.status_code == 304
+
+
+def test_stats_data_changes_with_submits_and_deletes(admin, user, make_quiz, answers):
+    quiz_id = make_quiz()
+    etag = admin.get('/api/admin/stats/data').headers['ETag']
+    user.post(f'/api/quiz/{quiz_id}/submit', json={'selected': answers(quiz_id, 1)})
+    response = admin.get('/api/admin/stats/data', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert quiz_id in [quiz['quiz_id'] for quiz in response.json['by_quiz']]
+
+    etag = response.headers['ETag']
+    assert admin.delete(f'/api/quizzes/{quiz_id}').status_code == 200
+    response = admin.get('/api/admin/stats/data', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert quiz_id not in [quiz['quiz_id'] for quiz in response.json['by_quiz']]
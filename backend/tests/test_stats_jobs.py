@@ -0,0 +1,53 @@
+from celery.exceptions import TimeoutError
+from api import routes
+
+
+class Pending:
+    # a job the worker has not finished, records how long it was waited for
+    waited = None
+
+    def ready(self):
+        return False
+
+    def get(self, timeout, propagate):
+        self.waited = timeout
+        raise TimeoutError()
+
+
+def test_stats_job_is_polled_then_served_from_the_cache(user, make_quiz, answers):
+    quiz_id = make_quiz()
+    user.post(f'/api/quiz/{quiz_id}/submit', json={'selected': answers(quiz_id, 2)})
+    response = user.post('/api/user/stats')
+    assert response.status_code == 202
+    job_id = response.json['job_id']
+
+    done = user.get(f'/api/user/stats/{job_id}')
+    assert done.status_code == 200
+    assert done.json['status'] == 'done'
+    assert done.json['by_subject'] and done.json['by_month']
+    # unchanged scores are answered without a new job
+    response = user.post('/api/user/stats')
+    assert response.status_code == 200
+    assert response.json['by_subject'] == done.json['by_subject']
+
+
+def test_stats_job_belongs_to_its_user(user, make_user):
+    job_id = user.post('/api/user/stats').json['job_id']
+    assert make_user().get(f'/api/user/stats/{job_id}').status_code == 404
+    assert user.get('/api/user/stats/unknown').status_code == 404
+
+
+def test_pending_stats_job_waits_at_most_the_configured_time(app, user, monkeypatch):
+    job_id = user.post('/api/user/stats').json['job_id']
+    pending = Pending()
+    monkeypatch.setattr(routes, 'job_result', lambda job_id: pending)
+    monkeypatch.setitem(app.config, 'STATS_JOB_MAX_WAIT', 0.01)
+
+    response = user.get(f'/api/user/stats/{job_id}?timeout=60')
+    assert response.status_code == 202
+    assert response.json == {'status': 'pending', 'job_id': job_id}
+    assert pending.waited == 0.01
+    # without a timeout the poll returns at once
+    pending.waited = None
+    assert user.get(f'/api/user/stats/{job_id}').status_code == 202
+    assert pending.waited is None
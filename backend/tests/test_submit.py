@@ -0,0 +1,69 @@
+import pytest
+from sqlalchemy import select
+from app import create_app
+from api import config
+from api.database import session
+from api.models import Score
+from api.grading import enqueue_submission, grade_pending, submission_status
+
+
+def user_id(client):
+    return client.get('/api/users/me').json['current_user']['id']
+
+
+def test_submit_grades_the_answers(user, make_quiz, answers):
+    quiz_id = make_quiz()
+    response = user.post(f'/api/quiz/{quiz_id}/submit', json={'selected': answers(quiz_id, 2)})
+    assert response.json['code'] == 201
+    score = session.execute(select(Score).where(Score.quiz_id == quiz_id)).scalar_one()
+    assert (score.user_score, score.total_score) == (2, 3)
+
+
+def test_retry_with_the_same_key_is_idempotent(user, make_quiz, answers):
+    quiz_id = make_quiz()
+    headers = {'Idempotency-Key': 'retry'}
+    for _ in range(2):
+        response = user.post(f'/api/quiz/{quiz_id}/submit', json={'selected': answers(quiz_id, 1)},
+                             headers=headers)
+        assert response.json['code'] == 201
+    assert user.get('/api/submissions/retry').json == {'status': 'graded', 'score': 1, 'total': 3}
+    # a second submission under a new key is a conflict
+    response = user.post(f'/api/quiz/{quiz_id}/submit', json={'selected': answers(quiz_id, 3)},
+                         headers={'Idempotency-Key': 'other'})
+    assert response.json['code'] == 409
+
+
+def test_keys_are_per_user(user, make_user, make_quiz, answers):
+    other = make_user()
+    quiz_id = make_quiz()
+    for client, right in ((user, 1), (other, 2)):
+        response = client.post(f'/api/quiz/{quiz_id}/submit', json={'selected': answers(quiz_id, right)},
+                               headers={'Idempotency-Key': 'shared'})
+        assert response.json['code'] == 201
+    assert user.get('/api/submissions/shared').json['score'] == 1
+    assert other.get('/api/submissions/shared').json['score'] == 2
+
+
+def test_queued_submissions(user, make_quiz, answers):
+    quiz_id = make_quiz()
+    owner = user_id(user)
+    enqueue_submission('first', owner, quiz_id, answers(quiz_id, 3))
+    # the same user and quiz again, the insert skips it
+    enqueue_submission('second', owner, quiz_id, answers(quiz_id, 1))
+    # fails on its own and is set aside without holding back the others
+    enqueue_submission('broken', owner, quiz_id, None)
+    assert submission_status('first', owner) == {'status': 'queued'}
+
+    assert grade_pending(10) == 3
+    assert submission_status('first', owner) == {'status': 'graded', 'score': 3, 'total': 3}
+    assert submission_status('second', owner) == {'status': 'failed'}
+    assert submission_status('broken', owner) == {'status': 'failed'}
+    assert submission_status('first', owner + 1) is None
+
+
+def test_grading_queue_needs_redis():
+    class Config(config.TestingConfig):
+        GRADING_QUEUE = True
+
+    with pytest.raises(RuntimeError):
+        create_app(Config)
@@ -0,0 +1,48 @@
+# celery entry point, the web app (app.py) never imports the task modules
+#
+#   celery -A worker worker --loglevel=info
+#   celery -A worker beat
+from app import app, celery
+from celery.schedules import crontab
+from api.tasks import (
+    compute_monthly_statistics, refresh_statistics, flush_attempt_autosaves, grade_submissions,
+    refresh_analytics_snapshot, archive_old_quizzes)
+
+
+@celery.on_after_finalize.connect
+def setup_periodic_tasks(sender, **kwargs):
+    sender.add_periodic_task(
+        crontab(0, 0, month_of_year='*'),
+        compute_monthly_statistics.s(),
+        name='update monthly statistics',
+    )
+    sender.add_periodic_task(
+        app.config["STATS_REFRESH_INTERVAL"],
+        refresh_statistics.s(),
+        name='refresh statistics',
+    )
+    if app.config["CACHE_REDIS_URL"]:
+        # without redis every web process flushes its own autosaves
+        sender.add_periodic_task(
+            app.config["AUTOSAVE_FLUSH_INTERVAL"],
+            flush_attempt_autosaves.s(),
+            name='flush attempt autosaves',
+        )
+    if app.config["GRADING_QUEUE"]:
+        sender.add_periodic_task(
+            app.config["GRADING_FLUSH_INTERVAL"],
+            grade_submissions.s(),
+            name='grade queued submissions',
+        )
+    if app.config["ANALYTICS_SNAPSHOT"]:
+        sender.add_periodic_task(
+            app.config["ANALYTICS_SNAPSHOT_INTERVAL"],
+            refresh_analytics_snapshot.s(),
+            name='refresh analytics snapshot',
+        )
+    if app.config["ARCHIVE_AFTER_DAYS"]:
+        sender.add_periodic_task(
+            crontab(0, 3),
+            archive_old_quizzes.s(),
+            name='archive old quizzes',
+        )
@@ -1,4 +1,11 @@
 npm run build
 mkdir -p ../backend/static/images
 cp public/favicon.ico ../backend/static/favicon.ico
-sed -i 's/\/assets\//\/static\/assets\//g' ../backend/static/index.html
\ No newline at end of file
+sed -i 's/\/assets\//\/static\/assets\//g' ../backend/static/index.html
+
+# precompress text assets so the server never compresses at request time
+find ../backend/static -type f \( -name '*.html' -o -name '*.js' -o -name '*.css' -o -name '*.svg' -o -name '*.map' -o -name '*.ico' \) \
+  | while read -r file; do
+      gzip -9 -k -f "$file"
+      if command -v brotli > /dev/null; then brotli -q 11 -k -f "$file"; fi
+    done
@@ -2,14 +2,30 @@ import Vuex from 'vuex'
 
 const BACKEND_URL = 'http://127.0.0.1:5000/api'
 
+// access tokens are short lived, renew once with the refresh cookie and retry
+async function request(url, options) {
+  const response = await fetch(url, options)
+  if (response.status !== 401) return response
+  const refreshed = await fetch(`${BACKEND_URL}/token/refresh`, {
+    method: 'POST',
+    credentials: 'include',
+  })
+  return refreshed.ok ? fetch(url, options) : response
+}
+
+const sleep = (seconds) => new Promise((resolve) => setTimeout(resolve, seconds * 1000))
+
 export const store = new Vuex.Store({
   state: {
     currentUser: null,
     authenticated: false,
     activeQuiz: null,
+    quiz: null,
+    attempt: null,
     quizzes: [],
     subjects: [],
     scores: [],
+    scoresNext: null,
     hideNavbar: false,
   },
   actions: {
@@ -23,15 +39,21 @@ export const store = new Vuex.Store({
       })
     },
     async loginUser({ commit }, data) {
-      await fetch(`${BACKEND_URL}/login`, {
-        method: 'POST',
-        credentials: 'include',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify(data),
-      })
-      const { current_user } = await fetch(`${BACKEND_URL}/users/me`, {
+      // the server turns logins away with 503 while it is saturated, retry
+      // after the delay it asks for, spread out so retries do not arrive together
+      for (;;) {
+        const response = await fetch(`${BACKEND_URL}/login`, {
+          method: 'POST',
+          credentials: 'include',
+          headers: {
+            'Content-Type': 'application/json',
+          },
+          body: JSON.stringify(data),
+        })
+        if (response.status !== 503) break
+        await sleep(Number(response.headers.get('Retry-After') || 1) * (1 + Math.random()))
+      }
+      const { current_user } = await request(`${BACKEND_URL}/users/me`, {
         credentials: 'include',
       }).then((response) => response.json())
 
@@ -42,7 +64,7 @@ export const store = new Vuex.Store({
     },
     async fetchSubjects({ commit, state }) {
       if (state.currentUser != null) {
-        const { subjects } = await fetch(`${BACKEND_URL}/subjects`, {
+        const { subjects } = await request(`${BACKEND_URL}/subjects`, {
           credentials: 'include',
         })
           .then((response) => response.json())
@@ -53,39 +75,95 @@ export const store = new Vuex.Store({
         commit('setSubjects', subjects)
       } else console.warn('USER LOGIN REQUIRED')
     },
-    async fetchQuizzes({ commit, state }) {
+    async fetchQuizzes({ commit, state }, filters = {}) {
       if (state.currentUser != null) {
-        const { quizzes } = await fetch(`${BACKEND_URL}/quizzes`, {
-          credentials: 'include',
-        })
-          .then((response) => response.json())
-          .catch((error) => {
-            console.error('[ERROR]:', error)
+        let after_id = null
+        do {
+          const params = new URLSearchParams(filters)
+          if (after_id != null) params.set('after_id', after_id)
+          const page = await request(`${BACKEND_URL}/quizzes?${params}`, {
+            credentials: 'include',
           })
-        commit('setQuizzes', quizzes)
+            .then((response) => response.json())
+            .catch((error) => {
+              console.error('[ERROR]:', error)
+            })
+          if (!page) break
+          // pages are shared between users, attempts come as a separate list
+          const done = new Set(page.done)
+          const quizzes = page.quizzes.map((quiz) => ({ ...quiz, done: done.has(quiz.quiz_id) }))
+          commit(after_id == null ? 'setQuizzes' : 'appendQuizzes', quizzes)
+          after_id = page.next_after_id
+        } while (after_id != null)
       } else console.warn('USER LOGIN REQUIRED')
     },
-    async fetchScores({ commit, state }) {
+    async fetchQuiz({ commit, state }, quiz_id) {
+      if (state.quiz?.quiz_id === quiz_id) return
+      const { quiz } = await request(`${BACKEND_URL}/quizzes/${quiz_id}`, {
+        credentials: 'include',
+      })
+        .then((response) => response.json())
+        .catch((error) => {
+          console.error('[ERROR]:', error)
+        })
+      commit('setQuiz', quiz)
+    },
+    async fetchScores({ commit, state }, { more = false, filters = {} } = {}) {
       if (state.currentUser != null) {
-        const { scores } = await fetch(`${BACKEND_URL}/scores`, {
+        // newest first, `more` appends the page after the last one loaded
+        const params = new URLSearchParams(filters)
+        if (more && state.scoresNext != null) {
+          params.set('before_date', state.scoresNext.before_date)
+          params.set('before_id', state.scoresNext.before_id)
+        }
+        const page = await request(`${BACKEND_URL}/scores?${params}`, {
           credentials: 'include',
         })
           .then((response) => response.json())
           .catch((error) => console.error(error))
-        commit('setScores', scores)
+        if (!page) return
+        commit(more ? 'appendScores' : 'setScores', page.scores)
+        commit('setScoresNext', page.next)
       } else console.warn('[WARN] user login required')
     },
     async fetchUserStats({ commit }) {
-      const stats = await fetch(`${BACKEND_URL}/user/stats`, {
+      let stats = await request(`${BACKEND_URL}/user/stats`, {
+        method: 'POST',
+        credentials: 'include',
+      })
+        .then((response) => response.json())
+        .catch((error) => console.error('[ERROR]', error))
+      // long-poll the stats job until the charts are rendered
+      while (stats?.status === 'pending') {
+        stats = await request(`${BACKEND_URL}/user/stats/${stats.job_id}?timeout=25`, {
+          credentials: 'include',
+        })
+          .then((response) => response.json())
+          .catch((error) => console.error('[ERROR]', error))
+      }
+      commit('setStats', stats)
+    },
+    async fetchUserStatsData({ commit }) {
+      const stats = await request(`${BACKEND_URL}/user/stats/data`, {
         credentials: 'include',
       })
         .then((response) => response.json())
         .catch((error) => console.error('[ERROR]', error))
       commit('setStats', stats)
     },
+    async fetchAdminStatsData({ commit, state }) {
+      if (state.currentUser.isAdmin) {
+        const stats = await request(`${BACKEND_URL}/admin/stats/data`, {
+          credentials: 'include',
+        })
+          .then((response) => response.json())
+          .catch((error) => console.error('[ERROR]', error))
+        commit('setStats', stats)
+      }
+    },
     async fetchAdminStats({ commit, state }) {
       if (state.currentUser.isAdmin) {
-        const stats = await fetch(`${BACKEND_URL}/admin/stats`, {
+        const stats = await request(`${BACKEND_URL}/admin/stats`, {
           credentials: 'include',
         })
           .then((response) => response.json())
@@ -94,7 +172,7 @@ export const store = new Vuex.Store({
       }
     },
     async createSubject({ dispatch }, payload) {
-      await fetch(`${BACKEND_URL}/subjects`, {
+      await request(`${BACKEND_URL}/subjects`, {
         method: 'POST',
         credentials: 'include',
         headers: {
@@ -106,7 +184,7 @@ export const store = new Vuex.Store({
         .catch((error) => console.error('[ERROR]', error))
     },
     async createQuiz({ dispatch }, payload) {
-      await fetch(`${BACKEND_URL}/quizzes`, {
+      await request(`${BACKEND_URL}/quizzes`, {
         method: 'POST',
         credentials: 'include',
         headers: {
@@ -118,7 +196,7 @@ export const store = new Vuex.Store({
         .catch((error) => console.error('[ERROR]', error))
     },
     async deleteQuiz({ dispatch }, quiz_id) {
-      await fetch(`${BACKEND_URL}/quizzes/${quiz_id}`, {
+      await request(`${BACKEND_URL}/quizzes/${quiz_id}`, {
         method: 'DELETE',
         credentials: 'include',
       })
@@ -126,15 +204,46 @@ export const store = new Vuex.Store({
         .catch((error) => console.error(error))
     },
     async deleteSubject({ dispatch }, subject_id) {
-      await fetch(`${BACKEND_URL}/subjects/${subject_id}`, {
+      await request(`${BACKEND_URL}/subjects/${subject_id}`, {
         method: 'DELETE',
         credentials: 'include',
       })
         .then(() => dispatch('fetchSubjects'))
         .catch((error) => console.error('[ERROR]', error))
     },
+    async startAttempt({ commit, state }) {
+      const { attempt } = await request(`${BACKEND_URL}/quiz/${state.activeQuiz}/attempt`, {
+        method: 'POST',
+        credentials: 'include',
+      })
+        .then((response) => response.json())
+        .catch((error) => console.error('[ERROR]:', error))
+      commit('setAttempt', attempt)
+    },
+    async autosaveAttempt({ state }, payload) {
+      await request(`${BACKEND_URL}/attempts/${state.attempt.id}/answers`, {
+        method: 'PUT',
+        credentials: 'include',
+        headers: {
+          'Content-Type': 'application/json',
+        },
+        body: JSON.stringify(payload),
+      }).catch((error) => console.error('[ERROR]:', error))
+    },
+    async finishAttempt({ commit, state }, payload) {
+      await request(`${BACKEND_URL}/attempts/${state.attempt.id}/finish`, {
+        method: 'POST',
+        credentials: 'include',
+        headers: {
+          'Content-Type': 'application/json',
+        },
+        body: JSON.stringify(payload),
+      })
+      commit('setAttempt', null)
+      commit('clearQuiz')
+    },
     async submitQuiz({ commit, state }, payload) {
-      await fetch(`${BACKEND_URL}/quiz/${state.activeQuiz}/submit`, {
+      await request(`${BACKEND_URL}/quiz/${state.activeQuiz}/submit`, {
         method: 'POST',
         credentials: 'include',
         headers: {
@@ -153,6 +262,15 @@ export const store = new Vuex.Store({
     setQuizzes(state, quizzes) {
       state.quizzes = quizzes
     },
+    setAttempt(state, attempt) {
+      state.attempt = attempt
+    },
+    setQuiz(state, quiz) {
+      state.quiz = quiz
+    },
+    appendQuizzes(state, quizzes) {
+      state.quizzes = state.quizzes.concat(quizzes)
+    },
     setSubjects(state, subjects) {
       state.subjects = subjects
     },
@@ -168,6 +286,12 @@ export const store = new Vuex.Store({
     setScores(state, scores) {
       state.scores = scores
     },
+    appendScores(state, scores) {
+      state.scores = state.scores.concat(scores)
+    },
+    setScoresNext(state, next) {
+      state.scoresNext = next
+    },
     setStats(state, stats) {
       state.stats = stats
     },